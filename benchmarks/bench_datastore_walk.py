@@ -0,0 +1,71 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Benchmark walking a large data store.
+
+Run with: python benchmarks/bench_datastore_walk.py [n_nodes]
+
+The walk time per node should stay constant as the size of the tree grows.
+
+"""
+import sys
+import timeit
+
+import enaml
+import numpy as np
+from enaml.workbench.api import Workbench
+
+with enaml.imports():
+    from enaml.workbench.core.core_manifest import CoreManifest
+    from gild.plugins.errors.manifest import ErrorsManifest
+
+    from oculy.data.manifest import DataStorageManifest
+
+
+def build_store(n_nodes: int, fan_out: int = 10):
+    """Build a store containing a balanced tree of about n_nodes entries."""
+    workbench = Workbench()
+    workbench.register(CoreManifest())
+    workbench.register(ErrorsManifest())
+    workbench.register(DataStorageManifest())
+    plugin = workbench.get_plugin("oculy.data")
+    value = np.zeros(1)
+    paths = []
+    i = 0
+    while len(paths) < n_nodes:
+        parts = []
+        j = i
+        while True:
+            parts.append(str(j % fan_out))
+            j //= fan_out
+            if not j:
+                break
+        paths.append("/".join(reversed(parts)) + "/a")
+        i += 1
+    plugin.datastore.store_data({p: (value, None) for p in paths})
+    return plugin.datastore
+
+
+def count_nodes(store) -> int:
+    """Walk the whole store and count the nodes."""
+    n = 0
+    for _, datasets, arrays in store.walk():
+        n += len(datasets) + len(arrays)
+    return n
+
+
+def main(argv):
+    sizes = [int(a) for a in argv] or [1_000, 10_000, 100_000]
+    for size in sizes:
+        store = build_store(size)
+        n = count_nodes(store)
+        t = min(timeit.repeat(lambda: count_nodes(store), number=1, repeat=5))
+        print(f"{n:>8} nodes: {t * 1e3:8.2f} ms, {t / n * 1e9:6.1f} ns/node")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -9,6 +9,18 @@
 
 """
 
-from .datastore import DataArray, Dataset, DataStore
+from .datastore import (
+    AppendableDataArray,
+    DataArray,
+    Dataset,
+    DataStore,
+    LazyDataArray,
+)
 
-__all__ = ["DataArray", "Dataset", "DataStore"]
+__all__ = [
+    "AppendableDataArray",
+    "DataArray",
+    "Dataset",
+    "DataStore",
+    "LazyDataArray",
+]
@@ -5,6 +5,55 @@
 #
 # The full license is in the file LICENCE, distributed with this software.
 # --------------------------------------------------------------------------------------
-"""Central data storage system for Oculy.
+"""Declaration of converters turning arbitrary data into data store elements.
 
 """
+import importlib
+import sys
+from typing import Optional
+
+from atom.api import Callable, Int, List, Str
+from enaml.core.api import Declarative, d_
+
+
+class Converter(Declarative):
+    """Declaration of a converter contributed to "oculy.data.converters".
+
+    The function is called with the data to convert as single argument and
+    should return a Dataset or a DataArray. Converters should avoid copying
+    the data whenever possible.
+
+    """
+
+    #: Unique id of the converter.
+    id = d_(Str())
+
+    #: Types handled by the converter. Subclasses of those types are handled
+    #: too. To avoid importing optional dependencies, types can be given as
+    #: fully qualified names (ex: "xarray.DataArray"). Those are only resolved
+    #: once the corresponding module has been imported.
+    types = d_(List())
+
+    #: Priority of the converter, used if multiple converters handle the same
+    #: type. Higher number have higher priority.
+    priority = d_(Int(50))
+
+    #: Callable taking the data as single argument and returning a Dataset or
+    #: a DataArray.
+    func = d_(Callable())
+
+
+def resolve_type(name: str) -> Optional[type]:
+    """Resolve a type given by its qualified name.
+
+    None is returned if the module defining the type has not yet been imported,
+    since no object of that type can exist yet.
+
+    """
+    module, _, qualname = name.rpartition(".")
+    if not module or module.split(".")[0] not in sys.modules:
+        return None
+    obj = importlib.import_module(module)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
@@ -0,0 +1,10 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Built-in converters turning common array containers into data store elements.
+
+"""
@@ -0,0 +1,64 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Converters for numpy arrays, sequences and objects supporting the buffer protocol.
+
+"""
+from typing import Any, Sequence, Union
+
+import numpy as np
+
+from ..datastore import DataArray, Dataset
+
+
+def convert_ndarray(data: np.ndarray) -> Union[DataArray, Dataset]:
+    """Store a numpy array as is.
+
+    Record arrays are stored as a Dataset with one DataArray per field (see
+    convert_record_array).
+
+    """
+    if data.dtype.names is not None:
+        return convert_record_array(data)
+    return DataArray(values=data)
+
+
+def convert_record_array(data: np.ndarray) -> Dataset:
+    """Store a record array as a Dataset with one DataArray per field.
+
+    Each DataArray holds a view on the field so all of them share the buffer of
+    the record array and no copy is made, which in particular allows to store a
+    memory mapped file without reading it. Nested record fields are turned into
+    nested Dataset.
+
+    """
+    # Make the record array itself read-only so that the shared buffer cannot
+    # be modified through it.
+    data.setflags(write=False)
+    dataset = Dataset()
+    for name in data.dtype.names:
+        dataset._data[name] = convert_ndarray(data[name])
+    return dataset
+
+
+def convert_sequence(data: Sequence[Any]) -> DataArray:
+    """Convert a list or a tuple to an array.
+
+    This requires a copy since the content of a list is not contiguous in memory.
+
+    """
+    return DataArray(values=np.asarray(data))
+
+
+def convert_buffer(data: Any) -> DataArray:
+    """Wrap an object supporting the buffer protocol without copying it.
+
+    The format and shape of the buffer are preserved, raw bytes being
+    interpreted as unsigned 8 bits integers.
+
+    """
+    return DataArray(values=np.asarray(memoryview(data)))
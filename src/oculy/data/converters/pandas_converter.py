@@ -0,0 +1,30 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Converters for pandas objects.
+
+Those converters share the memory of the pandas object when its content is backed
+by a numpy array but work on views, so that the pandas object itself is not made
+read-only.
+
+"""
+from typing import Any
+
+from ..datastore import DataArray, Dataset
+
+
+def convert_pandas_series(data: Any) -> DataArray:
+    """Convert a pandas.Series, its attributes being used as metadata."""
+    return DataArray(values=data.to_numpy(copy=False).view(), metadata=data.attrs)
+
+
+def convert_pandas_dataframe(data: Any) -> Dataset:
+    """Convert a pandas.DataFrame with one DataArray per column."""
+    dataset = Dataset(metadata=data.attrs)
+    for name, column in data.items():
+        dataset._data[str(name)] = convert_pandas_series(column)
+    return dataset
@@ -0,0 +1,29 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Converters for xarray objects.
+
+Those converters share the memory of the xarray object but work on a view of the
+underlying array, so that the xarray object itself is not made read-only.
+
+"""
+from typing import Any
+
+from ..datastore import DataArray, Dataset
+
+
+def convert_xarray_dataarray(data: Any) -> DataArray:
+    """Convert a xarray.DataArray, its attributes being used as metadata."""
+    return DataArray(values=data.values.view(), metadata=data.attrs)
+
+
+def convert_xarray_dataset(data: Any) -> Dataset:
+    """Convert a xarray.Dataset with one DataArray per data variable."""
+    dataset = Dataset(metadata=data.attrs)
+    for name, var in data.data_vars.items():
+        dataset._data[str(name)] = convert_xarray_dataarray(var)
+    return dataset
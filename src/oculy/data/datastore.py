@@ -8,32 +8,43 @@
 """Central data storage system for Oculy.
 
 """
+import hashlib
+import itertools
 from collections import deque
+from functools import partial
 from typing import (
     Any,
+    Callable,
+    Deque,
     Dict as TDict,
+    Iterable,
     Iterator,
+    List,
     Mapping,
     Optional,
     Sequence,
+    Set,
     Tuple,
     Union,
 )
 
 import numpy as np
-from atom.api import (
-    Atom,
-    Bool,
-    Dict,
-    Event,
-    ForwardInstance,
-    ForwardTyped,
-    Instance,
-    Typed,
-)
+from atom.api import Atom, Dict, Event, ForwardTyped, Instance, Int, Typed
 
 from oculy.io import BaseLoader
 
+from .memory import MemoryTracker, buffer_of
+from .metadata_index import MetadataIndex
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
+
+#: Counter used to order the accesses to the values of LazyDataArray.
+_ACCESS_COUNTER = itertools.count(1)
+
 
 def _plugin():
     from .plugin import DataStoragePlugin
@@ -41,32 +52,334 @@ def _plugin():
     return DataStoragePlugin
 
 
-class DataArray(Atom):
+def _hash_array(array: np.ndarray) -> Optional[bytes]:
+    """Compute a digest of the content, shape and dtype of an array.
+
+    xxhash is used when available since it is much faster than the hashlib
+    algorithms. Arrays of objects cannot be hashed from their buffer and None
+    is returned for those.
+
+    """
+    if array.dtype.hasobject:
+        return None
+    h = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    h.update(str(array.dtype.descr).encode())
+    h.update(str(array.shape).encode())
+    h.update(np.ascontiguousarray(array).reshape(-1).view(np.uint8).data)
+    return h.digest()
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    """Check whether two metadata values are equal, arrays being compared by
+    identity only.
+
+    """
+    if a is b:
+        return True
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+class DataArray:
     """
     Leaf in the datastore, storing a read-only numpy array and custom metadata.
+
+    Stores can hold hundreds of thousands of nodes, so nodes are plain slotted
+    objects rather than atom objects and metadata dictionaries are only
+    created when first accessed.
+
     """
 
-    #: Values being stored, this is not meant to be a record array.
-    values = Typed(np.ndarray)
+    __slots__ = ("_values", "_metadata", "_content_hash", "is_live", "version")
+
+    def __init__(
+        self,
+        values: Optional[np.ndarray] = None,
+        metadata: Optional[Mapping[str, Any]] = None,
+        is_live: bool = False,
+    ) -> None:
+        #: Is that array updated each time any of its sources are updated.
+        self.is_live = is_live
+        #: Version of the values, incremented each time new values are stored.
+        #: Consumers can use it to cache results derived from the values.
+        self.version = 0
+        self._values: Optional[np.ndarray] = None
+        self._metadata = dict(metadata) if metadata else None
+        self._content_hash: Optional[bytes] = None
+        if values is not None:
+            self.values = values
+
+    @property
+    def values(self) -> Optional[np.ndarray]:
+        """Values being stored, this is not meant to be a record array."""
+        return self._values
+
+    @values.setter
+    def values(self, values: np.ndarray) -> None:
+        if not isinstance(values, np.ndarray):
+            raise TypeError(
+                f"The values of a DataArray must be a numpy.ndarray, got {values!r}"
+            )
+        # Enforce that all arrays stored in the datastore are read-only.
+        # setflags is noticeably cheaper than going through values.flags
+        values.setflags(write=False)
+        self._values = values
+        self.version += 1
+        self._content_hash = None
+
+    @property
+    def metadata(self) -> TDict[str, Any]:
+        """Metadata attached to data."""
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata: Mapping[str, Any]) -> None:
+        self._metadata = dict(metadata)
+
+    def content_hash(self) -> Optional[bytes]:
+        """Digest of the values, computed on first access and then cached."""
+        if self._content_hash is None and self.values is not None:
+            self._content_hash = _hash_array(self.values)
+        return self._content_hash
+
+    def has_same_content(self, other: "DataArray") -> bool:
+        """Check whether the values of both arrays are identical.
+
+        Values which are not in memory are not loaded for the comparison, and
+        are considered different.
+
+        """
+        if self is other:
+            return True
+        values, other_values = self._values, other._values
+        if values is None or other_values is None:
+            return False
+        if values is other_values:
+            return True
+        if values.shape != other_values.shape:
+            return False
+        if values.dtype != other_values.dtype:
+            return False
+        h = self.content_hash()
+        return h is not None and h == other.content_hash()
+
+
+class AppendableDataArray(DataArray):
+    """DataArray whose values can be extended without copying its history.
+
+    Values are stored in a preallocated buffer and exposed as a read-only view
+    on its filled part. The buffer capacity is doubled when it is exhausted,
+    so that appending is amortized O(1) per sample. If max_length is
+    non-zero, only the last max_length samples are kept and the buffer is
+    twice that size: once full, the retained samples are moved to a new
+    buffer which keeps the cost amortized O(1) per sample.
+
+    Appending never modifies memory visible through values obtained earlier.
+    Appending values of another dtype promotes the dtype of the buffer as
+    numpy.result_type does.
 
-    #: Is that array updated each time any of its sources are updated.
-    is_live = Bool()
+    """
 
-    #: Metadata attached to data.
-    metadata = Dict(str)
+    __slots__ = ("_buffer", "_start", "_stop", "max_length")
 
-    # --- Private API
+    def __init__(
+        self,
+        values: Optional[np.ndarray] = None,
+        metadata: Optional[Mapping[str, Any]] = None,
+        is_live: bool = True,
+        max_length: int = 0,
+        version: int = 0,
+    ) -> None:
+        #: Maximal number of samples to keep, 0 meaning no limit.
+        self.max_length = max_length
+        self._buffer: Optional[np.ndarray] = None
+        self._start = self._stop = 0
+        super().__init__(None, metadata, is_live)
+        if values is not None:
+            self.values = values
+        self.version = max(version, self.version)
+
+    @property
+    def values(self) -> Optional[np.ndarray]:
+        """Values stored, as a read-only view on the internal buffer."""
+        return self._values
+
+    @values.setter
+    def values(self, values: np.ndarray) -> None:
+        if not isinstance(values, np.ndarray):
+            raise TypeError(
+                f"The values of a DataArray must be a numpy.ndarray, got {values!r}"
+            )
+        self._buffer = None
+        self._start = self._stop = 0
+        self.append(values)
+
+    def append(self, chunk: Any) -> Tuple[int, int, int]:
+        """Append values along the first axis.
+
+        Returns
+        -------
+        start : int
+            Index of the first appended sample in the new values.
+        stop : int
+            Index past the last appended sample in the new values.
+        dropped : int
+            Number of samples dropped from the beginning of the values to
+            respect max_length.
+
+        """
+        buffer = self._buffer
+        chunk = np.asarray(chunk)
+        if buffer is not None:
+            # Promote rather than silently cast (e.g. truncate floats to ints)
+            chunk = chunk.astype(np.result_type(buffer.dtype, chunk.dtype), copy=False)
+        if chunk.ndim == 0:
+            chunk = chunk.reshape(1)
+        if buffer is not None and chunk.shape[1:] != buffer.shape[1:]:
+            raise ValueError(
+                f"Cannot append values of shape {chunk.shape} to an array "
+                f"whose samples have shape {buffer.shape[1:]}"
+            )
+
+        n = len(chunk)
+        start = self._start
+        stop = self._stop
+        dropped = 0
+        if self.max_length:
+            if n > self.max_length:
+                chunk = chunk[n - self.max_length :]
+                n = self.max_length
+            dropped = max(0, stop - start + n - self.max_length)
+            start += dropped
+
+        full = buffer is None or stop + n > len(buffer)
+        if full or chunk.dtype != buffer.dtype:
+            kept = stop - start
+            if self.max_length:
+                capacity = 2 * self.max_length
+            else:
+                previous = len(buffer) if buffer is not None else 0
+                capacity = max(2 * previous if full else previous, kept + n, 16)
+            new = np.empty((capacity,) + chunk.shape[1:], dtype=chunk.dtype)
+            if kept:
+                new[:kept] = buffer[start:stop]
+            self._buffer = buffer = new
+            start, stop = 0, kept
+
+        buffer[stop : stop + n] = chunk
+        self._start = start
+        self._stop = stop = stop + n
+
+        view = buffer[start:stop]
+        view.setflags(write=False)
+        self._values = view
+        self.version += 1
+        self._content_hash = None
 
-    def _post_setattr_values(self, old, new):
-        """Enforce that all arrays stored in the datastore are read-only."""
-        new.flags.writeable = False
+        return len(view) - n, len(view), dropped
 
 
-class Dataset(Atom):
-    """Represent a node in the data store."""
+class LazyDataArray(DataArray):
+    """DataArray whose values are only loaded when first accessed.
 
-    #: Custom metadata attached to the node.
-    metadata = Dict(str)
+    The loader is a callable without argument returning the values as an
+    array. Setting the values explicitly discards the loader. As long as the
+    loader is kept, the values can be dropped from memory (see unload) and
+    will be loaded again on next access.
+
+    """
+
+    __slots__ = ("_loader", "_listener", "last_access")
+
+    def __init__(
+        self,
+        loader: Callable[[], np.ndarray],
+        metadata: Optional[Mapping[str, Any]] = None,
+        is_live: bool = False,
+        version: int = 0,
+    ) -> None:
+        super().__init__(None, metadata, is_live)
+        self.version = version
+        #: Counter value at the last access to the values, used to evict the
+        #: least recently used values first.
+        self.last_access = 0
+        self._loader: Optional[Callable[[], np.ndarray]] = loader
+        #: Callable notified with the node, the values and whether they were
+        #: loaded (True) or unloaded (False). Set by the data store.
+        self._listener: Optional[Callable[[Any, np.ndarray, bool], None]] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the values are currently in memory."""
+        return self._values is not None
+
+    @property
+    def values(self) -> Optional[np.ndarray]:
+        """Values being stored, loaded on first access."""
+        self.last_access = next(_ACCESS_COUNTER)
+        if self._values is None and self._loader is not None:
+            values = self._loader()
+            values.setflags(write=False)
+            self._values = values
+            if self._listener is not None:
+                self._listener(self, values, True)
+        return self._values
+
+    @values.setter
+    def values(self, values: np.ndarray) -> None:
+        DataArray.values.fset(self, values)
+        self._loader = None
+
+    def unload(self) -> bool:
+        """Drop the values from memory if they can be loaded again.
+
+        Arrays previously obtained from values remain valid, but the memory
+        is only released once they are no longer referenced.
+
+        Returns
+        -------
+        bool
+            Whether values were dropped.
+
+        """
+        values = self._values
+        if values is None or self._loader is None:
+            return False
+        # The content is unchanged so the version and hash are preserved.
+        self._values = None
+        if self._listener is not None:
+            self._listener(self, values, False)
+        return True
+
+
+class Dataset:
+    """Represent a node in the data store.
+
+    As for DataArray, this is a slotted object whose metadata dictionary is
+    created lazily.
+
+    """
+
+    __slots__ = ("_data", "_metadata")
+
+    def __init__(self, metadata: Optional[Mapping[str, Any]] = None) -> None:
+        self._data: TDict[str, Union[DataArray, "Dataset"]] = {}
+        self._metadata = dict(metadata) if metadata else None
+
+    @property
+    def metadata(self) -> TDict[str, Any]:
+        """Custom metadata attached to the node."""
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata: Mapping[str, Any]) -> None:
+        self._metadata = dict(metadata)
 
     def __getitem__(self, key: str) -> Union[DataArray, "Dataset"]:
         return self._data[key]
@@ -77,6 +390,9 @@ class Dataset(Atom):
     def __iter__(self) -> Iterator[str]:
         return iter(self._data)
 
+    def __len__(self) -> int:
+        return len(self._data)
+
     def values(self) -> Iterator[Union[DataArray, "Dataset"]]:
         """Iterable on the values stored."""
         return iter(self._data.values())
@@ -85,8 +401,6 @@ class Dataset(Atom):
         """Iterable on the keys and values stored."""
         return iter(self._data.items())
 
-    _data = Dict(str, ForwardInstance(lambda: (DataArray, Dataset)))
-
 
 def _lookup_in_store(node: Dataset, split_path: Sequence[str]):
     """Look up a node based on a list of names."""
@@ -113,11 +427,21 @@ class DataStore(Atom):
     #: - "removed": list of entries that disappeared from the store.
     #: - "moved": dict of entries that moved from key to value.
     #: - "updated": dict of entries whose values where updated and their new \
-    # value.
+    # value. Storing values identical to the existing ones is not reported.
     #: - "metadata_updated": list of entries whose metadata values were \
     # updated.
+    #: - "appended": dict of entries to which values were appended (see \
+    # append_data) and the (start, stop, dropped) triplet returned by \
+    # AppendableDataArray.append. Those entries are also listed in "updated".
     update = Event()
 
+    #: Number of bytes the arrays of the store may hold before the least
+    #: recently accessed entries which can be reloaded (entries restored from
+    #: a snapshot or stored using store_from_loader) are evicted from memory.
+    #: 0 means no limit. Entries which cannot be reloaded are never evicted, so
+    #: the limit may be exceeded.
+    memory_budget = Int(0)
+
     def get_data(self, paths: Sequence[str]) -> TDict[str, Union[Dataset, DataArray]]:
         """Retrieve data as Dataset and DataArray."""
         split_paths = [path.split("/") for path in paths]
@@ -143,9 +467,15 @@ class DataStore(Atom):
         """Store data in the store.
 
         All intermediate node are create automatically, and metadata are
-        updated based on the provided values. Metadata with None as value
-        are deleted, and entry with None for both values and metadat are
-        removed.
+        updated based on the provided values. Values identical to the ones
+        already stored are ignored, so that no spurious update is emitted, but
+        the metadata attached to the new DataArray are merged into the
+        existing one.
+        Metadata with None as value are deleted, and entry with None for both
+        values and metadat are removed.
+
+        Metadata should only be modified through this method, so that the
+        index used by `find` stays up to date.
 
         The converters declared in the plugin are used to turn the provided
         values into admissible values for the data member of a DataArray.
@@ -162,23 +492,42 @@ class DataStore(Atom):
         removed = []
         # Sort the path to ensure we always create a parent node
         # before its children
+        index = self._metadata_index
         for path in sorted(data):
             val, mval = data[path]
-            current = self._data
-            current_path = ""
-            split_path = path.split("/")
-            for p in split_path[:-1]:
-                if p not in current:
-                    n_path = current_path + "/" + p if current_path else p
-                    current[p] = Dataset()
-                    added.append(n_path)
-
-                current = current[p]._data
-                current_path += "/" + p if current_path else p
-
-            d_key = split_path[-1]
-            current_path += "/" + d_key
-            if d_key not in current:
+            if val is None and mval is None:
+                parent = self._find_parent_children(path)
+                d_key = path.rpartition("/")[2]
+                if parent is not None and d_key in parent:
+                    self._untrack(path, parent.pop(d_key))
+                    removed.append(path)
+                continue
+
+            current, d_key = self._get_parent(path, added)
+            current_path = path
+            old = current.get(d_key)
+
+            if val is not None:
+                if not isinstance(val, (Dataset, DataArray)):
+                    # Call the plugin to run custom converter on the data
+                    val = self._plugin.run_converter(val)
+
+                if isinstance(old, DataArray) and isinstance(val, DataArray):
+                    if val is old or old.has_same_content(val):
+                        # Keep the stored node but not at the expense of the
+                        # metadata attached to the new one (by converters).
+                        new_meta = {
+                            k: v
+                            for k, v in (val._metadata or {}).items()
+                            if not _same_value(old.metadata.get(k), v)
+                        }
+                        if new_meta:
+                            mval = {**new_meta, **(mval or {})}
+                        val = None
+                    else:
+                        val.version = old.version + 1
+
+            if old is None:
                 added.append(current_path)
             else:
                 if val is not None:
@@ -187,30 +536,183 @@ class DataStore(Atom):
                     meta_updated.append(current_path)
 
             if val is not None:
-                if isinstance(val, (Dataset, DataArray)):
-                    current[d_key] = val
-                else:
-                    # Call the plugin to run custom converter on the data
-                    current[d_key] = self._plugin.run_converter(val)
+                if old is not None:
+                    self._untrack(path, old)
+                current[d_key] = val
+                self._track(path, val)
 
             if mval is not None:
-                current[d_key].metadata.update(mval)
-                current[d_key].metadata = {
-                    k: v for k, v in current[d_key].metadata.items() if v
+                node = current[d_key]
+                node.metadata.update(mval)
+                node.metadata = {
+                    k: v for k, v in node.metadata.items() if v is not None
                 }
-
-            if val is None and mval is None:
-                removed.append(current_path)
+                index.set(path, node.metadata)
 
         update = {}
         for k, v in zip(
-            ("added", "removed", "updated", "metadata_updated"),
-            (added, removed, updated, meta_updated),
+            ("added", "removed", "updated", "metadata_updated", "appended"),
+            (added, removed, updated, meta_updated, {}),
         ):
             update[k] = v
 
+        self._enforce_budget()
         self.update = update
 
+    def find(self, **criteria: Any) -> Set[str]:
+        """Find the paths of the entries whose metadata match all criteria.
+
+        For example, `find(unit="V", source="data.csv")` returns the paths of
+        the entries whose "unit" metadata is "V" and "source" metadata is
+        "data.csv". The lookup relies on an index and does not walk the store.
+
+        """
+        return self._metadata_index.find(**criteria)
+
+    def append_data(self, data: Mapping[str, Any]) -> None:
+        """Append values to entries of the store.
+
+        Entries are turned into AppendableDataArray if necessary (missing
+        entries being created) so that successive appends do not copy the
+        values already stored. A single update is emitted in which existing
+        entries are listed as updated, new ones as added, and the range of the
+        appended values is provided for all (see `update`).
+
+        Parameters
+        ----------
+        data : Mapping[str, Any]
+            Mapping between path and values to append along the first axis.
+
+        """
+        added: List[str] = []
+        updated = []
+        appended = {}
+        memory = self._memory
+        for path in sorted(data):
+            current, d_key = self._get_parent(path, added)
+            node = current.get(d_key)
+            if node is None:
+                node = current[d_key] = AppendableDataArray()
+                self._track(path, node)
+                added.append(path)
+            elif not isinstance(node, AppendableDataArray):
+                if not isinstance(node, DataArray):
+                    raise TypeError(f"Cannot append values to the dataset {path}")
+                self._untrack(path, node)
+                node = AppendableDataArray(
+                    node.values, node._metadata, version=node.version
+                )
+                current[d_key] = node
+                self._track(path, node)
+                updated.append(path)
+            else:
+                updated.append(path)
+            # The buffer may be reallocated by the append
+            if node._values is not None:
+                memory.remove(path, node._values)
+            appended[path] = node.append(data[path])
+            memory.add(path, node._values)
+
+        self._enforce_budget()
+        self.update = {
+            "added": added,
+            "removed": [],
+            "updated": updated,
+            "metadata_updated": [],
+            "appended": appended,
+        }
+
+    def store_from_loader(self, loader_id: str, names: Mapping[str, str]) -> None:
+        """Store entries whose values are read from a loader when accessed.
+
+        Since the values can always be read again from the file, those entries
+        can be evicted from memory when the memory budget is exceeded.
+
+        Parameters
+        ----------
+        loader_id : str
+            Id of the loader in `loaders` from which to read the values.
+        names : Mapping[str, str]
+            Mapping between the path of the entries and the name of the
+            matching data in the loader.
+
+        """
+        if loader_id not in self.loaders:
+            raise KeyError(
+                f"No loader with id {loader_id}, known loaders: {list(self.loaders)}"
+            )
+
+        def make_loader(name: str) -> Callable[[], np.ndarray]:
+            def load() -> np.ndarray:
+                loader = self.loaders[loader_id]
+                return np.array(loader.load_data([name], {})[name].values)
+
+            return load
+
+        self.store_data(
+            {
+                path: (LazyDataArray(make_loader(name)), None)
+                for path, name in names.items()
+            }
+        )
+
+    def memory_usage(self, path: str = "") -> int:
+        """Bytes held in memory by an entry and its children.
+
+        Buffers shared by several entries (for example the fields of a record
+        array) are counted once. The empty path refers to the whole store.
+
+        """
+        if path:
+            node = self.get_data([path])[path]
+            if isinstance(node, DataArray):
+                return buffer_of(node._values)[1] if node._values is not None else 0
+        return self._memory.usage(path)
+
+    def evict(self, paths: Optional[Iterable[str]] = None) -> List[str]:
+        """Drop from memory the values of entries which can be reloaded.
+
+        Parameters
+        ----------
+        paths : Optional[Iterable[str]]
+            Paths of the entries to evict. By default all evictable entries
+            are evicted.
+
+        Returns
+        -------
+        List[str]
+            Paths of the entries whose values were dropped.
+
+        """
+        evicted = []
+        for path in list(self._evictable) if paths is None else paths:
+            node = self._evictable.get(path)
+            if node is not None and node.unload():
+                evicted.append(path)
+        return evicted
+
+    def save_snapshot(self, path: str) -> None:
+        """Save the whole content of the store, metadata included, to a file.
+
+        See oculy.data.snapshot for details about the format.
+
+        """
+        from .snapshot import save_snapshot
+
+        save_snapshot(self, path)
+
+    def restore_snapshot(self, path: str) -> None:
+        """Replace the content of the store by the one of a snapshot.
+
+        The file is memory mapped and arrays are only read when first
+        accessed, so restoring a large snapshot is cheap. Loaders are not part
+        of the snapshot.
+
+        """
+        from .snapshot import load_snapshot
+
+        self._replace_content(load_snapshot(path))
+
     def move_data(self, move: Mapping[str, str]):
         """Move data from one place to another."""
         raise NotImplementedError  # FIXME
@@ -227,33 +729,172 @@ class DataStore(Atom):
         self,
     ) -> Iterator[
         Tuple[
-            Union["DataStore", Dataset, DataArray],
-            Tuple[Tuple[str, Dataset], ...],
-            Tuple[Tuple[str, DataArray], ...],
+            Union["DataStore", Dataset],
+            List[Tuple[str, Dataset]],
+            List[Tuple[str, DataArray]],
         ]
     ]:
-        """Walk the content of the data store.
+        """Walk the content of the data store breadth first.
 
-        Similar to os.walk yield: root, datasets, dataarrays
+        Similar to os.walk yield: root, datasets, dataarrays where datasets
+        and dataarrays are lists of (name, node) pairs. As with os.walk used
+        with topdown=True, the datasets list can be modified in place to prune
+        the walk, only the datasets left in the list being visited.
 
         """
-        sets = deque([(k, v) for k, v in self._data.items() if isinstance(v, Dataset)])
-        arrays = tuple(
-            (k, v) for k, v in self._data._values() if isinstance(v, DataArray)
-        )
-        yield self, tuple(sets), arrays
-
-        while sets:
-            for _, s in tuple(sets):
-                sets.popleft()
-                sets.extend([(k, v) for k, v in s.items() if isinstance(v, Dataset)])
-                arrays = tuple((k, v) for k, v in s.items() if isinstance(v, DataArray))
-                yield s, sets[-1], arrays
+        queue: Deque[Union["DataStore", Dataset]] = deque((self,))
+        while queue:
+            node = queue.popleft()
+            datasets: List[Tuple[str, Dataset]] = []
+            arrays: List[Tuple[str, DataArray]] = []
+            for item in node._data.items():
+                if isinstance(item[1], Dataset):
+                    datasets.append(item)
+                else:
+                    arrays.append(item)
+            yield node, datasets, arrays
+            queue.extend(d for _, d in datasets)
 
     # --- Private API
 
+    def _get_parent(self, path: str, added: List[str]) -> Tuple[TDict[str, Any], str]:
+        """Access the children of the parent of a path and the key of the path.
+
+        Missing intermediate datasets are created and their paths appended to
+        added.
+
+        """
+        current = self._data
+        current_path = ""
+        split_path = path.split("/")
+        for p in split_path[:-1]:
+            current_path += "/" + p if current_path else p
+            if p not in current:
+                current[p] = Dataset()
+                added.append(current_path)
+            current = current[p]._data
+
+        return current, split_path[-1]
+
+    def _replace_content(self, content: Mapping[str, Union[Dataset, DataArray]]):
+        """Replace the whole content of the store and notify of the change."""
+        removed = list(self._data)
+        added = []
+        stack = [("", content)]
+        while stack:
+            prefix, children = stack.pop()
+            for k, v in children.items():
+                path = prefix + k
+                added.append(path)
+                if isinstance(v, Dataset):
+                    stack.append((path + "/", v._data))
+
+        for k, v in self._data.items():
+            self._untrack(k, v)
+        self._data = dict(content)
+        self._metadata_index.clear()
+        self._memory.clear()
+        self._evictable.clear()
+        for k, v in content.items():
+            self._track(k, v)
+        self._enforce_budget()
+        self.update = {
+            "added": sorted(added),
+            "removed": removed,
+            "updated": [],
+            "metadata_updated": [],
+            "appended": {},
+        }
+
+    def _find_parent_children(self, path: str) -> Optional[TDict[str, Any]]:
+        """Access the children of the parent of a path, if it exists."""
+        current = self._data
+        for p in path.split("/")[:-1]:
+            node = current.get(p)
+            if not isinstance(node, Dataset):
+                return None
+            current = node._data
+        return current
+
+    def _track(self, path: str, node: Union[Dataset, DataArray]) -> None:
+        """Index the metadata and account for the memory of a new subtree."""
+        index = self._metadata_index
+        memory = self._memory
+        for p, n in _iter_tree(path, node):
+            index.set(p, n._metadata)
+            if isinstance(n, DataArray):
+                if n._values is not None:
+                    memory.add(p, n._values)
+                if isinstance(n, LazyDataArray):
+                    n._listener = partial(self._handle_lazy_values, p)
+                    if n._values is not None and n._loader is not None:
+                        self._evictable[p] = n
+
+    def _untrack(self, path: str, node: Union[Dataset, DataArray]) -> None:
+        """Forget about a subtree removed from the store."""
+        index = self._metadata_index
+        memory = self._memory
+        for p, n in _iter_tree(path, node):
+            index.remove(p)
+            if isinstance(n, DataArray):
+                if n._values is not None:
+                    memory.remove(p, n._values)
+                if isinstance(n, LazyDataArray):
+                    n._listener = None
+                    self._evictable.pop(p, None)
+
+    def _handle_lazy_values(
+        self, path: str, node: LazyDataArray, values: np.ndarray, loaded: bool
+    ) -> None:
+        """Account for the values of a LazyDataArray being (un)loaded."""
+        if loaded:
+            self._memory.add(path, values)
+            if node._loader is not None:
+                self._evictable[path] = node
+            self._enforce_budget()
+        else:
+            self._memory.remove(path, values)
+            self._evictable.pop(path, None)
+
+    def _enforce_budget(self) -> None:
+        """Evict the least recently used entries until within budget."""
+        budget = self.memory_budget
+        memory = self._memory
+        if not budget or memory.usage() <= budget:
+            return
+        candidates = sorted(self._evictable.values(), key=lambda n: n.last_access)
+        # Never evict the most recently accessed entry which may be in use.
+        for node in candidates[:-1]:
+            node.unload()
+            if memory.usage() <= budget:
+                break
+
+    def _post_setattr_memory_budget(self, old: int, new: int) -> None:
+        self._enforce_budget()
+
+    #: Inverted index of the metadata of the entries.
+    _metadata_index = Typed(MetadataIndex, ())
+
+    #: Bytes held by each subtree.
+    _memory = Typed(MemoryTracker, ())
+
+    #: Loaded entries whose values can be dropped and reloaded.
+    _evictable = Typed(dict, ())
+
     #: Reference to the plugin used to access converters.
     _plugin = ForwardTyped(_plugin)
 
     #: Mapping storing the data sets
     _data = Dict(str, Instance((Dataset, DataArray)))
+
+
+def _iter_tree(
+    path: str, node: Union[Dataset, DataArray]
+) -> Iterator[Tuple[str, Union[Dataset, DataArray]]]:
+    """Iterate over a node and all its children with their paths."""
+    stack = [(path, node)]
+    while stack:
+        p, n = stack.pop()
+        yield p, n
+        if isinstance(n, Dataset):
+            stack.extend((p + "/" + k, c) for k, c in n._data.items())
@@ -0,0 +1,111 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Accounting of the memory held by the data store entries.
+
+"""
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+
+def buffer_of(values: np.ndarray) -> Tuple[int, int]:
+    """Identify the buffer holding the values of an array and its size.
+
+    Views are traced back to the array owning the memory, so that arrays
+    sharing a buffer (for example the fields of a record array) report the
+    same buffer.
+
+    """
+    base = values
+    while isinstance(base.base, np.ndarray):
+        base = base.base
+    return id(base), base.nbytes
+
+
+def _ancestors(path: str) -> List[str]:
+    """Paths of the datasets containing an entry, the root ("") first."""
+    parts = path.split("/")
+    return [""] + ["/".join(parts[:i]) for i in range(1, len(parts))]
+
+
+class MemoryTracker:
+    """Incremental accounting of the bytes held by each subtree of a store.
+
+    Each buffer is counted once per subtree, no matter how many entries of
+    the subtree reference it. Only the datasets (and the root) have a total,
+    the size of an entry being the size of its buffer.
+
+    """
+
+    __slots__ = ("_totals", "_buffers")
+
+    def __init__(self) -> None:
+        #: Bytes held by each dataset.
+        self._totals: Dict[str, int] = {}
+        #: Size of each buffer and paths of the entries referencing it.
+        self._buffers: Dict[int, Tuple[int, Set[str]]] = {}
+
+    def add(self, path: str, values: np.ndarray) -> None:
+        """Account for the values of an entry."""
+        key, nbytes = buffer_of(values)
+        if key not in self._buffers:
+            self._buffers[key] = (nbytes, set())
+        nbytes, paths = self._buffers[key]
+        if path in paths:
+            return
+        totals = self._totals
+        for a in self._unshared_ancestors(path, paths):
+            totals[a] = totals.get(a, 0) + nbytes
+        paths.add(path)
+
+    def remove(self, path: str, values: np.ndarray) -> None:
+        """Stop accounting for the values of an entry."""
+        key, _ = buffer_of(values)
+        if key not in self._buffers:
+            return
+        nbytes, paths = self._buffers[key]
+        if path not in paths:
+            return
+        paths.discard(path)
+        totals = self._totals
+        for a in self._unshared_ancestors(path, paths):
+            total = totals.get(a, 0) - nbytes
+            if total or not a:
+                totals[a] = total
+            else:
+                totals.pop(a, None)
+        if not paths:
+            del self._buffers[key]
+
+    def usage(self, path: str = "") -> int:
+        """Bytes held by a dataset (or the whole store for "")."""
+        return self._totals.get(path, 0)
+
+    def clear(self) -> None:
+        """Forget about all entries."""
+        self._totals.clear()
+        self._buffers.clear()
+
+    # --- Private API
+
+    @staticmethod
+    def _unshared_ancestors(path: str, others: Set[str]) -> List[str]:
+        """Ancestors of path which do not contain any of the other paths."""
+        ancestors = _ancestors(path)
+        shared = 0
+        for other in others:
+            other_ancestors = _ancestors(other)
+            n = 0
+            for a, b in zip(ancestors, other_ancestors):
+                if a != b:
+                    break
+                n += 1
+            shared = max(shared, n)
+            if shared == len(ancestors):
+                break
+        return ancestors[shared:]
@@ -0,0 +1,114 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Inverted index of the metadata of the data store entries.
+
+"""
+from typing import Any, Dict, Hashable, Mapping, Optional, Set, Union
+
+#: Marker for values that cannot be indexed.
+_UNHASHABLE = object()
+
+
+def _index_key(value: Any) -> Union[Hashable, object]:
+    """Turn a metadata value into a key usable in the index.
+
+    Lists are turned into tuples so that metadata restored from JSON can be
+    found. Other unhashable values cannot be indexed.
+
+    """
+    if isinstance(value, list):
+        value = tuple(_index_key(v) for v in value)
+        return _UNHASHABLE if _UNHASHABLE in value else value
+    try:
+        hash(value)
+    except TypeError:
+        return _UNHASHABLE
+    return value
+
+
+class MetadataIndex:
+    """Index mapping metadata keys and values to the paths of the entries.
+
+    The index is maintained incrementally by the data store which notifies it
+    of every change in metadata. Values that are not hashable (and not lists)
+    are not indexed and cannot be searched for.
+
+    """
+
+    __slots__ = ("_index", "_entries")
+
+    def __init__(self) -> None:
+        #: Paths for each metadata key and value.
+        self._index: Dict[str, Dict[Hashable, Set[str]]] = {}
+        #: Indexed metadata for each path.
+        self._entries: Dict[str, Dict[str, Hashable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set(self, path: str, metadata: Optional[Mapping[str, Any]]) -> None:
+        """Set the metadata of an entry, replacing any previous values."""
+        self.remove(path)
+        if not metadata:
+            return
+        entry = {}
+        for k, v in metadata.items():
+            key = _index_key(v)
+            if key is _UNHASHABLE:
+                continue
+            entry[k] = key
+            self._index.setdefault(k, {}).setdefault(key, set()).add(path)
+        if entry:
+            self._entries[path] = entry
+
+    def remove(self, path: str) -> None:
+        """Remove an entry from the index."""
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            return
+        for k, key in entry.items():
+            values = self._index[k]
+            paths = values[key]
+            paths.discard(path)
+            if not paths:
+                del values[key]
+                if not values:
+                    del self._index[k]
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        self._index.clear()
+        self._entries.clear()
+
+    def find(self, **criteria: Any) -> Set[str]:
+        """Find the paths of the entries whose metadata match all criteria.
+
+        The cost of the query is proportional to the number of entries
+        matching the least selective criterion, not to the size of the store.
+
+        """
+        if not criteria:
+            return set(self._entries)
+
+        candidates = []
+        for k, v in criteria.items():
+            key = _index_key(v)
+            if key is _UNHASHABLE:
+                return set()
+            paths = self._index.get(k, {}).get(key)
+            if not paths:
+                return set()
+            candidates.append(paths)
+
+        candidates.sort(key=len)
+        result = set(candidates[0])
+        for paths in candidates[1:]:
+            result.intersection_update(paths)
+            if not result:
+                break
+        return result
@@ -8,14 +8,18 @@
 """Central data storage system for Oculy.
 
 """
-from typing import Any, Union
+from typing import Any, Optional, Union
 
-import numpy as np
-from atom.api import Typed
+from atom.api import Dict, Typed
 from enaml.workbench.api import Plugin
+from gild.utils.plugin_tools import ExtensionsCollector, make_extension_validator
 
+from .converter import Converter, resolve_type
+from .converters.ndarray_converter import convert_buffer
 from .datastore import DataArray, Dataset, DataStore
 
+CONVERTERS_POINT = "oculy.data.converters"
+
 
 class DataStoragePlugin(Plugin):
     """Plugin handling storing for the whole application."""
@@ -23,19 +27,113 @@ class DataStoragePlugin(Plugin):
     #: Data store object handling the book keeping.
     datastore = Typed(DataStore)
 
-    #: Converters used to turn input data into valid data for the datastore.
-    converters = None  # FIXME
+    #: Collect all contributed Converter extensions used to turn input data
+    #: into valid data for the datastore.
+    converters = Typed(ExtensionsCollector)
 
     def start(self):
+        """Start the plugin life-cycle.
+
+        This method is called by the framework at the appropriate time. It
+        should never be called by user code.
+
+        """
+        core = self.workbench.get_plugin("enaml.workbench.core")
+        core.invoke_command("gild.errors.enter_error_gathering")
+
+        validator = make_extension_validator(Converter, (), ("func", "types"))
+        self.converters = ExtensionsCollector(
+            workbench=self.workbench,
+            point=CONVERTERS_POINT,
+            ext_class=Converter,
+            validate_ext=validator,
+        )
+        self.converters.start()
+
+        self._update_converters(None)
+        self.converters.observe("contributions", self._update_converters)
+
+        core.invoke_command("gild.errors.exit_error_gathering")
+
         self.datastore = DataStore(_plugin=self)
 
     def stop(self):
-        pass
+        """Stop the plugin life-cycle.
+
+        This method is called by the framework at the appropriate time.
+        It should never be called by user code.
+
+        """
+        self.converters.unobserve("contributions", self._update_converters)
+        self.converters.stop()
+        del self.converters
 
     def run_converter(self, data: Any) -> Union[Dataset, DataArray]:
-        """Convert data to an admissible element of the data store."""
-        if not isinstance(data, np.ndarray) or data.dtype.names is not None:
-            # FIXME run custom converters (including for numpy arrays)
-            raise NotImplementedError
+        """Convert data to an admissible element of the data store.
+
+        The converter is selected based on the type of the data, walking the
+        MRO as functools.singledispatch does. The result of the lookup is
+        cached per type. Objects supporting the buffer protocol for which no
+        converter is registered are wrapped without copy.
+
+        """
+        cls = type(data)
+        try:
+            converter = self._dispatch_cache[cls]
+        except KeyError:
+            converter = self._dispatch_cache[cls] = self._find_converter(cls)
+
+        if converter is not None:
+            return converter.func(data)
+
+        try:
+            memoryview(data)
+        except TypeError:
+            raise TypeError(
+                f"No converter is registered for {cls}. Converters exist for: "
+                f"{list(self._registry) + list(self._pending)}"
+            ) from None
+        return convert_buffer(data)
+
+    # --- Private API --------------------------------------------------------
+
+    #: Converter to use for each type for which a converter was contributed.
+    _registry = Dict(type, Converter)
+
+    #: Converters whose types are given by name and that have not yet been
+    #: resolved because the module defining them has not been imported.
+    _pending = Dict(str, list)
+
+    #: Cache of the converter to use for each type encountered so far.
+    _dispatch_cache = Dict(type)
+
+    def _update_converters(self, change):
+        """Rebuild the type registry from the contributed converters."""
+        self._registry.clear()
+        self._pending.clear()
+        self._dispatch_cache.clear()
+        for converter in self.converters.contributions.values():
+            for t in converter.types:
+                if isinstance(t, str):
+                    self._pending.setdefault(t, []).append(converter)
+                else:
+                    self._register(t, converter)
+
+    def _register(self, cls: type, converter: Converter) -> None:
+        """Register a converter for a type unless one of higher priority exists."""
+        existing = self._registry.get(cls)
+        if existing is None or existing.priority < converter.priority:
+            self._registry[cls] = converter
+
+    def _find_converter(self, cls: type) -> Optional[Converter]:
+        """Find the most specific converter for a type."""
+        for name in list(self._pending):
+            resolved = resolve_type(name)
+            if resolved is not None:
+                for converter in self._pending.pop(name):
+                    self._register(resolved, converter)
 
-        return DataArray(values=data)
+        for klass in cls.__mro__:
+            if klass in self._registry:
+                return self._registry[klass]
+        return None
@@ -0,0 +1,489 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Export of data store entries to shared memory for out-of-process consumers.
+
+Each exported array lives in its own shared memory block made of a 64 bytes
+header followed by the raw values. The first header field is a sequence counter
+used as a seqlock: it is odd while the values are being written, so that
+readers can detect torn reads and retry. A registry block, whose name is the
+only thing other processes need to know, holds the same kind of counter
+followed by a JSON description of the exported entries.
+
+The exporting process is the only one creating blocks and writing the
+registry. Other processes attach to the blocks without copy and may write new
+values in place (with the same dtype and shape), which the exporting process
+pushes into the data store when polling.
+
+The counter increments are not atomic: a block must only be written by one
+process at a time (the exporting one included), concurrent writers not being
+detected. Readers on the other hand can be any number.
+
+"""
+import ast
+import itertools
+import json
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import numpy as np
+from atom.api import Atom, Dict as ADict, Int, Set, Str, Typed
+from numpy.lib.format import descr_to_dtype, dtype_to_descr
+
+from .datastore import DataArray, Dataset, DataStore
+
+if TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
+
+#: Size of the header preceding the values in each block.
+HEADER_SIZE = 64
+
+#: Time in seconds after which reading a block being written is given up.
+READ_TIMEOUT = 1.0
+
+#: Names of the blocks created by this process.
+_CREATED = set()
+
+T = TypeVar("T")
+
+
+def _attach(name: str) -> "SharedMemory":
+    """Attach to an existing block without registering it for clean up.
+
+    Before Python 3.13, attaching registers the block with the resource tracker
+    which unlinks it when the attaching process exits, destroying it for the
+    exporting process.
+
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    shm = shared_memory.SharedMemory(name)
+    if os.name == "posix" and name not in _CREATED:
+        from multiprocessing import resource_tracker
+
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _create(size: int, name: Optional[str] = None) -> "SharedMemory":
+    """Create a new block."""
+    shm = shared_memory.SharedMemory(name, create=True, size=size)
+    _CREATED.add(shm.name)
+    return shm
+
+
+def _counter(shm: "SharedMemory") -> np.ndarray:
+    """View on the sequence counter of a block."""
+    return np.ndarray((1,), np.uint64, buffer=shm.buf)
+
+
+def _registry_length(shm: "SharedMemory") -> np.ndarray:
+    """View on the length of the JSON content of the registry."""
+    return np.ndarray((1,), np.uint64, buffer=shm.buf, offset=8)
+
+
+def _write(counter: np.ndarray, target: np.ndarray, values: Any) -> None:
+    """Write values in a block, marking the write in progress.
+
+    The caller must be the only writer of the block (see the module doc).
+
+    """
+    counter[0] += 1
+    target[...] = values
+    counter[0] += 1
+
+
+def _read_consistent(counter: np.ndarray, copy: Callable[[], T]) -> Tuple[T, int]:
+    """Copy the content of a block, retrying if a write happened meanwhile.
+
+    Raises
+    ------
+    TimeoutError
+        Raised if no consistent copy could be made within READ_TIMEOUT, which
+        happens if a writer died in the middle of a write.
+
+    """
+    deadline = time.monotonic() + READ_TIMEOUT
+    while True:
+        before = int(counter[0])
+        if not before % 2:
+            values = copy()
+            if int(counter[0]) == before:
+                return values, before
+        if time.monotonic() > deadline:
+            raise TimeoutError(
+                "Could not read a shared memory block consistently, a process "
+                "may have died while writing it."
+            )
+
+
+def _read(counter: np.ndarray, source: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Copy the values of a block, retrying if a write happened meanwhile."""
+    return _read_consistent(counter, lambda: np.array(source))
+
+
+class SharedMemoryExporter(Atom):
+    """Export data store entries to shared memory blocks.
+
+    Exported entries are kept in sync with the data store: updating them in
+    the store updates the shared blocks, removing them (or one of their
+    parents) from the store stops their export.
+
+    """
+
+    #: Data store whose entries are exported.
+    datastore = Typed(DataStore)
+
+    #: Name of the registry block other processes should attach to.
+    registry_name = Str()
+
+    #: Size in bytes of the registry block, which limits the number of entries
+    #: that can be exported.
+    registry_size = Int(1 << 20)
+
+    def __init__(self, datastore: DataStore, **kwargs) -> None:
+        super().__init__(datastore=datastore, **kwargs)
+        if not self.registry_name:
+            self.registry_name = f"oculy_{os.getpid()}_{id(self):x}"
+        self._registry = _create(self.registry_size, self.registry_name)
+        _counter(self._registry)[0] = 0
+        self._write_registry()
+        datastore.observe("update", self._handle_store_update)
+
+    def export(self, paths: Iterable[str]) -> None:
+        """Export entries of the data store.
+
+        Exported values are copied once into shared memory.
+
+        """
+        data = self.datastore.get_data(list(paths))
+        for path, node in data.items():
+            if not isinstance(node, DataArray):
+                raise TypeError(f"Only DataArray can be exported, {path} is not.")
+            if node.values.dtype.hasobject:
+                raise TypeError(f"Arrays of objects cannot be exported ({path}).")
+            self._create_block(path, node.values)
+        self._write_registry()
+
+    def unexport(self, paths: Iterable[str]) -> None:
+        """Stop exporting entries and release the associated memory."""
+        for path in paths:
+            self._release_block(path)
+        self._write_registry()
+
+    def poll(self) -> None:
+        """Push into the data store values modified by other processes.
+
+        The values are copied out of shared memory so that the arrays in the
+        data store remain immutable.
+
+        """
+        update = {}
+        for path, (counter, view) in self._views.items():
+            if int(counter[0]) != self._seen[path]:
+                values, self._seen[path] = _read(counter, view)
+                update[path] = (values, None)
+        if update:
+            self._pulling = set(update)
+            try:
+                self.datastore.store_data(update)
+            finally:
+                self._pulling = set()
+
+    def close(self) -> None:
+        """Stop exporting all entries and destroy the registry."""
+        self.datastore.unobserve("update", self._handle_store_update)
+        for path in list(self._blocks):
+            self._release_block(path)
+        self._registry.close()
+        self._registry.unlink()
+        _CREATED.discard(self._registry.name)
+
+    # --- Private API
+
+    #: Registry block.
+    _registry = Typed(shared_memory.SharedMemory)
+
+    #: Shared memory block used for each exported path.
+    _blocks = ADict(str, shared_memory.SharedMemory)
+
+    #: Counter and values view for each exported path.
+    _views = ADict(str, tuple)
+
+    #: Last counter value written or read by this process for each path.
+    _seen = ADict(str, int)
+
+    #: Paths being pushed to the store by poll and which should not be
+    #: written back to shared memory.
+    _pulling = Set(str)
+
+    def _create_block(self, path: str, values: np.ndarray) -> None:
+        """Allocate a block for a path and copy the values in it."""
+        self._release_block(path)
+        shm = _create(HEADER_SIZE + max(values.nbytes, 1))
+        counter = _counter(shm)
+        counter[0] = 0
+        view = np.ndarray(
+            values.shape, values.dtype, buffer=shm.buf, offset=HEADER_SIZE
+        )
+        _write(counter, view, values)
+        self._blocks[path] = shm
+        self._views[path] = (counter, view)
+        self._seen[path] = int(counter[0])
+
+    def _release_block(self, path: str) -> None:
+        """Release the block associated with a path if any."""
+        if path not in self._blocks:
+            return
+        # Views on the buffer must be dropped before it can be closed.
+        del self._views[path]
+        del self._seen[path]
+        shm = self._blocks.pop(path)
+        shm.close()
+        shm.unlink()
+        _CREATED.discard(shm.name)
+
+    def _write_registry(self) -> None:
+        """Describe the exported entries in the registry."""
+        entries = {
+            path: {
+                "name": self._blocks[path].name,
+                "dtype": repr(dtype_to_descr(view.dtype)),
+                "shape": list(view.shape),
+            }
+            for path, (_, view) in self._views.items()
+        }
+        encoded = json.dumps(entries).encode("utf-8")
+        if len(encoded) + 16 > self.registry_size:
+            raise RuntimeError(
+                "Too many entries are exported for the registry size "
+                f"({self.registry_size} bytes)."
+            )
+        counter = _counter(self._registry)
+        counter[0] += 1
+        _registry_length(self._registry)[0] = len(encoded)
+        self._registry.buf[16 : 16 + len(encoded)] = encoded
+        counter[0] += 1
+
+    def _handle_store_update(self, change: Mapping[str, Any]) -> None:
+        """Keep the exported blocks in sync with the data store.
+
+        Entries removed directly or along with one of their parents stop being
+        exported, unless they are added back by the same update (as when
+        restoring a snapshot), in which case they are synced as updated ones.
+
+        """
+        update = change["value"]
+        removed = update["removed"]
+        added = set(update["added"])
+        gone = [
+            p
+            for p in self._blocks
+            if any(p == r or p.startswith(r + "/") for r in removed)
+        ]
+        modified = False
+        for path in gone:
+            if path not in added:
+                self._release_block(path)
+                modified = True
+
+        for path in itertools.chain(update["updated"], added):
+            if path not in self._blocks or path in self._pulling:
+                continue
+            modified |= self._sync_block(path)
+        if modified:
+            self._write_registry()
+
+    def _sync_block(self, path: str) -> bool:
+        """Copy the values of an entry to its block.
+
+        The block is reallocated if the dtype or the shape changed and
+        released if the entry is no longer an exportable DataArray.
+
+        Returns
+        -------
+        bool
+            Whether the registry should be rewritten.
+
+        """
+        node = self.datastore.get_data([path])[path]
+        if (
+            isinstance(node, Dataset)
+            or node.values is None
+            or node.values.dtype.hasobject
+        ):
+            self._release_block(path)
+            return True
+        values = node.values
+        counter, view = self._views[path]
+        if values.shape == view.shape and values.dtype == view.dtype:
+            _write(counter, view, values)
+            self._seen[path] = int(counter[0])
+            return False
+        self._create_block(path, values)
+        return True
+
+
+class _BlockArray:
+    """Expose part of a block through the array interface.
+
+    Arrays built from it reference it as their base, which keeps the block
+    mapped as long as any of them (or of the arrays derived from them) is
+    alive. Arrays built on SharedMemory.buf do not, and closing the block
+    would leave them pointing to unmapped memory.
+
+    """
+
+    def __init__(
+        self,
+        shm: "SharedMemory",
+        shape: Tuple[int, ...],
+        dtype: np.dtype,
+        offset: int,
+    ) -> None:
+        self._shm = shm
+        address = np.frombuffer(shm.buf, np.uint8).ctypes.data + offset
+        self.__array_interface__ = {
+            "version": 3,
+            "shape": shape,
+            "typestr": dtype.str,
+            "descr": dtype.descr,
+            "data": (address, False),
+        }
+
+
+def _block_array(
+    shm: "SharedMemory", shape: Tuple[int, ...], dtype: np.dtype, offset: int
+) -> np.ndarray:
+    """Array on part of a block keeping the block alive."""
+    return np.asarray(_BlockArray(shm, shape, dtype, offset))
+
+
+class SharedStoreClient:
+    """Access entries exported by a SharedMemoryExporter from another process.
+
+    Parameters
+    ----------
+    registry_name : str
+        Name of the registry block of the exporter.
+
+    """
+
+    def __init__(self, registry_name: str) -> None:
+        self._registry = _attach(registry_name)
+        self._views: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Read the registry again to account for changes in the exports."""
+        registry = self._registry
+
+        def copy() -> bytes:
+            length = int(_registry_length(registry)[0])
+            return bytes(registry.buf[16 : 16 + length])
+
+        encoded, _ = _read_consistent(_counter(registry), copy)
+        entries = json.loads(encoded.decode("utf-8"))
+
+        for path in list(self._views):
+            if entries.get(path, {}).get("name") != self._entries[path]["name"]:
+                self._detach(path)
+        self._entries = entries
+
+    def paths(self) -> Iterable[str]:
+        """Paths of the exported entries."""
+        return list(self._entries)
+
+    def attach(self, path: str) -> np.ndarray:
+        """Access the values of an entry without copy.
+
+        The values may be modified by the exporting process at any time, use
+        `read` to get a consistent copy.
+
+        """
+        return self._get_view(path)[1]
+
+    def version(self, path: str) -> int:
+        """Counter incremented each time the values of an entry are written."""
+        return int(self._get_view(path)[0][0]) // 2
+
+    def read(self, path: str) -> np.ndarray:
+        """Get a consistent copy of the values of an entry."""
+        return _read(*self._get_view(path))[0]
+
+    def store_data(
+        self,
+        data: Mapping[str, Tuple[Optional[Any], Optional[Mapping[str, Any]]]],
+    ) -> None:
+        """Write new values for exported entries.
+
+        This mirrors DataStore.store_data, but the values must match the dtype
+        and shape of the exported entries and metadata cannot be transmitted.
+        The exporting process picks the changes up when polling. No other
+        process should write the same entries meanwhile (see the module doc).
+
+        """
+        for path, (values, metadata) in data.items():
+            if metadata is not None:
+                raise ValueError("Metadata cannot be updated through shared memory.")
+            counter, view = self._get_view(path)
+            values = np.asarray(values)
+            if values.shape != view.shape or values.dtype != view.dtype:
+                raise ValueError(
+                    f"Values for {path} must have dtype {view.dtype} and shape "
+                    f"{view.shape}, got {values.dtype} and {values.shape}."
+                )
+            _write(counter, view, values)
+
+    def close(self) -> None:
+        """Detach from all blocks.
+
+        Arrays returned by attach remain valid, the blocks being unmapped
+        once they are garbage collected.
+
+        """
+        for path in list(self._views):
+            self._detach(path)
+        self._registry.close()
+
+    # --- Private API
+
+    def _get_view(self, path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Attach to the block of a path if necessary."""
+        if path not in self._views:
+            if path not in self._entries:
+                raise KeyError(f"{path} is not exported, exported: {self.paths()}")
+            entry = self._entries[path]
+            shm = _attach(entry["name"])
+            dtype = descr_to_dtype(ast.literal_eval(entry["dtype"]))
+            self._views[path] = (
+                _block_array(shm, (1,), np.dtype(np.uint64), 0),
+                _block_array(shm, tuple(entry["shape"]), dtype, HEADER_SIZE),
+            )
+        return self._views[path]
+
+    def _detach(self, path: str) -> None:
+        """Detach from the block of a path.
+
+        The block is closed when the last array using it is garbage collected.
+
+        """
+        del self._views[path]
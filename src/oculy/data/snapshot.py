@@ -0,0 +1,187 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Snapshot of the content of a data store to a single memory mappable file.
+
+The file starts with a fixed size header (magic bytes, format version and size
+of the index) followed by a JSON index and the raw array buffers. The index
+describes every node of the store (kind, metadata, and for arrays the dtype,
+shape and offset of the buffer in the file). Buffers are aligned on 64 bytes so
+that they can be used in place once the file is memory mapped.
+
+"""
+import ast
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Tuple, Union
+
+import numpy as np
+from numpy.lib.format import descr_to_dtype, dtype_to_descr
+
+from .datastore import DataArray, Dataset, LazyDataArray
+
+if TYPE_CHECKING:
+    from .datastore import DataStore
+
+#: Magic bytes identifying a snapshot file.
+MAGIC = b"OCULYSNP"
+
+#: Version of the format written by this module.
+FORMAT_VERSION = 1
+
+#: Header layout: magic, format version, length of the JSON index.
+_HEADER = struct.Struct("<8sIQ")
+
+#: Alignment of the array buffers in the file.
+_ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _encode_metadata(path: str, metadata: Mapping[str, Any]) -> Dict[str, Any]:
+    """Ensure metadata can be written as JSON."""
+
+    def default(obj):
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        raise TypeError(
+            f"Metadata of {path} contain a value that cannot be saved: {obj!r}"
+        )
+
+    return json.loads(json.dumps(metadata, default=default))
+
+
+def _iter_nodes(
+    content: Mapping[str, Union[Dataset, DataArray]]
+) -> List[Tuple[str, Union[Dataset, DataArray]]]:
+    """List all the nodes of a tree with their path, parents first."""
+    nodes = []
+    stack = [("", content)]
+    while stack:
+        prefix, children = stack.pop()
+        for k, v in children.items():
+            nodes.append((prefix + k, v))
+            if isinstance(v, Dataset):
+                stack.append((prefix + k + "/", v._data))
+    return nodes
+
+
+def save_snapshot(store: "DataStore", path: str) -> None:
+    """Save the content of a store to a file.
+
+    Raises
+    ------
+    TypeError
+        Raised if an array of Python objects or metadata that cannot be
+        represented as JSON are found.
+
+    """
+    index = {}
+    arrays = []
+    offset = 0
+    for p, node in _iter_nodes(store._data):
+        entry: Dict[str, Any] = {"metadata": _encode_metadata(p, node.metadata)}
+        if isinstance(node, Dataset):
+            entry["kind"] = "dataset"
+        else:
+            values = node.values
+            if values.dtype.hasobject:
+                raise TypeError(f"Arrays of objects cannot be saved ({p}).")
+            entry.update(
+                kind="array",
+                dtype=repr(dtype_to_descr(values.dtype)),
+                shape=list(values.shape),
+                offset=offset,
+                version=node.version,
+                is_live=node.is_live,
+            )
+            arrays.append(values)
+            offset = _align(offset + values.nbytes)
+        index[p] = entry
+
+    encoded = json.dumps({"nodes": index}).encode("utf-8")
+    data_start = _align(_HEADER.size + len(encoded))
+    # Write to a temporary file replacing the target once complete, since the
+    # target may be memory mapped by the lazy arrays of the store itself.
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=".snapshot-", dir=os.path.dirname(os.path.abspath(path))
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+            f.write(encoded)
+            for values in arrays:
+                f.write(b"\0" * (data_start - f.tell()))
+                f.write(np.ascontiguousarray(values).reshape(-1).view(np.uint8).data)
+                data_start = _align(f.tell())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_snapshot(path: str) -> Dict[str, Union[Dataset, DataArray]]:
+    """Load the content of a snapshot.
+
+    The file is memory mapped and arrays are created lazily, so that only
+    the index is read.
+
+    Returns
+    -------
+    Dict[str, Union[Dataset, DataArray]]
+        Top level nodes of the snapshot.
+
+    """
+    with open(path, "rb") as f:
+        magic, version, length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a data store snapshot.")
+        if version > FORMAT_VERSION:
+            raise ValueError(
+                f"{path} uses format version {version} which is newer than the "
+                f"supported one ({FORMAT_VERSION})."
+            )
+        index = json.loads(f.read(length).decode("utf-8"))["nodes"]
+        data_start = _align(_HEADER.size + length)
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def make_loader(dtype: np.dtype, shape: Tuple[int, ...], offset: int):
+        def loader() -> np.ndarray:
+            count = int(np.prod(shape))
+            if not count:
+                return np.empty(shape, dtype)
+            return np.frombuffer(
+                buffer, dtype, count=count, offset=data_start + offset
+            ).reshape(shape)
+
+        return loader
+
+    # Parents are always listed before their children in the index
+    root: Dict[str, Union[Dataset, DataArray]] = {}
+    datasets: Dict[str, Dataset] = {}
+    for p, entry in index.items():
+        parent_path, _, key = p.rpartition("/")
+        parent = datasets[parent_path]._data if parent_path else root
+        if entry["kind"] == "dataset":
+            parent[key] = datasets[p] = Dataset(metadata=entry["metadata"])
+        else:
+            dtype = descr_to_dtype(ast.literal_eval(entry["dtype"]))
+            parent[key] = LazyDataArray(
+                make_loader(dtype, tuple(entry["shape"]), entry["offset"]),
+                metadata=entry["metadata"],
+                is_live=entry["is_live"],
+                version=entry["version"],
+            )
+
+    return root
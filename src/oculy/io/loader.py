@@ -8,7 +8,7 @@
 """Interface for data loaders.
 
 """
-from typing import Mapping, Sequence, Type
+from typing import Iterator, Sequence, Type
 
 import enaml
 from atom.api import Callable, Dict, Int, List, Str
@@ -16,7 +16,7 @@ from enaml.core.api import Declarative, d_, d_func
 from gild.utils.atom_util import HasPrefAtom
 from xarray import Dataset
 
-from oculy.transformations import MaskSpecification
+from oculy.transformations import Masks
 
 with enaml.imports():
     from .loader_config import BaseLoaderView
@@ -61,13 +61,18 @@ class BaseLoader(HasPrefAtom):
     # taking
     #: the data to be masked, the data to generate the mask and the mask
     #: specification for each mask source data.
-    #: Callable[[Dataset, Dataset, Mapping[str, MaskSpecification]],Dataset ]
+    #: The specification can also be a mask expression (see
+    #: oculy.transformations.mask_expressions).
+    #: The last argument indicates whether the masked out values should be
+    #: removed instead of replaced by NaN.
+    #: Callable[[Dataset, Dataset, Masks, bool], Dataset]
     mask_data = Callable()
 
     def load_data(
         self,
         names: Sequence[str],
-        masks: Mapping[str, MaskSpecification],
+        masks: Masks,
+        compact: bool = False,
     ) -> Dataset:
         """Load data from the on-disk resource.
 
@@ -75,10 +80,16 @@ class BaseLoader(HasPrefAtom):
         ----------
         names : Sequence[str]
             Names-like string referring to the content of the file.
-        masks : Mapping[str, MaskSpecification]
+        masks : Masks
             Mapping of mapping operation to perform on the specified named
             data, the resulting mask are applied to the requested data
-             (see `names`)
+             (see `names`). Alternatively a mask expression combining masks
+             with AND, OR and NOT. Loaders able to filter while reading can
+             inspect it to do so, others use mask_data.
+        compact : bool, optional
+            Should masked out values be dropped from the returned data,
+            rather than replaced by NaN. The returned data are then only as
+            large as the selection and preserve their dtype.
 
         Returns
         -------
@@ -94,6 +105,48 @@ class BaseLoader(HasPrefAtom):
         """
         raise NotImplementedError
 
+    def iter_chunks(
+        self,
+        names: Sequence[str],
+        masks: Masks,
+        chunk_size: int = 1 << 16,
+        compact: bool = True,
+    ) -> Iterator[Dataset]:
+        """Load data by chunks of rows.
+
+        The default implementation loads all the data at once and slices them.
+        Loaders able to read part of a file should override it so that files
+        larger than the memory can be processed.
+
+        Parameters
+        ----------
+        names : Sequence[str]
+            Names-like string referring to the content of the file.
+        masks : Masks
+            Masks to apply to each chunk, see load_data.
+        chunk_size : int, optional
+            Number of rows (along the first dimension) read at once.
+        compact : bool, optional
+            Should masked out values be dropped from the chunks, rather than
+            replaced by NaN.
+
+        Returns
+        -------
+        Iterator[Dataset]
+            Successive chunks of the requested data.
+
+        Raises
+        ------
+        DataKeyError
+            Raised if the name of some data or mask is not found
+             in the on disk store.
+
+        """
+        data = self.load_data(names, masks, compact)
+        dim = data[names[0]].dims[0]
+        for start in range(0, data.sizes[dim], chunk_size):
+            yield data.isel({dim: slice(start, start + chunk_size)})
+
     def determine_content(self, details=False) -> None:
         raise NotImplementedError
 
@@ -11,13 +11,13 @@ Requires Pandas for fast IO.
 
 """
 import csv
-from typing import Mapping, Sequence
+from typing import Iterator, Sequence
 
 from atom.api import Bool, Str, Typed
 from pandas import read_csv
 from xarray import Dataset
 
-from oculy.transformations import MaskSpecification
+from oculy.transformations import Masks, mask_columns
 
 from ...loader import BaseLoader, DataKeyError
 
@@ -47,7 +47,8 @@ class CSVLoader(BaseLoader):
     def load_data(
         self,
         columns: Sequence[str],
-        masks: Mapping[str, MaskSpecification],
+        masks: Masks,
+        compact: bool = False,
     ) -> Dataset:
         """Load data from the CSV file.
 
@@ -55,14 +56,16 @@ class CSVLoader(BaseLoader):
         ----------
         names : Sequence[str]
             Names-like string referring to the content of the file.
-        masks : Mapping[str, MaskSpecification]
-            Mapping of mapping operation to perform on the specified
+        masks : Masks
+            Mapping of mapping operation (or mask expression) to perform on the
             named data, the resulting mask are applied to the requested
             data (see `names`) apply_mask : Callable[ [Dataset, Dataset,
             Mapping[str, MaskSpecification]], Dataset ]
             allable taking care of applying any in-memory masking required
             and taking the data to be masked, the data to generate the mask
             and the mask specification for each mask source data.
+        compact : bool, optional
+            Should masked out rows be dropped rather than filled with NaN.
 
         Returns
         -------
@@ -76,7 +79,8 @@ class CSVLoader(BaseLoader):
             on disk store.
 
         """
-        required = list(columns) + list(masks)
+        masked = mask_columns(masks)
+        required = list(dict.fromkeys(list(columns) + masked))
         if not self.content:
             self.determine_content()
 
@@ -108,13 +112,56 @@ class CSVLoader(BaseLoader):
 
         data = self._data[columns]
         if masks:
-            data = self.mask_data(data, self._data[list(masks)], masks)
+            data = self.mask_data(data, self._data[masked], masks, compact)
 
         if self._data.nbytes > self.caching_limit * 1e6:
             del self._data
 
         return data
 
+    def iter_chunks(
+        self,
+        columns: Sequence[str],
+        masks: Masks,
+        chunk_size: int = 1 << 16,
+        compact: bool = True,
+    ) -> Iterator[Dataset]:
+        """Read the CSV file by chunks of rows.
+
+        Only the requested columns and the ones used by the masks are read and
+        a single chunk is in memory at a time, unless the data are already
+        cached.
+
+        """
+        masked = mask_columns(masks)
+        required = list(dict.fromkeys(list(columns) + masked))
+        if not self.content:
+            self.determine_content()
+
+        if any(r not in self.content for r in required):
+            raise DataKeyError(
+                [r for r in required if r not in self.content], self.content
+            )
+
+        if self._data and all(r in self._data for r in required):
+            yield from super().iter_chunks(columns, masks, chunk_size, compact)
+            return
+
+        with read_csv(
+            self.path,
+            sep=self.delimiter or None,
+            comment=self.comment,
+            usecols=required,
+            engine="c" if self.delimiter else "python",
+            chunksize=chunk_size,
+        ) as reader:
+            for frame in reader:
+                chunk = frame.to_xarray()
+                data = chunk[columns]
+                if masks:
+                    data = self.mask_data(data, chunk[masked], masks, compact)
+                yield data
+
     def determine_content(self, details: bool = False) -> None:
         """Determine the name of the columns."""
         if self.content:
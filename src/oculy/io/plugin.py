@@ -9,17 +9,18 @@
 
 """
 import os
-from typing import List, Mapping
+from typing import List
 
+import numpy as np
 from atom.api import Dict, Set, Typed
 from gild.utils.plugin_tools import (
     ExtensionsCollector,
     HasPreferencesPlugin,
     make_extension_validator,
 )
-from xarray import Dataset
+from xarray import DataArray, Dataset
 
-from oculy.transformations import MaskSpecification
+from oculy.transformations import Masks
 
 from .loader import BaseLoader, Loader
 
@@ -135,13 +136,24 @@ class IOPlugin(HasPreferencesPlugin):
         def mask_data(
             to_filter: Dataset,
             filter_base: Dataset,
-            specifications: Mapping[str, MaskSpecification],
+            specifications: Masks,
+            compact: bool = False,
         ) -> Dataset:
             # FIXME should we be invoking a command here ?
             mask = self.workbench.get_plugin("oculy.transformers").create_mask(
                 filter_base, specifications
             )
-            return to_filter.where(mask)
+            if not compact:
+                return to_filter.where(mask)
+            if mask.ndim != 1:
+                return to_filter.where(mask, drop=True)
+            # Index with the selected positions so that the result is only as
+            # large as the selection and integer data are not cast to float.
+            if isinstance(mask, DataArray):
+                dim = mask.dims[0]
+            else:
+                dim = next(iter(to_filter.dims))
+            return to_filter.isel({dim: np.flatnonzero(np.asarray(mask))})
 
         loader = decl.get_cls()(
             path=path, mask_data=mask_data, **self._loader_preferences.get(id, {})
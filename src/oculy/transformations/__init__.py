@@ -8,9 +8,35 @@
 """Data transformation plugin for Oculy.
 
 """
-from typing import Any, Tuple
+from typing import Any, Mapping, Tuple, Union
+
+from .mask_expressions import (
+    And,
+    MaskExpression,
+    MaskLeaf,
+    Not,
+    Or,
+    as_mask_expression,
+    mask_columns,
+)
 
 #: Description of a masking operation. Used in particular for loaders.
 #: The first str should refer to the ids of a Mask contributed to the
 # transformation plugin.
 MaskSpecification = Tuple[str, Tuple[Any, ...]]
+
+#: Masks to apply to data: either one mask specification per named array whose
+#: results are ANDed or an arbitrary expression.
+Masks = Union[Mapping[str, MaskSpecification], MaskExpression]
+
+__all__ = [
+    "And",
+    "MaskExpression",
+    "MaskLeaf",
+    "MaskSpecification",
+    "Masks",
+    "Not",
+    "Or",
+    "as_mask_expression",
+    "mask_columns",
+]
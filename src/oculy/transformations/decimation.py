@@ -0,0 +1,105 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Nodes reducing the number of points of a curve before plotting it.
+
+All the functions take the x and y values of a curve and the maximal number of
+points to keep, and return the sorted indexes of the points to keep (which can
+be used with the a[i] node). The first and last points are always kept. Points
+are grouped in buckets of consecutive points, which match pixel columns when x
+is sorted.
+
+"""
+import numpy as np
+
+from .node import Index
+
+#: Number of elements processed at once, to limit the size of temporaries.
+_BLOCK_SIZE = 1 << 20
+
+
+def decimate_stride(x: np.ndarray, y: np.ndarray, max_points: int = 4000) -> Index:
+    """Keep one point every n."""
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    step = -(-n // max(max_points - 1, 1))
+    indexes = np.arange(0, n, step)
+    return indexes if indexes[-1] == n - 1 else np.append(indexes, n - 1)
+
+
+def decimate_minmax(x: np.ndarray, y: np.ndarray, max_points: int = 4000) -> Index:
+    """Keep the minimum and maximum of each bucket.
+
+    This preserves the envelope of the curve, and hence its rendering when
+    there is at least a bucket per pixel. NaN values are ignored.
+
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    size = -(-n // max(max_points // 2 - 1, 1))
+    full = n // size
+    is_float = y.dtype.kind == "f"
+    rows = max(1, _BLOCK_SIZE // size)
+    parts = [np.array([0, n - 1])]
+    for start in range(0, full, rows):
+        stop = min(start + rows, full)
+        block = y[start * size : stop * size].reshape(stop - start, size)
+        offsets = np.arange(start * size, stop * size, size)
+        if is_float:
+            nan = np.isnan(block)
+            parts.append(np.where(nan, np.inf, block).argmin(axis=1) + offsets)
+            parts.append(np.where(nan, -np.inf, block).argmax(axis=1) + offsets)
+        else:
+            parts.append(block.argmin(axis=1) + offsets)
+            parts.append(block.argmax(axis=1) + offsets)
+    if full * size < n:
+        rest = y[full * size :]
+        if is_float:
+            nan = np.isnan(rest)
+            rest_min = np.where(nan, np.inf, rest).argmin()
+            rest_max = np.where(nan, -np.inf, rest).argmax()
+        else:
+            rest_min, rest_max = rest.argmin(), rest.argmax()
+        parts.append(np.array([rest_min, rest_max]) + full * size)
+    return np.unique(np.concatenate(parts))
+
+
+def decimate_lttb(x: np.ndarray, y: np.ndarray, max_points: int = 4000) -> Index:
+    """Largest-Triangle-Three-Buckets decimation.
+
+    Keep in each bucket the point forming the largest triangle with the point
+    kept in the previous bucket and the average of the next bucket, which
+    preserves the visual shape of the curve better than strides. Each bucket
+    depends on the previous one, hence buckets are processed one by one, the
+    computation being vectorized over the points of a bucket.
+
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.intp)
+    indexes = np.empty(max_points, dtype=np.intp)
+    indexes[0], indexes[-1] = 0, n - 1
+    selected = 0
+    for i in range(max_points - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i == max_points - 3:
+            next_x, next_y = float(x[n - 1]), float(y[n - 1])
+        else:
+            next_x = np.mean(x[stop : edges[i + 2]], dtype=float)
+            next_y = np.mean(y[stop : edges[i + 2]], dtype=float)
+        ax, ay = float(x[selected]), float(y[selected])
+        bx = np.asarray(x[start:stop], dtype=float)
+        by = np.asarray(y[start:stop], dtype=float)
+        areas = np.abs((ax - next_x) * (by - ay) - (ax - bx) * (next_y - ay))
+        selected = start + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+        indexes[i + 1] = selected
+    return indexes
@@ -0,0 +1,309 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Export of pipelines as standalone Python modules.
+
+The generated module imports the functions of the nodes from where they are
+defined, so that the same code runs in the application and in scripts, and
+inlines the nodes declaring an expression. It does not require a workbench
+and provides entry points to process many datasets with a pool of processes.
+
+"""
+import ast
+import builtins
+import inspect
+import keyword
+import string
+from types import ModuleType
+from typing import Any, Callable, Dict as TDict, List as TList, Set
+
+import numpy as np
+
+from .node import Node
+from .pipeline import Pipeline, PipelineExecutor
+
+#: Template of the generated module.
+_MODULE = '''"""Pipeline exported from Oculy.
+
+Use process to run the pipeline on a mapping of inputs, and process_batch or
+process_files to process many datasets using a pool of processes.
+
+"""
+import multiprocessing
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+{imports}
+
+#: Names of the inputs of the pipeline.
+INPUTS = {inputs!r}
+
+#: Names of the outputs of the pipeline.
+OUTPUTS = {outputs!r}
+
+
+def process(inputs: Mapping[str, Any]) -> Dict[str, Any]:
+    """Run the pipeline on a mapping of inputs."""
+{body}
+
+
+def process_batch(
+    inputs: Iterable[Mapping[str, Any]], processes: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Run the pipeline on many mappings of inputs using a pool of processes."""
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(process, inputs)
+
+
+def process_files(
+    paths: Iterable[str],
+    load: Callable[[str], Mapping[str, Any]],
+    processes: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Load and process many files using a pool of processes.
+
+    load is called in the worker processes to build the inputs from a path,
+    it must hence be picklable (defined at the top level of a module).
+
+    """
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_process_file, [(load, path) for path in paths])
+
+
+def _process_file(args):
+    load, path = args
+    return process(load(path))
+'''
+
+
+def export_pipeline(
+    pipeline: Pipeline, get_node: Callable[[str], Node], inline: bool = True
+) -> str:
+    """Generate the source of a module running a pipeline.
+
+    Parameters
+    ----------
+    pipeline : Pipeline
+        Pipeline to export.
+    get_node : Callable[[str], Node]
+        Callable returning the Node matching an id.
+    inline : bool, optional
+        Should the nodes declaring an expression be inlined rather than
+        called.
+
+    Returns
+    -------
+    str
+        Source code of the module.
+
+    Raises
+    ------
+    ValueError
+        Raised if a node function cannot be imported or needs the workbench,
+        or if a parameter value cannot be written as code.
+
+    """
+    outputs = pipeline.output_steps()
+    order = PipelineExecutor._needed_steps(
+        pipeline.topological_order(), outputs.values()
+    )
+    consumers = PipelineExecutor._count_consumers(order, outputs.values())
+
+    # Names used by the generated module itself.
+    used = set(dir(builtins)) | {
+        "multiprocessing",
+        "np",
+        "process",
+        "process_batch",
+        "process_files",
+        "inputs",
+        "INPUTS",
+        "OUTPUTS",
+    }
+    used.update({"Any", "Callable", "Dict", "Iterable", "List", "Mapping"})
+    used.update({"Optional", "_process_file"})
+
+    # Nodes inlined as expressions and the imports their expressions need,
+    # their names being reserved before naming the variables.
+    nodes = {step.id: get_node(step.node_id) for step in order}
+    inlined = {
+        step.id
+        for step in order
+        if inline and nodes[step.id].expression and not nodes[step.id].operate_in_place
+    }
+    # Import statement of each global name used by the generated code.
+    required: TDict[str, str] = {}
+    for sid in inlined:
+        for name, line in _expression_imports(nodes[sid]).items():
+            if required.setdefault(name, line) != line:
+                raise ValueError(
+                    f"The expressions of several nodes use the name {name} for "
+                    "different objects."
+                )
+    used.update(required)
+
+    imports: TDict[Callable, str] = {}
+    import_lines = []
+    variables: TDict[str, str] = {}
+    body = []
+    for name in pipeline.inputs:
+        variables[name] = _unique(name, used)
+        body.append(f"{variables[name]} = inputs[{name!r}]")
+
+    for step in order:
+        node = nodes[step.id]
+        if node.kind.needs_workbench:
+            raise ValueError(
+                f"Step {step.id} uses node {step.node_id} which requires the "
+                "workbench and cannot be exported."
+            )
+        args = [variables[n] for n in step.inputs]
+        parameters = {
+            k: _literal(v, step.id, required) for k, v in step.parameters.items()
+        }
+        if node.operate_in_place and args:
+            first = step.inputs[0]
+            if (
+                first in pipeline.inputs
+                or consumers.get(first, 0) != 1
+                or step.inputs.count(first) != 1
+            ):
+                args[0] = f"{args[0]}.copy()"
+
+        if step.id in inlined:
+            signature = inspect.signature(node.func)
+            fields = signature.bind(*args, **parameters).arguments
+            for k, p in signature.parameters.items():
+                if k not in fields and p.default is not p.empty:
+                    fields[k] = _literal(p.default, step.id, required)
+            code = node.expression.format(**fields)
+        else:
+            func = node.func
+            if func not in imports:
+                module = getattr(func, "__module__", None)
+                qualname = getattr(func, "__qualname__", "")
+                if not module or not qualname.isidentifier():
+                    raise ValueError(
+                        f"The function of node {step.node_id} is not defined at "
+                        "the top level of a module and cannot be imported."
+                    )
+                alias = _unique(qualname, used)
+                imports[func] = alias
+                if alias == qualname:
+                    import_lines.append(f"from {module} import {qualname}")
+                else:
+                    import_lines.append(f"from {module} import {qualname} as {alias}")
+            call_args = args + [f"{k}={v}" for k, v in parameters.items()]
+            code = f"{imports[func]}({', '.join(call_args)})"
+
+        variables[step.id] = _unique(step.id, used)
+        body.append(f"{variables[step.id]} = {code}")
+
+    results = ", ".join(f"{k!r}: {variables[sid]}" for k, sid in outputs.items())
+    body.append(f"return {{{results}}}")
+    return _MODULE.format(
+        imports="".join("\n" + line for line in sorted(set(required.values())))
+        + "".join("\n" + line for line in import_lines),
+        inputs=list(pipeline.inputs),
+        outputs=list(outputs),
+        body="\n".join("    " + line for line in body),
+    )
+
+
+def _unique(name: str, used: Set[str]) -> str:
+    """Valid Python identifier derived from a name, not used yet."""
+    base = "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+    if not base or base[0].isdigit() or keyword.iskeyword(base):
+        base = "_" + base
+    candidate, i = base, 1
+    while candidate in used:
+        candidate = f"{base}_{i}"
+        i += 1
+    used.add(candidate)
+    return candidate
+
+
+def _expression_imports(node: Node) -> TDict[str, str]:
+    """Import statements of the global names used by the expression of a node.
+
+    Names are resolved in the namespace of the module defining the function
+    of the node.
+
+    """
+    fields = {
+        f: f"_field_{i}"
+        for i, (_, f, _, _) in enumerate(string.Formatter().parse(node.expression))
+        if f is not None
+    }
+    tree = ast.parse(node.expression.format(**fields), mode="eval")
+    namespace = getattr(node.func, "__globals__", {})
+    required = {}
+    for name in sorted(
+        {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)} - set(fields.values())
+    ):
+        if name in namespace:
+            obj = namespace[name]
+        elif hasattr(builtins, name):
+            continue
+        else:
+            raise ValueError(
+                f"The name {name} used by the expression of node {node.id} is not "
+                "defined in the module of its function."
+            )
+        if isinstance(obj, ModuleType):
+            module = obj.__name__
+            if module == name:
+                required[name] = f"import {module}"
+            else:
+                required[name] = f"import {module} as {name}"
+            continue
+        module = getattr(obj, "__module__", None)
+        qualname = getattr(obj, "__qualname__", "")
+        if not module or not qualname.isidentifier():
+            raise ValueError(
+                f"The object {name} used by the expression of node {node.id} "
+                "cannot be imported."
+            )
+        if qualname == name:
+            required[name] = f"from {module} import {qualname}"
+        else:
+            required[name] = f"from {module} import {qualname} as {name}"
+    return required
+
+
+def _literal(value: Any, step_id: str, required: TDict[str, str]) -> str:
+    """Python code evaluating to a parameter value.
+
+    The imports the code needs are added to required.
+
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        required["np"] = "import numpy as np"
+    if isinstance(value, np.ndarray):
+        return f"np.array({value.tolist()!r}, dtype={str(value.dtype)!r})"
+    if isinstance(value, np.generic):
+        item = _literal(value.item(), step_id, required)
+        return f"np.{type(value).__name__}({item})"
+    if isinstance(value, float) and not np.isfinite(value):
+        return f"float({str(value)!r})"
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        return repr(value)
+    if isinstance(value, slice):
+        parts = (value.start, value.stop, value.step)
+        return f"slice({', '.join(_literal(p, step_id, required) for p in parts)})"
+    if isinstance(value, (list, tuple)):
+        items: TList[str] = [_literal(v, step_id, required) for v in value]
+        if isinstance(value, tuple):
+            return f"({', '.join(items)}{',' if len(items) == 1 else ''})"
+        return f"[{', '.join(items)}]"
+    if isinstance(value, dict):
+        items = [
+            f"{_literal(k, step_id, required)}: {_literal(v, step_id, required)}"
+            for k, v in value.items()
+        ]
+        return f"{{{', '.join(items)}}}"
+    raise ValueError(
+        f"The parameter {value!r} of step {step_id} cannot be written as code."
+    )
@@ -0,0 +1,78 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Cache of the masks computed by the transformation plugin.
+
+"""
+import weakref
+from collections import OrderedDict
+from typing import Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class MaskCache:
+    """LRU cache of masks keyed by the expression and the arrays it used.
+
+    Arrays are identified by identity, the entries using an array being
+    discarded as soon as the array is garbage collected (for example when a
+    loader drops its cached data). Arrays must hence not be modified in place
+    once used to compute a mask, which holds for the read-only arrays of the
+    data store and the data cached by loaders. Cached masks are read-only.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximal number of masks to keep.
+
+    """
+
+    def __init__(self, max_size: int = 16) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, Tuple[Tuple[weakref.ref, ...], np.ndarray]]"
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self, expression: Hashable, arrays: Sequence[np.ndarray]
+    ) -> Optional[np.ndarray]:
+        """Retrieve the mask computed for an expression from some arrays."""
+        key = (expression, tuple(map(id, arrays)))
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        refs, mask = entry
+        if any(r() is not a for r, a in zip(refs, arrays)):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return mask
+
+    def set(
+        self, expression: Hashable, arrays: Sequence[np.ndarray], mask: np.ndarray
+    ) -> None:
+        """Store the mask computed for an expression from some arrays."""
+        if not self.max_size:
+            return
+        key = (expression, tuple(map(id, arrays)))
+
+        def discard(_, key=key, entries=weakref.ref(self._entries)):
+            e = entries()
+            if e is not None:
+                e.pop(key, None)
+
+        mask.setflags(write=False)
+        self._entries[key] = (tuple(weakref.ref(a, discard) for a in arrays), mask)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Discard all masks."""
+        self._entries.clear()
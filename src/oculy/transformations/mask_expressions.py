@@ -0,0 +1,167 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Boolean expressions combining masking operations.
+
+Expressions are trees whose leaves apply a contributed Mask to a named array
+and whose inner nodes combine the masks of their children. They can be built
+using the &, | and ~ operators:
+
+    (MaskLeaf("x", ">", (0,)) & MaskLeaf("x", "<", (1,))) | ~MaskLeaf("y", "==", (2,))
+
+They are plain descriptions of the operations, evaluated by the transformation
+plugin or pushed down by loaders able to filter while reading.
+
+"""
+from typing import Any, Iterator, List, Mapping, Tuple, Union
+
+
+class MaskExpression:
+    """Base class for the nodes of a mask expression."""
+
+    __slots__ = ()
+
+    def __and__(self, other: "MaskExpression") -> "And":
+        return And(self, other)
+
+    def __or__(self, other: "MaskExpression") -> "Or":
+        return Or(self, other)
+
+    def __invert__(self) -> "Not":
+        return Not(self)
+
+    def leaves(self) -> Iterator["MaskLeaf"]:
+        """Iterate over the leaves of the expression."""
+        raise NotImplementedError
+
+    def columns(self) -> List[str]:
+        """Names of the arrays used by the expression, in order of first use."""
+        return list(dict.fromkeys(leaf.column for leaf in self.leaves()))
+
+
+class MaskLeaf(MaskExpression):
+    """Apply a Mask to an array.
+
+    Parameters
+    ----------
+    column : str
+        Name of the array on which to compute the mask.
+    mask_id : str
+        Id of the Mask contributed to the transformation plugin.
+    args : Tuple[Any, ...]
+        Additional arguments of the mask function.
+
+    """
+
+    __slots__ = ("column", "mask_id", "args")
+
+    def __init__(self, column: str, mask_id: str, args: Tuple[Any, ...] = ()) -> None:
+        self.column = column
+        self.mask_id = mask_id
+        self.args = tuple(args)
+
+    def leaves(self) -> Iterator["MaskLeaf"]:
+        yield self
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, MaskLeaf) and (
+            (self.column, self.mask_id, self.args)
+            == (other.column, other.mask_id, other.args)
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.column, self.mask_id, self.args))
+
+    def __repr__(self) -> str:
+        return f"MaskLeaf({self.column!r}, {self.mask_id!r}, {self.args!r})"
+
+
+class _Combination(MaskExpression):
+    """Node combining the masks of several children."""
+
+    __slots__ = ("children",)
+
+    def __init__(self, *children: MaskExpression) -> None:
+        if not children:
+            raise ValueError(f"{type(self).__name__} requires at least one child.")
+        # Flatten nested nodes of the same kind
+        flat: List[MaskExpression] = []
+        for c in children:
+            flat.extend(c.children if type(c) is type(self) else (c,))
+        self.children = tuple(flat)
+
+    def leaves(self) -> Iterator["MaskLeaf"]:
+        for c in self.children:
+            yield from c.leaves()
+
+    def __eq__(self, other: object) -> bool:
+        return type(other) is type(self) and self.children == other.children
+
+    def __hash__(self) -> int:
+        return hash((type(self).__name__, self.children))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}{self.children!r}"
+
+
+class And(_Combination):
+    """Mask True where the masks of all children are True."""
+
+    __slots__ = ()
+
+
+class Or(_Combination):
+    """Mask True where the mask of any child is True."""
+
+    __slots__ = ()
+
+
+class Not(MaskExpression):
+    """Mask True where the mask of the child is False."""
+
+    __slots__ = ("child",)
+
+    def __init__(self, child: MaskExpression) -> None:
+        self.child = child
+
+    def leaves(self) -> Iterator["MaskLeaf"]:
+        return self.child.leaves()
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Not) and self.child == other.child
+
+    def __hash__(self) -> int:
+        return hash(("Not", self.child))
+
+    def __repr__(self) -> str:
+        return f"Not({self.child!r})"
+
+
+def as_mask_expression(
+    masks: Union[Mapping[str, Tuple[str, Tuple[Any, ...]]], MaskExpression],
+) -> MaskExpression:
+    """Turn a mapping of mask specifications into the equivalent expression.
+
+    The mapping form applies one mask per array and ANDs the results.
+    Expressions are returned unchanged.
+
+    """
+    if isinstance(masks, MaskExpression):
+        return masks
+    if not masks:
+        raise ValueError("Cannot build an expression without any mask.")
+    leaves = [MaskLeaf(k, mask_id, args) for k, (mask_id, args) in masks.items()]
+    return leaves[0] if len(leaves) == 1 else And(*leaves)
+
+
+def mask_columns(
+    masks: Union[Mapping[str, Tuple[str, Tuple[Any, ...]]], MaskExpression],
+) -> List[str]:
+    """Names of the arrays needed to compute masks given in either form."""
+    if isinstance(masks, MaskExpression):
+        return masks.columns()
+    return list(masks)
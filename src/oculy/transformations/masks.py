@@ -10,8 +10,11 @@
 Note that those are expected to work on numpy arrays and xarray.DataArray.
 
 """
+from typing import Optional, Tuple
+
 import numpy as np
-from atom.api import set_default
+from atom.api import Bool, Callable, set_default
+from enaml.core.api import d_
 
 from .node import Node
 
@@ -25,6 +28,25 @@ class Mask(Node):
 
     inlineable = set_default(True)
 
+    elementwise = set_default(True)
+
+    #: Whether func accepts an out keyword argument, a boolean array in which
+    #: to write the mask. This allows to compute masks without allocating
+    #: new arrays.
+    out_parameter = d_(Bool())
+
+    #: Optional callable describing the values selected by a range mask. It
+    #: takes the arguments of func (except the array and out) and returns a
+    #: (low, high, include_low, include_high) tuple. Such masks can be answered
+    #: using a binary search on sorted columns.
+    interval = d_(Callable())
+
+    #: Whether the interval selects exactly the values selected by func. If
+    #: not, it must select a superset of them (for example because func is
+    #: subject to rounding errors the interval cannot reproduce) and the values
+    #: it selects are checked using func.
+    exact_interval = d_(Bool(True))
+
 
 # --- Conventional filters
 
@@ -32,25 +54,76 @@ class Mask(Node):
 #  (ArrayLike will cover xarray types)
 
 
-def mask_greater(array: np.ndarray, value: float) -> np.ndarray:
-    return np.greater(array, value)
+def mask_greater(
+    array: np.ndarray, value: float, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    return np.greater(array, value, out=out)
+
+
+def mask_greater_equal(
+    array: np.ndarray, value: float, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    return np.greater_equal(array, value, out=out)
+
+
+def mask_less(
+    array: np.ndarray, value: float, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    return np.less(array, value, out=out)
+
+
+def mask_less_equal(
+    array: np.ndarray, value: float, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    return np.less_equal(array, value, out=out)
+
+
+def mask_equal(
+    array: np.ndarray, value: float, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    return np.equal(array, value, out=out)
+
+
+def mask_simequal(
+    array: np.ndarray,
+    value: float,
+    tolerance: float,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    if out is None:
+        return np.less(np.abs(array - value), tolerance)
+    diff = np.subtract(array, value)
+    np.abs(diff, out=diff)
+    return np.less(diff, tolerance, out=out)
+
+
+# --- Intervals selected by the conventional filters
+
+
+def greater_interval(value: float) -> Tuple[float, float, bool, bool]:
+    return value, np.inf, False, True
 
 
-def mask_greater_equal(array: np.ndarray, value: float) -> np.ndarray:
-    return np.greater_equal(array, value)
+def greater_equal_interval(value: float) -> Tuple[float, float, bool, bool]:
+    return value, np.inf, True, True
 
 
-def mask_less(array: np.ndarray, value: float) -> np.ndarray:
-    return np.less(array, value)
+def less_interval(value: float) -> Tuple[float, float, bool, bool]:
+    return -np.inf, value, True, False
 
 
-def mask_less_equal(array: np.ndarray, value: float) -> np.ndarray:
-    return np.less_equal(array, value)
+def less_equal_interval(value: float) -> Tuple[float, float, bool, bool]:
+    return -np.inf, value, True, True
 
 
-def mask_equal(array: np.ndarray, value: float) -> np.ndarray:
-    return np.equal(array, value)
+def equal_interval(value: float) -> Tuple[float, float, bool, bool]:
+    return value, value, True, True
 
 
-def mask_simequal(array: np.ndarray, value: float, tolerance: float) -> np.ndarray:
-    return np.less(np.abs(array - value), tolerance)
+def simequal_interval(
+    value: float, tolerance: float
+) -> Tuple[float, float, bool, bool]:
+    # Superset of the values selected by mask_simequal, whose result at the
+    # bounds depends on the rounding of array - value.
+    margin = 4 * np.finfo(float).eps * (abs(value) + abs(tolerance))
+    return value - tolerance - margin, value + tolerance + margin, True, True
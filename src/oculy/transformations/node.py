@@ -5,49 +5,192 @@
 #
 # The full license is in the file LICENCE, distributed with this software.
 # ----------------------------------------------------------------------------
-"""
+"""Transformation nodes and the classification of their functions.
 
 """
+import inspect
+import typing
 from typing import TypeVar, Union
 
 # Declare if the node operate in place or copy the data
 # Units ? Do not need a separate declaration if we appply the pipeline on pint
 # quantity but could be useful though
 import numpy as np
-from atom.api import Bool, Callable, Str
+from atom.api import Atom, Bool, Callable, Str, Typed
 from enaml.core.api import Declarative, d_
 
+# FIXME once numpy 1.21 is out can use numpy.typing
+#: Array whose shape is preserved by a function. A function taking and
+#: returning T is elementwise.
+T = TypeVar("T", bound=np.ndarray)
+
+#: Array used as an index. A function taking an Index selects values.
+Index = TypeVar("Index", bound=np.ndarray)
+
+#: Single value. A function returning a Scalar is a reduction.
+Scalar = Union[int, float, complex, np.generic]
+
+
+class NodeKind(Atom):
+    """Classification of the function of a node.
+
+    Used by the pipeline executor to decide how a step can be run.
+
+    """
+
+    #: Applies independently to each row of its arrays (see Node.elementwise).
+    elementwise = Bool()
+
+    #: Reduces arrays to a small result.
+    reduction = Bool()
+
+    #: Selects values using an index.
+    index = Bool()
+
+    #: Takes the application workbench as a workbench keyword argument.
+    needs_workbench = Bool()
+
+
+def classify_node(node: "Node") -> NodeKind:
+    """Classify the function of a node based on its signature.
+
+    Declared flags take precedence: nodes declaring elementwise or providing
+    an accumulator are respectively elementwise and reductions. Otherwise,
+    functions taking an Index are index nodes, functions returning a Scalar
+    reductions and functions whose arguments without default and result are
+    all annotated as T (or scalars) elementwise.
+
+    """
+    kind = NodeKind(
+        elementwise=node.elementwise, reduction=node.accumulator is not None
+    )
+    try:
+        signature = inspect.signature(node.func)
+    except (TypeError, ValueError):
+        # Builtins may not expose a signature.
+        return kind
+    try:
+        hints = typing.get_type_hints(node.func)
+    except Exception:
+        hints = {
+            k: p.annotation
+            for k, p in signature.parameters.items()
+            if p.annotation is not p.empty
+        }
+        if signature.return_annotation is not signature.empty:
+            hints["return"] = signature.return_annotation
+
+    kind.needs_workbench = "workbench" in signature.parameters
+
+    def types(hint):
+        return typing.get_args(hint) if typing.get_origin(hint) is Union else (hint,)
+
+    kind.index = any(Index in types(h) for k, h in hints.items() if k != "return")
+    if hints.get("return") == Scalar:
+        kind.reduction = True
+    required = [
+        p.name
+        for p in signature.parameters.values()
+        if p.default is p.empty
+        and p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)
+        and p.name != "workbench"
+    ]
+    if (
+        not kind.index
+        and not kind.reduction
+        and hints.get("return") is T
+        and any(hints.get(n) is T for n in required)
+        and all(hints.get(n) in (T, int, float, complex, Scalar) for n in required)
+    ):
+        kind.elementwise = True
+    return kind
+
 
 # Used to declare transformation nodes
 class Node(Declarative):
-    """"""
+    """Transformation applied to data by calling a function.
+
+    The positional arguments of the function are the data to transform and
+    its keyword arguments parameters.
+
+    """
 
     #:
     id = d_(Str())
 
-    #:
-    # Do signature analysis to determine if the workbench is necessary to the
-    # node working.
+    #: Function called on the data. A function taking a workbench argument is
+    #: given the application workbench.
     func = d_(Callable())
 
     #:
     operate_in_place = d_(Bool())
 
-    #:
-    # FIXME when converting diagram to script can the function call be avoided
-    # FIXME inlineable node are assumed trivial and are not made available to
-    # scripting
+    #: Whether func applies independently to each row (along the first axis)
+    #: of its array arguments, the result having the same number of rows. Such
+    #: nodes can be evaluated block by block.
+    elementwise = d_(Bool())
+
+    #: Whether func is implemented in pure Python and hence holds the GIL while
+    #: running. Such nodes are run in a process pool when one is available,
+    #: func and its arguments must then be picklable.
+    pure_python = d_(Bool())
+
+    #: Factory called with the parameters of a step and returning an
+    #: accumulator combining the results of func over successive blocks of
+    #: data (see oculy.transformations.reductions). Nodes providing one are
+    #: reductions which can be used when running a pipeline by blocks.
+    accumulator = d_(Callable())
+
+    #: Whether the node is trivial enough to be fused with other steps (see
+    #: PipelineExecutor).
     inlineable = d_(Bool())
 
+    #: Python expression equivalent to func used instead of calling it when
+    #: exporting a pipeline to a script. Arguments are referred to by the name
+    #: of the parameters of func, e.g. "{a} + {b}".
+    expression = d_(Str())
+
+    #: Classification of func, computed on first access (the transformation
+    #: plugin classifies all nodes when collecting them).
+    kind = Typed(NodeKind)
+
+    def _default_kind(self) -> NodeKind:
+        return classify_node(self)
+
 
 # --- Trivial nodes that could all be inlined
-# FIXME once numpy 1.21 is out can use numpy.typing
-T = TypeVar("T", bound=np.ndarray)
-Index = TypeVar("Index", bound=np.ndarray)
 
 
 def index_array(array: T, index: Union[int, Index]) -> T:
     return array[index]
 
 
-# FIXME add logical operations, arithmetic operation, etc
+# --- Arithmetic operations
+
+
+def add(a: T, b: T) -> T:
+    return np.add(a, b)
+
+
+def subtract(a: T, b: T) -> T:
+    return np.subtract(a, b)
+
+
+def multiply(a: T, b: T) -> T:
+    return np.multiply(a, b)
+
+
+def divide(a: T, b: T) -> T:
+    return np.divide(a, b)
+
+
+def absolute(a: T) -> T:
+    return np.absolute(a)
+
+
+def subtract_in_place(a: T, b: T) -> T:
+    a -= b
+    return a
+
+
+# FIXME add logical operations, etc
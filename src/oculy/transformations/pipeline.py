@@ -0,0 +1,694 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Pipelines of transformation nodes and their execution.
+
+A pipeline is a directed acyclic graph whose steps call the function of a
+contributed Node. The positional arguments of a step are the pipeline inputs
+or the results of other steps named in its inputs, the keyword arguments are
+its parameters.
+
+The executor caches the result of every step, keyed on the results of its
+inputs and its parameters, so that when an input or parameter changes only
+the affected steps are computed again. Chains of inlineable elementwise steps
+are fused: they are evaluated block by block so that their intermediate
+results never exist as full size arrays. Given a thread pool, the executor
+runs the steps of independent branches concurrently (most numpy functions
+release the GIL) and the steps of pure Python nodes can be sent to a process
+pool.
+
+Pipelines whose outputs are reductions of elementwise steps can also be run
+block by block (run_chunked), for example on the chunks provided by a loader,
+so that data larger than the memory can be processed.
+
+"""
+import itertools
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict as TDict,
+    Iterable,
+    List as TList,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import numpy as np
+from atom.api import Atom, Dict, Int, List, Str
+from enaml.workbench.api import Workbench
+
+from .node import Node
+
+
+class PipelineStep(Atom):
+    """Step of a pipeline calling the function of a Node."""
+
+    #: Name of the step, unique in the pipeline.
+    id = Str()
+
+    #: Id of the Node (or Mask) whose function is called.
+    node_id = Str()
+
+    #: Names of the pipeline inputs or steps providing the positional
+    #: arguments of the function.
+    inputs = List(str)
+
+    #: Keyword arguments of the function. Should be modified through
+    #: Pipeline.set_parameters so that the change is detected.
+    parameters = Dict(str)
+
+    #: Counter incremented each time the parameters are modified.
+    revision = Int()
+
+
+class Pipeline(Atom):
+    """Directed acyclic graph of transformation steps."""
+
+    #: Names of the values provided when running the pipeline.
+    inputs = List(str)
+
+    #: Steps of the pipeline, in any order.
+    steps = List(PipelineStep)
+
+    #: Mapping between output names and the ids of the steps producing them.
+    #: If empty, the results of all the steps no other step uses are output.
+    outputs = Dict(str, str)
+
+    def add_step(
+        self, id: str, node_id: str, inputs: TList[str], **parameters: Any
+    ) -> PipelineStep:
+        """Add a step to the pipeline."""
+        if any(s.id == id for s in self.steps) or id in self.inputs:
+            raise ValueError(f"The pipeline already has an input or step named {id}")
+        step = PipelineStep(
+            id=id, node_id=node_id, inputs=list(inputs), parameters=parameters
+        )
+        self.steps = self.steps + [step]
+        return step
+
+    def remove_step(self, id: str) -> None:
+        """Remove a step from the pipeline."""
+        self.steps = [s for s in self.steps if s.id != id]
+
+    def get_step(self, id: str) -> PipelineStep:
+        """Access a step by id."""
+        for s in self.steps:
+            if s.id == id:
+                return s
+        raise KeyError(f"No step {id} in pipeline, known steps: {self.step_ids()}")
+
+    def step_ids(self) -> TList[str]:
+        """Ids of the steps of the pipeline."""
+        return [s.id for s in self.steps]
+
+    def set_parameters(self, step_id: str, **parameters: Any) -> None:
+        """Update the parameters of a step."""
+        step = self.get_step(step_id)
+        params = dict(step.parameters)
+        params.update(parameters)
+        step.parameters = params
+        step.revision += 1
+
+    def topological_order(self) -> TList[PipelineStep]:
+        """Steps ordered such that each comes after the steps it uses.
+
+        Raises
+        ------
+        ValueError
+            Raised if a step uses an unknown input or if the graph has cycles.
+
+        """
+        steps = {s.id: s for s in self.steps}
+        pending = {}
+        users: TDict[str, TList[str]] = {}
+        for s in self.steps:
+            deps = set()
+            for name in s.inputs:
+                if name in steps:
+                    deps.add(name)
+                    users.setdefault(name, []).append(s.id)
+                elif name not in self.inputs:
+                    raise ValueError(f"Step {s.id} uses an unknown input {name}")
+            pending[s.id] = len(deps)
+
+        ready = [s.id for s in self.steps if not pending[s.id]]
+        order = []
+        while ready:
+            sid = ready.pop()
+            order.append(steps[sid])
+            for user in dict.fromkeys(users.get(sid, ())):
+                pending[user] -= 1
+                if not pending[user]:
+                    ready.append(user)
+
+        if len(order) != len(steps):
+            raise ValueError(
+                "The pipeline contains a cycle between the steps "
+                f"{sorted(k for k, v in pending.items() if v)}"
+            )
+        return order
+
+    def output_steps(self) -> TDict[str, str]:
+        """Mapping between output names and step ids."""
+        if self.outputs:
+            return dict(self.outputs)
+        used = {name for s in self.steps for name in s.inputs}
+        return {s.id: s.id for s in self.steps if s.id not in used}
+
+
+#: Marker of results modified in place by a later step.
+_CONSUMED = object()
+
+
+def _copy(value: Any) -> Any:
+    """Copy a value before passing it to a node operating in place."""
+    if isinstance(value, np.ndarray):
+        return np.array(value)
+    return value.copy()
+
+
+def _timed(func: Callable[[], Any]) -> Tuple[Any, float]:
+    """Call a function and measure how long it took."""
+    start = time.perf_counter()
+    value = func()
+    return value, time.perf_counter() - start
+
+
+class PipelineExecutor:
+    """Run a pipeline, reusing the results of the steps whose inputs and
+    parameters did not change.
+
+    Pipeline inputs are compared by identity, they should hence not be
+    modified in place between runs (which holds for the read-only arrays of
+    the data store).
+
+    Nodes declaring operate_in_place modify their first argument. It is
+    passed directly when it is the result of a step no other step uses (the
+    cached result of that step is then discarded), and copied otherwise so
+    that inputs and cached results are never modified.
+
+    When a thread pool is provided, the steps whose inputs are available are
+    submitted to it as soon as possible, so that independent branches run
+    concurrently. The steps of nodes declaring pure_python go to the process
+    pool instead, if one is provided, their function and arguments must then
+    be picklable. Inputs are always gathered by the thread calling run.
+
+    How a step can be run is decided from the classification of its node
+    (Node.kind) which is cached on the node.
+
+    Parameters
+    ----------
+    pipeline : Pipeline
+        Pipeline to run.
+    get_node : Callable[[str], Node]
+        Callable returning the Node matching an id.
+    block_size : int
+        Number of elements per block when evaluating fused elementwise steps.
+    thread_pool : Optional[Executor]
+        Pool of threads running the steps, steps running sequentially in the
+        calling thread if None.
+    process_pool : Optional[Executor]
+        Pool of processes running the steps of pure Python nodes.
+    workbench : Optional[Workbench]
+        Application workbench, passed to the nodes requiring it.
+
+    """
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        get_node: Callable[[str], Node],
+        block_size: int = 1 << 16,
+        thread_pool: Optional[Executor] = None,
+        process_pool: Optional[Executor] = None,
+        workbench: Optional[Workbench] = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.get_node = get_node
+        self.block_size = block_size
+        self.thread_pool = thread_pool
+        self.process_pool = process_pool
+        self.workbench = workbench
+        #: Duration in seconds of the last computation of each step, fused
+        #: steps being timed as a whole under the id of the last one.
+        self.timings: TDict[str, float] = {}
+        #: Key, token and value of the last result of each step.
+        self._results: TDict[str, TList[Any]] = {}
+        #: Last values and tokens of the pipeline inputs.
+        self._inputs: TDict[str, TList[Any]] = {}
+        #: Steps whose parameters changed while their inputs did not, whose
+        #: inputs are hence not fused with them (see _fuse).
+        self._tuned: Set[str] = set()
+        self._tokens = itertools.count()
+
+    def run(self, inputs: Mapping[str, Any]) -> TDict[str, Any]:
+        """Run the pipeline and return its outputs.
+
+        Only the steps on which the outputs depend and whose inputs or
+        parameters changed since the last run are executed.
+
+        """
+        pipeline = self.pipeline
+        missing = [n for n in pipeline.inputs if n not in inputs]
+        if missing:
+            raise KeyError(f"Missing pipeline inputs: {missing}")
+
+        tokens: TDict[str, int] = {}
+        for name in pipeline.inputs:
+            last = self._inputs.get(name)
+            if last is None or last[0] is not inputs[name]:
+                last = self._inputs[name] = [inputs[name], next(self._tokens)]
+            tokens[name] = last[1]
+
+        outputs = pipeline.output_steps()
+        order = self._needed_steps(pipeline.topological_order(), outputs.values())
+        consumers = self._count_consumers(order, outputs.values())
+
+        # Determine which steps must run, without computing anything.
+        dirty = []
+        for step in order:
+            key = (
+                step,
+                step.node_id,
+                step.revision,
+                tuple(tokens[n] for n in step.inputs),
+            )
+            entry = self._results.get(step.id)
+            if entry is None or entry[0] != key:
+                if entry is not None and entry[0][3] == key[3]:
+                    self._tuned.add(step.id)
+                entry = self._results[step.id] = [key, next(self._tokens), _CONSUMED]
+                dirty.append(step)
+            tokens[step.id] = entry[1]
+
+        # Results absorbed in a fused group (hence never stored) or consumed
+        # in place and needed by a step to run are computed again along with
+        # it, so that they can be fused.
+        dirty_ids = {s.id for s in dirty}
+        for step in reversed(order):
+            if step.id in dirty_ids:
+                for name in step.inputs:
+                    entry = self._results.get(name)
+                    if entry is not None and entry[2] is _CONSUMED:
+                        dirty_ids.add(name)
+        dirty = [s for s in order if s.id in dirty_ids]
+
+        self._execute(dirty, inputs, consumers)
+
+        # Forget about removed steps and inputs
+        for sid in set(self._results) - {s.id for s in pipeline.steps}:
+            del self._results[sid]
+            self.timings.pop(sid, None)
+            self._tuned.discard(sid)
+        for name in set(self._inputs) - set(pipeline.inputs):
+            del self._inputs[name]
+
+        return {k: self._value(sid, inputs, consumers) for k, sid in outputs.items()}
+
+    def invalidate(self, step_ids: Optional[Set[str]] = None) -> None:
+        """Discard cached results, for all steps by default."""
+        if step_ids is None:
+            self._results.clear()
+            self._inputs.clear()
+        else:
+            for sid in step_ids:
+                self._results.pop(sid, None)
+
+    def run_chunked(
+        self,
+        blocks: Iterable[Mapping[str, Any]],
+        constants: Optional[Mapping[str, Any]] = None,
+    ) -> TDict[str, Any]:
+        """Run the pipeline over successive blocks of its inputs.
+
+        Elementwise steps are computed on each block and the results of
+        reduction steps (nodes with an accumulator) are combined across
+        blocks, so that only one block is in memory at a time. Steps using
+        only reduction results or constants are computed once. Results are not
+        cached.
+
+        Parameters
+        ----------
+        blocks : Iterable[Mapping[str, Any]]
+            Successive blocks (rows along the first axis) of the pipeline
+            inputs which are not constants.
+        constants : Optional[Mapping[str, Any]]
+            Values of the pipeline inputs which are not split in blocks.
+
+        Raises
+        ------
+        ValueError
+            Raised if an output depends on the blocks without going through a
+            reduction or if a step cannot be computed by blocks.
+
+        """
+        pipeline = self.pipeline
+        outputs = pipeline.output_steps()
+        order = self._needed_steps(pipeline.topological_order(), outputs.values())
+        consumers = self._count_consumers(order, outputs.values())
+        values = dict(constants or {})
+        # Values computed on each block and values known only after the last.
+        streamed = set(pipeline.inputs) - set(values)
+        late: Set[str] = set()
+        before, per_block, reductions, after = [], [], [], []
+        accumulators = {}
+        for step in order:
+            node = self.get_node(step.node_id)
+            uses_blocks = streamed.intersection(step.inputs)
+            if uses_blocks and late.intersection(step.inputs):
+                raise ValueError(
+                    f"Step {step.id} combines blocks of data with a reduction "
+                    "result, which requires several passes over the data."
+                )
+            if uses_blocks and node.kind.reduction:
+                if node.accumulator is None:
+                    raise ValueError(
+                        f"Step {step.id} uses the reduction {step.node_id} which "
+                        "provides no accumulator and cannot be run by blocks."
+                    )
+                accumulators[step.id] = node.accumulator(**step.parameters)
+                reductions.append(step)
+                late.add(step.id)
+            elif uses_blocks and node.kind.elementwise:
+                per_block.append(step)
+                streamed.add(step.id)
+            elif uses_blocks:
+                raise ValueError(
+                    f"Step {step.id} uses node {step.node_id} which is neither "
+                    "elementwise nor a reduction and cannot be run by blocks."
+                )
+            elif late.intersection(step.inputs):
+                after.append(step)
+                late.add(step.id)
+            else:
+                before.append(step)
+        streamed_outputs = [k for k, sid in outputs.items() if sid in streamed]
+        if streamed_outputs:
+            raise ValueError(
+                f"The outputs {streamed_outputs} are not reduced and cannot be "
+                "computed by blocks."
+            )
+
+        self.timings = {}
+        for step in before:
+            self._run_step(step, values, consumers)
+        for block in blocks:
+            block_values = dict(values)
+            block_values.update(block)
+            for step in per_block:
+                self._run_step(step, block_values, consumers)
+            for step in reductions:
+                func = partial(
+                    accumulators[step.id].update,
+                    *(block_values[n] for n in step.inputs),
+                )
+                duration = _timed(func)[1]
+                self.timings[step.id] = self.timings.get(step.id, 0) + duration
+        for step in reductions:
+            values[step.id] = accumulators[step.id].result()
+        for step in after:
+            self._run_step(step, values, consumers)
+
+        return {k: values[sid] for k, sid in outputs.items()}
+
+    # --- Private API
+
+    def _run_step(
+        self, step: PipelineStep, values: TDict[str, Any], consumers: Mapping[str, int]
+    ) -> None:
+        """Compute a step from known values, accumulating its duration."""
+        node = self.get_node(step.node_id)
+        args = [values[n] for n in step.inputs]
+        if node.operate_in_place and args:
+            first = step.inputs[0]
+            # Only the results of steps used once can be modified.
+            if not (
+                first not in self.pipeline.inputs
+                and consumers.get(first, 0) == 1
+                and step.inputs.count(first) == 1
+            ):
+                args[0] = _copy(args[0])
+        values[step.id], duration = _timed(self._bind(node, args, step.parameters))
+        self.timings[step.id] = self.timings.get(step.id, 0) + duration
+
+    def _execute(
+        self,
+        steps: TList[PipelineStep],
+        inputs: Mapping[str, Any],
+        consumers: Mapping[str, int],
+    ) -> None:
+        """Execute steps, fusing elementwise chains and running independent
+        groups concurrently when a pool is available.
+
+        """
+        groups = self._fuse(steps, consumers)
+        if self.thread_pool is None or len(groups) < 2:
+            for group in groups:
+                func, _ = self._prepare(group, inputs, consumers)
+                self._store(group, *_timed(func))
+            return
+
+        # Dependencies between groups, a group being ready once the groups
+        # computing its inputs are done.
+        producers = {s.id: i for i, group in enumerate(groups) for s in group}
+        pending: TList[Set[int]] = [set() for _ in groups]
+        users: TList[TList[int]] = [[] for _ in groups]
+        for i, group in enumerate(groups):
+            for name in (n for s in group for n in s.inputs):
+                j = producers.get(name, i)
+                if j != i and j not in pending[i]:
+                    pending[i].add(j)
+                    users[j].append(i)
+
+        ready = [i for i, deps in enumerate(pending) if not deps]
+        running: TDict[Future, int] = {}
+        try:
+            while ready or running:
+                for i in ready:
+                    # Inputs are gathered here so that only pure computations
+                    # run outside of this thread.
+                    func, portable = self._prepare(groups[i], inputs, consumers)
+                    pool = self.thread_pool
+                    if portable and self.process_pool is not None:
+                        pool = self.process_pool
+                    running[pool.submit(_timed, func)] = i
+                ready = []
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    self._store(groups[i], *future.result())
+                    for j in users[i]:
+                        pending[j].discard(i)
+                        if not pending[j]:
+                            ready.append(j)
+        finally:
+            # Never leave computations running in the background.
+            wait(running)
+
+    def _prepare(
+        self,
+        group: TList[PipelineStep],
+        inputs: Mapping[str, Any],
+        consumers: Mapping[str, int],
+    ) -> Tuple[Callable[[], Any], bool]:
+        """Bind the function computing a group to the values of its inputs.
+
+        Returns the function and whether it can be run in another process.
+
+        """
+        if len(group) > 1:
+            members = {s.id for s in group}
+            external = {}
+            for s in group:
+                for name in s.inputs:
+                    if name not in members and name not in external:
+                        external[name] = self._value(name, inputs, consumers)
+            return partial(self._compute_fused, group, external), False
+
+        step = group[0]
+        node = self.get_node(step.node_id)
+        args = [self._value(name, inputs, consumers) for name in step.inputs]
+        if node.operate_in_place and args:
+            first = step.inputs[0]
+            if (
+                first in self._results
+                and consumers.get(first, 0) == 1
+                and step.inputs.count(first) == 1
+            ):
+                # Sole user of the result: the cached value is given away.
+                self._results[first][2] = _CONSUMED
+            else:
+                args[0] = _copy(args[0])
+        portable = node.pure_python and not node.kind.needs_workbench
+        return self._bind(node, args, step.parameters), portable
+
+    def _bind(
+        self, node: Node, args: TList[Any], parameters: Mapping[str, Any]
+    ) -> Callable[[], Any]:
+        """Bind the function of a node to its arguments."""
+        if node.kind.needs_workbench:
+            return partial(node.func, *args, workbench=self.workbench, **parameters)
+        return partial(node.func, *args, **parameters)
+
+    def _store(self, group: TList[PipelineStep], value: Any, duration: float):
+        """Store the result of a group and the time it took to compute."""
+        root = group[-1]
+        self._results[root.id][2] = value
+        self.timings[root.id] = duration
+
+    def _fuse(
+        self, steps: TList[PipelineStep], consumers: Mapping[str, int]
+    ) -> TList[TList[PipelineStep]]:
+        """Group the steps to execute, in order.
+
+        Inlineable elementwise steps whose result is only used by another such
+        step are grouped with it, so that the group can be evaluated block by
+        block without materializing the intermediate results.
+
+        Steps whose parameters were changed without their inputs changing are
+        likely to be tuned again: their inputs are not grouped with them so
+        that the result of the group computing them is cached and reused.
+
+        """
+        fusible = {}
+        for s in steps:
+            node = self.get_node(s.node_id)
+            if node.inlineable and node.kind.elementwise and not node.operate_in_place:
+                fusible[s.id] = s
+
+        positions = {s.id: i for i, s in enumerate(steps)}
+        absorbed: Set[str] = set()
+        groups = []
+        for step in reversed(steps):
+            if step.id in absorbed:
+                continue
+            group = [step]
+            if step.id in fusible:
+                stack = [step]
+                while stack:
+                    member = stack.pop()
+                    if member.id in self._tuned:
+                        continue
+                    for name in member.inputs:
+                        if (
+                            name in fusible
+                            and name not in absorbed
+                            and consumers.get(name, 0) == 1
+                        ):
+                            absorbed.add(name)
+                            group.append(fusible[name])
+                            stack.append(fusible[name])
+            # Members were collected from the root, steps are in topological
+            # order hence sorting by position restores a valid order.
+            group.sort(key=lambda s: positions[s.id])
+            groups.append(group)
+        groups.reverse()
+        return groups
+
+    def _compute_fused(
+        self, group: TList[PipelineStep], external: Mapping[str, Any]
+    ) -> Any:
+        """Evaluate a group of elementwise steps block by block.
+
+        The blocks span whole rows along the first axis of the largest array
+        inputs, other inputs (scalars, broadcast arrays) being passed whole.
+        Groups whose inputs are not all numpy arrays or scalars are evaluated
+        step by step.
+
+        """
+        arrays = [v for v in external.values() if isinstance(v, np.ndarray)]
+        if not arrays or not all(
+            isinstance(v, (np.ndarray, np.generic, int, float, complex, bool))
+            for v in external.values()
+        ):
+            return self._compute_sequence(group, external)
+        ndim = max(a.ndim for a in arrays)
+        length = next(a.shape[0] for a in arrays if a.ndim == ndim) if ndim else 0
+        blocked = [
+            k
+            for k, v in external.items()
+            if isinstance(v, np.ndarray) and v.ndim == ndim and v.shape[0] == length
+        ]
+        row_size = max(int(np.prod(arrays[0].shape[1:])) if ndim else 1, 1)
+        rows = max(1, self.block_size // row_size)
+        if not ndim or length <= rows:
+            return self._compute_sequence(group, external)
+
+        out = None
+        for start in range(0, length, rows):
+            stop = min(start + rows, length)
+            values = dict(external)
+            for k in blocked:
+                values[k] = external[k][start:stop]
+            result = self._compute_sequence(group, values)
+            if out is None:
+                result = np.asarray(result)
+                if result.ndim != ndim or result.shape[0] != stop - start:
+                    # Not elementwise after all, fall back to whole arrays.
+                    return self._compute_sequence(group, external)
+                out = np.empty((length,) + result.shape[1:], dtype=result.dtype)
+            out[start:stop] = result
+        return out
+
+    def _compute_sequence(
+        self, group: TList[PipelineStep], values: Mapping[str, Any]
+    ) -> Any:
+        """Call the functions of a group of steps one after the other."""
+        values = dict(values)
+        for s in group:
+            node = self.get_node(s.node_id)
+            args = [values[n] for n in s.inputs]
+            values[s.id] = self._bind(node, args, s.parameters)()
+        return values[group[-1].id]
+
+    def _compute(
+        self,
+        step: PipelineStep,
+        inputs: Mapping[str, Any],
+        consumers: Mapping[str, int],
+    ) -> Any:
+        """Call the function of a step on the current values of its inputs."""
+        func, _ = self._prepare([step], inputs, consumers)
+        value, self.timings[step.id] = _timed(func)
+        return value
+
+    def _value(
+        self, name: str, inputs: Mapping[str, Any], consumers: Mapping[str, int]
+    ) -> Any:
+        """Value of an input or step result, computing it if needed."""
+        if name not in self._results:
+            return inputs[name]
+        entry = self._results[name]
+        if entry[2] is _CONSUMED:
+            # Modified in place by a step or never computed.
+            entry[2] = self._compute(self.pipeline.get_step(name), inputs, consumers)
+        return entry[2]
+
+    @staticmethod
+    def _needed_steps(order: TList[PipelineStep], targets) -> TList[PipelineStep]:
+        """Restrict an ordered list of steps to the ones the targets need."""
+        needed = set(targets)
+        kept = []
+        for step in reversed(order):
+            if step.id in needed:
+                kept.append(step)
+                needed.update(step.inputs)
+        kept.reverse()
+        return kept
+
+    @staticmethod
+    def _count_consumers(order: TList[PipelineStep], targets) -> TDict[str, int]:
+        """Number of users of each value, outputs counting as one."""
+        consumers: TDict[str, int] = {}
+        for name in itertools.chain((n for s in order for n in s.inputs), targets):
+            consumers[name] = consumers.get(name, 0) + 1
+        return consumers
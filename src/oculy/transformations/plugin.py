@@ -8,31 +8,32 @@
 """Logic for the data transformation plugin.
 
 """
-from typing import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict as TDict, List as TList, Mapping, Optional, Tuple
 
 import numpy as np
-from atom.api import List, Typed
-<<<<<<< HEAD
-from glaze.utils.plugin_tools import (
-=======
+import xarray
+from atom.api import Int, List, Typed
 from gild.utils.plugin_tools import (
->>>>>>> 3424926e48aff6ac586ecc9f118c1b9e11fd9484
     ExtensionsCollector,
     HasPreferencesPlugin,
     make_extension_validator,
 )
 
-from . import MaskSpecification
+from . import And, MaskExpression, MaskLeaf, Masks, Not, as_mask_expression
+from .export import export_pipeline
+from .mask_cache import MaskCache
 from .masks import Mask
-from .node import Node
+from .node import Node, classify_node
+from .pipeline import Pipeline, PipelineExecutor
+from .sorted_index import SortedIndexCache
 
 MASKING_POINT = "oculy.transformers.masking"
 
 NODES_POINT = "oculy.transformers.compute_nodes"
 
 
-# FIXME add proper node support (namespaced and with automatic classification
-# based on signature)
+# FIXME add proper node support (namespaced)
 class TransformerPlugin(HasPreferencesPlugin):
     """
     Plugin responsible for handling data transformation including masking.
@@ -44,6 +45,26 @@ class TransformerPlugin(HasPreferencesPlugin):
     #: Collect all contributed Node extensions.
     nodes = Typed(ExtensionsCollector)
 
+    #: Number of elements processed at once when computing a mask. Chunks
+    #: should be small enough for the temporaries to stay in cache.
+    mask_chunk_size = Int(1 << 16).tag(pref=True)
+
+    #: Number of computed masks to keep in cache. The cache avoids computing
+    #: masks again when the same filters are applied to the same data.
+    mask_cache_size = Int(16).tag(pref=True)
+
+    #: Number of elements per block when evaluating fused elementwise steps of
+    #: a pipeline.
+    pipeline_block_size = Int(1 << 16).tag(pref=True)
+
+    #: Number of threads running independent steps of a pipeline concurrently.
+    #: Steps run sequentially in the calling thread if 0.
+    pipeline_threads = Int(4).tag(pref=True)
+
+    #: Number of processes running the steps of pure Python nodes. Such steps
+    #: run in the threads if 0.
+    pipeline_processes = Int(0).tag(pref=True)
+
     def start(self) -> None:
         """Start the plugin life-cycle.
 
@@ -73,6 +94,8 @@ class TransformerPlugin(HasPreferencesPlugin):
             validate_ext=validator,
         )
 
+        self.nodes.observe("contributions", self._update_nodes)
+
         self.nodes.start()
 
         core.invoke_command("gild.errors.exit_error_gathering")
@@ -90,38 +113,276 @@ class TransformerPlugin(HasPreferencesPlugin):
         self.nodes.stop()
         del self.nodes
 
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False)
+        del self._thread_pool, self._process_pool
+
     # FIXME use numpy.typing when available
-    # FIXME docstring
     def create_mask(
         self,
-        filter_base: Mapping[str, np.ndarray],
-        specifications: Mapping[str, MaskSpecification],
-    ) -> np.ndarray:
-        """[summary]
+        filter_base: Mapping[str, Any],
+        specifications: Masks,
+    ) -> Optional[np.ndarray]:
+        """Compute the mask described by mask specifications or an expression.
+
+        The masks are evaluated in a single pass over chunks of the data: the
+        result is allocated once and each chunk is combined in place, so that
+        the only other memory used are chunk-sized scratch buffers (one per
+        level of the expression) no matter the number of masks. Evaluation is
+        short-circuited per chunk: the remaining children of an And (resp. Or)
+        are skipped once the chunk is all False (resp. True).
 
         Parameters
         ----------
-        filter_base : Mapping[str, np.ndarray]
-            [description]
-        specifications : Mapping[str, MaskSpecification]
-            [description]
+        filter_base : Mapping[str, Any]
+            Arrays (numpy or xarray) on which to compute the masks. All arrays
+            used must have the same shape.
+        specifications : Masks
+            Mask to apply to each array of filter_base whose results are
+            ANDed, or a mask expression.
 
         Returns
         -------
-        np.ndarray
-            [description]
+        Optional[np.ndarray]
+            Boolean mask, as an xarray.DataArray if the arrays were, None if no
+            specification was provided.
+
+        """
+        if not isinstance(specifications, MaskExpression) and not specifications:
+            return None
+        expression = as_mask_expression(specifications)
+
+        names = expression.columns()
+        columns = {}
+        shape = None
+        for k in names:
+            column = np.asarray(filter_base[k])
+            if shape is None:
+                shape = column.shape
+            elif column.shape != shape:
+                raise ValueError(
+                    f"Cannot mask using {k} whose shape {column.shape} differs "
+                    f"from the one of the other arrays ({shape})."
+                )
+            # Scalars are handled as arrays of one element.
+            columns[k] = column if column.shape else column.reshape(1)
+
+        arrays = [columns[k] for k in names]
+        try:
+            result = self._mask_cache.get(expression, arrays)
+        except TypeError:
+            # Expressions with unhashable arguments cannot be cached.
+            result = cacheable = None
+        else:
+            cacheable = True
+        if result is None:
+            result = self._compute_mask(expression, columns, shape)
+            if cacheable:
+                self._mask_cache.set(expression, arrays, result)
+
+        base = filter_base[names[0]]
+        if isinstance(base, xarray.DataArray):
+            return xarray.DataArray(result, coords=base.coords, dims=base.dims)
+        return result
+
+    def get_node(self, id: str) -> Node:
+        """Access a contributed Node, masks being usable as nodes.
+
+        Raises
+        ------
+        KeyError
+            Raised if no node or mask with that id was contributed.
+
+        """
+        node = self.nodes.contributions.get(id)
+        if node is None:
+            node = self._masks.contributions.get(id)
+        if node is None:
+            raise KeyError(
+                f"No node or mask {id}, known nodes: {list(self.nodes.contributions)}"
+            )
+        return node
+
+    def create_executor(self, pipeline: Pipeline) -> PipelineExecutor:
+        """Create an executor running a pipeline using the contributed nodes.
+
+        All executors share the pools of the plugin.
+
+        """
+        if self._thread_pool is None and self.pipeline_threads > 0:
+            self._thread_pool = ThreadPoolExecutor(
+                self.pipeline_threads, thread_name_prefix="oculy-pipeline"
+            )
+        if self._process_pool is None and self.pipeline_processes > 0:
+            self._process_pool = ProcessPoolExecutor(self.pipeline_processes)
+        return PipelineExecutor(
+            pipeline,
+            self.get_node,
+            self.pipeline_block_size,
+            self._thread_pool,
+            self._process_pool,
+            self.workbench,
+        )
+
+    def export_pipeline(self, pipeline: Pipeline, inline: bool = True) -> str:
+        """Source of a standalone module running a pipeline.
+
+        The module calls the functions of the contributed nodes and can be
+        used to process many files without the application, see
+        oculy.transformations.export.
+
+        """
+        return export_pipeline(pipeline, self.get_node, inline)
+
+    def clear_mask_cache(self) -> None:
+        """Discard all cached masks.
+
+        Masks are cached based on the identity of the arrays used to compute
+        them, this should be called if such arrays are modified in place.
+
         """
-        mask = None
-        for k, v in specifications.items():
-            temp = self._masks.contributions[v[0]].func(filter_base[k], *v[1])
-            mask = mask & temp if mask is not None else temp
-        return mask
+        self._mask_cache.clear()
+        self._sorted_indexes.clear()
 
     # --- Private API --------------------------------------------------------
 
     #: Collect all contributed Mask extensions.
     _masks = Typed(ExtensionsCollector)
 
+    #: Sorted indexes of the columns repeatedly used by range masks.
+    _sorted_indexes = Typed(SortedIndexCache, ())
+
+    #: Recently computed masks.
+    _mask_cache = Typed(MaskCache, ())
+
+    #: Threads shared by the pipeline executors, created on first use.
+    _thread_pool = Typed(ThreadPoolExecutor)
+
+    #: Processes shared by the pipeline executors, created on first use.
+    _process_pool = Typed(ProcessPoolExecutor)
+
+    def _compute_mask(
+        self,
+        expression: MaskExpression,
+        columns: Mapping[str, np.ndarray],
+        shape: Tuple[int, ...],
+    ) -> np.ndarray:
+        """Evaluate an expression over chunks of the columns."""
+        # Chunks span whole rows along the first axis.
+        flat_shape = shape or (1,)
+        rows = max(1, self.mask_chunk_size // max(int(np.prod(flat_shape[1:])), 1))
+        result = np.empty(flat_shape, dtype=bool)
+        # Range masks on indexed columns are answered by binary search. Leaves
+        # are identified by id since their arguments may not be hashable, and
+        # bounds which are arrays (broadcast against the column) are left to
+        # the elementwise evaluation.
+        precomputed: TDict[int, np.ndarray] = {}
+        for leaf in expression.leaves():
+            mask = self._masks.contributions[leaf.mask_id]
+            if mask.interval is None or id(leaf) in precomputed:
+                continue
+            interval = mask.interval(*leaf.args)
+            if np.ndim(interval[0]) or np.ndim(interval[1]):
+                continue
+            column = columns[leaf.column]
+            index = self._sorted_indexes.get(column)
+            if index is None:
+                continue
+            if mask.exact_interval:
+                precomputed[id(leaf)] = index.mask(column, *interval)
+            else:
+                # Check the candidates selected by the interval using func
+                candidates = index.rows(column, *interval)
+                selected = mask.func(column[candidates], *leaf.args)
+                exact = np.zeros(len(column), dtype=bool)
+                exact[candidates[selected]] = True
+                precomputed[id(leaf)] = exact
+
+        scratch: TList[np.ndarray] = []
+        for start in range(0, flat_shape[0], rows):
+            chunk = slice(start, start + rows)
+            self._evaluate(
+                expression, columns, precomputed, chunk, result[chunk], scratch, 0
+            )
+        return result.reshape(shape)
+
+    def _evaluate(
+        self,
+        expression: MaskExpression,
+        columns: Mapping[str, np.ndarray],
+        precomputed: Mapping[int, np.ndarray],
+        chunk: slice,
+        out: np.ndarray,
+        scratch: TList[np.ndarray],
+        depth: int,
+    ) -> None:
+        """Evaluate an expression on a chunk of the data, writing into out.
+
+        precomputed holds the full masks of the leaves already evaluated (by
+        id) and scratch one reusable buffer per depth of the expression.
+
+        """
+        if id(expression) in precomputed:
+            out[...] = precomputed[id(expression)][chunk]
+        elif isinstance(expression, MaskLeaf):
+            mask = self._masks.contributions[expression.mask_id]
+            values = columns[expression.column][chunk]
+            if mask.out_parameter:
+                mask.func(values, *expression.args, out=out)
+            else:
+                out[...] = mask.func(values, *expression.args)
+        elif isinstance(expression, Not):
+            self._evaluate(
+                expression.child, columns, precomputed, chunk, out, scratch, depth
+            )
+            np.logical_not(out, out=out)
+        else:
+            is_and = isinstance(expression, And)
+            children = expression.children
+            self._evaluate(
+                children[0], columns, precomputed, chunk, out, scratch, depth
+            )
+            if len(children) == 1:
+                return
+            if len(scratch) <= depth:
+                scratch.append(np.empty_like(out))
+            temp = scratch[depth][: len(out)]
+            for child in children[1:]:
+                # Short-circuit once the result of the chunk is known
+                if is_and and not out.any() or not is_and and out.all():
+                    break
+                self._evaluate(
+                    child, columns, precomputed, chunk, temp, scratch, depth + 1
+                )
+                if is_and:
+                    np.logical_and(out, temp, out=out)
+                else:
+                    np.logical_or(out, temp, out=out)
+
+    def _post_setattr_mask_cache_size(self, old: int, new: int) -> None:
+        self._mask_cache.max_size = new
+        self._mask_cache.clear()
+
+    # Existing executors keep using the previous pools, whose workers exit once
+    # no executor uses them anymore.
+
+    def _post_setattr_pipeline_threads(self, old: int, new: int) -> None:
+        self._thread_pool = None
+
+    def _post_setattr_pipeline_processes(self, old: int, new: int) -> None:
+        self._process_pool = None
+
+    def _update_nodes(self, change):
+        """Classify the contributed nodes once so that executors do not
+        inspect their functions."""
+        for node in self.nodes.contributions.values():
+            node.kind = classify_node(node)
+
     def _update_masks(self, change):
         """Update the list of contributed masks ids."""
         self.masks = list(self._masks.contributions)
+        for mask in self._masks.contributions.values():
+            mask.kind = classify_node(mask)
+        # Cached results may have been computed by a mask that changed
+        self._mask_cache.clear()
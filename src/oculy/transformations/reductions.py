@@ -0,0 +1,149 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Reduction nodes and the accumulators combining their results over blocks.
+
+Reductions apply to all the values of an array. When a pipeline is executed
+by blocks, the accumulator of a reduction node is fed the blocks one after
+the other and only holds the (small) combined result.
+
+"""
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+from .node import Scalar
+
+# FIXME once numpy 1.21 is out can use numpy.typing
+
+
+def sum_values(a: np.ndarray) -> Scalar:
+    return np.sum(a)
+
+
+def mean_values(a: np.ndarray) -> Scalar:
+    return np.mean(a)
+
+
+def min_values(a: np.ndarray) -> Scalar:
+    return np.min(a)
+
+
+def max_values(a: np.ndarray) -> Scalar:
+    return np.max(a)
+
+
+def histogram(
+    a: np.ndarray, bins: int = 10, range: Optional[Tuple[float, float]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    return np.histogram(a, bins, range)
+
+
+class Accumulator:
+    """Combine the results of a reduction over successive blocks of data.
+
+    Accumulators are created with the parameters of the reduction.
+
+    """
+
+    def update(self, a: np.ndarray) -> None:
+        """Account for a new block of data."""
+        raise NotImplementedError
+
+    def result(self) -> Any:
+        """Result of the reduction over all the blocks seen so far."""
+        raise NotImplementedError
+
+
+class SumAccumulator(Accumulator):
+    """Accumulator for sum_values."""
+
+    def __init__(self) -> None:
+        self._total: Any = 0
+
+    def update(self, a: np.ndarray) -> None:
+        self._total = self._total + np.sum(a)
+
+    def result(self) -> Any:
+        return self._total
+
+
+class MeanAccumulator(Accumulator):
+    """Accumulator for mean_values, NaN if no value was seen."""
+
+    def __init__(self) -> None:
+        self._total: Any = 0
+        self._count = 0
+
+    def update(self, a: np.ndarray) -> None:
+        self._total = self._total + np.sum(a)
+        self._count += np.size(a)
+
+    def result(self) -> Any:
+        return self._total / self._count if self._count else np.nan
+
+
+class MinAccumulator(Accumulator):
+    """Accumulator for min_values, NaN if no value was seen."""
+
+    def __init__(self) -> None:
+        self._value: Any = None
+
+    def update(self, a: np.ndarray) -> None:
+        if np.size(a):
+            value = np.min(a)
+            # Propagate NaN whatever the block it appears in, as np.min does
+            self._value = (
+                value if self._value is None else np.minimum(self._value, value)
+            )
+
+    def result(self) -> Any:
+        return np.nan if self._value is None else self._value
+
+
+class MaxAccumulator(Accumulator):
+    """Accumulator for max_values, NaN if no value was seen."""
+
+    def __init__(self) -> None:
+        self._value: Any = None
+
+    def update(self, a: np.ndarray) -> None:
+        if np.size(a):
+            value = np.max(a)
+            # Propagate NaN whatever the block it appears in, as np.max does
+            self._value = (
+                value if self._value is None else np.maximum(self._value, value)
+            )
+
+    def result(self) -> Any:
+        return np.nan if self._value is None else self._value
+
+
+class HistogramAccumulator(Accumulator):
+    """Accumulator for histogram.
+
+    The bins must be known before seeing the data: a range is required unless
+    the bin edges are given explicitly.
+
+    """
+
+    def __init__(
+        self, bins: Any = 10, range: Optional[Tuple[float, float]] = None
+    ) -> None:
+        if np.ndim(bins) == 0 and range is None:
+            raise ValueError(
+                "A range or explicit bin edges are required to compute a "
+                "histogram by blocks."
+            )
+        self._edges = np.histogram_bin_edges([], bins, range)
+        self._counts = np.zeros(len(self._edges) - 1, dtype=np.intp)
+
+    def update(self, a: np.ndarray) -> None:
+        self._counts += np.histogram(a, self._edges)[0]
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self._counts.copy(), self._edges
@@ -0,0 +1,162 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Binning of scattered 2D data onto a regular grid.
+
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .reductions import Accumulator
+
+#: Supported ways to aggregate the values falling in the same cell.
+AGGREGATIONS = ("mean", "count", "sum", "last")
+
+
+def bin_to_grid(
+    x: np.ndarray,
+    y: np.ndarray,
+    c: np.ndarray,
+    x_bins: int = 100,
+    y_bins: int = 100,
+    x_range: Optional[Tuple[float, float]] = None,
+    y_range: Optional[Tuple[float, float]] = None,
+    aggregation: str = "mean",
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Bin scattered (x, y, c) points onto a regular grid.
+
+    Parameters
+    ----------
+    x, y, c : np.ndarray
+        Coordinates and values of the points, all of the same shape.
+    x_bins, y_bins : int
+        Number of cells along each axis.
+    x_range, y_range : Optional[Tuple[float, float]]
+        Extent of the grid along each axis, by default the extent of the
+        finite coordinates. Points outside the grid are ignored.
+    aggregation : str
+        How to aggregate the values falling in the same cell, one of "mean",
+        "count", "sum" or "last".
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        Centers of the cells along x and y and the (x_bins, y_bins) grid of
+        aggregated values. Empty cells are NaN, or 0 for count and sum.
+
+    """
+    x, y = np.ravel(x), np.ravel(y)
+    if x_range is None:
+        x_range = _finite_range(x)
+    if y_range is None:
+        y_range = _finite_range(y)
+    binner = GridBinner(x_bins, y_bins, x_range, y_range, aggregation)
+    binner.update(x, y, c)
+    return binner.result()
+
+
+class GridBinner(Accumulator):
+    """Bin points onto a regular grid as they arrive.
+
+    The grid is fixed hence its extent must be known. The accumulated state
+    (per cell sums, counts or last values) is only as large as the grid. It
+    can be used as the accumulator of bin_to_grid when running a pipeline by
+    blocks.
+
+    Parameters are the ones of bin_to_grid, the ranges being mandatory.
+
+    """
+
+    def __init__(
+        self,
+        x_bins: int = 100,
+        y_bins: int = 100,
+        x_range: Optional[Tuple[float, float]] = None,
+        y_range: Optional[Tuple[float, float]] = None,
+        aggregation: str = "mean",
+    ) -> None:
+        if x_range is None or y_range is None:
+            raise ValueError("The extent of the grid is required to bin by parts.")
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(
+                f"Unknown aggregation {aggregation}, expected one of {AGGREGATIONS}"
+            )
+        self.aggregation = aggregation
+        self.x_edges = np.linspace(*x_range, x_bins + 1)
+        self.y_edges = np.linspace(*y_range, y_bins + 1)
+        size = x_bins * y_bins
+        self._counts = np.zeros(size, dtype=np.intp)
+        self._sums = np.zeros(size) if aggregation in ("mean", "sum") else None
+        self._last = np.full(size, np.nan) if aggregation == "last" else None
+
+    def update(self, x: np.ndarray, y: np.ndarray, c: np.ndarray) -> None:
+        """Add points to the grid."""
+        x, y, c = np.ravel(x), np.ravel(y), np.ravel(c)
+        cells, valid = self._cells(x, y)
+        c = c[valid]
+        size = len(self._counts)
+        self._counts += np.bincount(cells, minlength=size)
+        if self._sums is not None:
+            self._sums += np.bincount(cells, weights=c, minlength=size)
+        if self._last is not None and len(cells):
+            # Position of the last point of each cell, later points winning.
+            position = np.full(size, -1, dtype=np.intp)
+            np.maximum.at(position, cells, np.arange(len(cells)))
+            filled = position >= 0
+            self._last[filled] = c[position[filled]]
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Cell centers and aggregated values of the points seen so far."""
+        shape = (len(self.x_edges) - 1, len(self.y_edges) - 1)
+        if self.aggregation == "count":
+            grid = self._counts.copy()
+        elif self.aggregation == "sum":
+            grid = self._sums.copy()
+        elif self.aggregation == "last":
+            grid = self._last.copy()
+        else:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                grid = self._sums / self._counts
+        return (
+            (self.x_edges[:-1] + self.x_edges[1:]) / 2,
+            (self.y_edges[:-1] + self.y_edges[1:]) / 2,
+            grid.reshape(shape),
+        )
+
+    # --- Private API
+
+    def _cells(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Flat index of the cell of each point within the grid."""
+        ix = _bin_index(x, self.x_edges)
+        iy = _bin_index(y, self.y_edges)
+        valid = (ix >= 0) & (iy >= 0)
+        return ix[valid] * (len(self.y_edges) - 1) + iy[valid], valid
+
+
+def _bin_index(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Index of the bin of regularly spaced edges each value falls in, -1 if
+    outside (the last edge being included).
+
+    """
+    bins = len(edges) - 1
+    low, high = edges[0], edges[-1]
+    with np.errstate(invalid="ignore"):
+        scaled = (values - low) * (bins / (high - low) if high > low else 0)
+        # Values just below high can be rounded up to bins.
+        index = np.minimum(np.floor(scaled), bins - 1)
+        index = index.astype(np.intp, casting="unsafe")
+        index[~((values >= low) & (values <= high))] = -1
+    return index
+
+
+def _finite_range(values: np.ndarray) -> Tuple[float, float]:
+    """Extent of the finite values."""
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return (0.0, 1.0)
+    return float(finite.min()), float(finite.max())
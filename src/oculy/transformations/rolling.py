@@ -0,0 +1,340 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Rolling and cumulative statistics nodes.
+
+Statistics are computed along the last axis over trailing windows: the value
+at index i uses the window values ending at i, the first windows being
+truncated so that the result has the shape of the input.
+
+Each statistic has a stream counterpart whose update method takes the values
+appended to a live stream and returns the statistic for them, keeping only
+the state needed (at most a window of values). StreamFollower feeds them the
+values appended to data store entries and appends their results to other
+entries.
+
+"""
+import heapq
+from collections import deque
+from typing import Any, Deque, Dict as TDict, List as TList, Mapping, Tuple
+
+import numpy as np
+from atom.api import Atom, Dict, Typed
+
+from oculy.data import DataArray, DataStore
+
+#: Number of elements processed at once by moving_median, to limit the size of
+#: temporaries.
+_BLOCK_SIZE = 1 << 20
+
+#: Window size from which moving_median uses heaps (O(log window) per value)
+#: rather than a vectorized partition of each window (O(window) per value).
+_HEAP_WINDOW = 192
+
+
+def moving_mean(a: np.ndarray, window: int = 10) -> np.ndarray:
+    """Mean over trailing windows, computed from cumulative sums."""
+    sums, counts = _window_sums(np.asarray(a, dtype=float), window)
+    return sums / counts
+
+
+def moving_std(a: np.ndarray, window: int = 10, ddof: int = 0) -> np.ndarray:
+    """Standard deviation over trailing windows, computed from cumulative sums.
+
+    Values are shifted by the first one before summing squares to limit the
+    loss of precision.
+
+    """
+    a = np.asarray(a, dtype=float)
+    if not a.shape[-1]:
+        return a.copy()
+    shifted = a - a[..., :1]
+    sums, counts = _window_sums(shifted, window)
+    squares, _ = _window_sums(shifted * shifted, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = (squares - sums * sums / counts) / (counts - ddof)
+    return np.sqrt(np.clip(variance, 0, None))
+
+
+def moving_median(a: np.ndarray, window: int = 10) -> np.ndarray:
+    """Median over trailing windows.
+
+    Small windows are strided views of the input whose medians are computed
+    by blocks, so that only a block of windows is copied at a time. Large
+    windows use the heaps of StreamMovingMedian. Values should not be NaN.
+
+    """
+    a = np.asarray(a)
+    n = a.shape[-1]
+    result = np.empty(a.shape, dtype=float)
+    if window >= _HEAP_WINDOW:
+        for index in np.ndindex(a.shape[:-1]):
+            result[index] = StreamMovingMedian(window).update(a[index])
+        return result
+    # Truncated windows at the beginning.
+    for i in range(min(window - 1, n)):
+        result[..., i] = np.median(a[..., : i + 1], axis=-1)
+    if n >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(a, window, axis=-1)
+        rows = max(1, _BLOCK_SIZE // (window * max(int(np.prod(a.shape[:-1])), 1)))
+        for start in range(0, windows.shape[-2], rows):
+            stop = min(start + rows, windows.shape[-2])
+            block = windows[..., start:stop, :]
+            result[..., window - 1 + start : window - 1 + stop] = np.median(
+                block, axis=-1
+            )
+    return result
+
+
+def cumulative_min(a: np.ndarray) -> np.ndarray:
+    """Minimum of all the values up to each index."""
+    return np.minimum.accumulate(a, axis=-1)
+
+
+def cumulative_max(a: np.ndarray) -> np.ndarray:
+    """Maximum of all the values up to each index."""
+    return np.maximum.accumulate(a, axis=-1)
+
+
+class StreamStatistic:
+    """Statistic of a 1D append-only stream."""
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        """Account for values appended to the stream and return the statistic
+        at their positions.
+
+        """
+        raise NotImplementedError
+
+
+class _TailStatistic(StreamStatistic):
+    """Rolling statistic computed by applying the array function to the last
+    window - 1 values of the stream followed by the new ones.
+
+    The cost of an update is proportional to the window and the number of
+    new values.
+
+    """
+
+    def __init__(self, window: int = 10, **parameters: Any) -> None:
+        self.window = window
+        self._parameters = parameters
+        self._tail = np.empty(0)
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        data = np.concatenate((self._tail, values))
+        result = self._function(data, self.window, **self._parameters)
+        self._tail = data[max(len(data) - self.window + 1, 0) :]
+        return result[len(data) - len(values) :]
+
+    @staticmethod
+    def _function(a: np.ndarray, window: int, **parameters: Any) -> np.ndarray:
+        raise NotImplementedError
+
+
+class StreamMovingMean(_TailStatistic):
+    """Stream counterpart of moving_mean."""
+
+    _function = staticmethod(moving_mean)
+
+
+class StreamMovingStd(_TailStatistic):
+    """Stream counterpart of moving_std."""
+
+    _function = staticmethod(moving_std)
+
+
+class StreamMovingMedian(StreamStatistic):
+    """Stream counterpart of moving_median.
+
+    The window is split between a max-heap of its lower half and a min-heap
+    of its upper half, values leaving the window being lazily removed when
+    they reach the top of a heap, so that each new value costs O(log window).
+    Values must not be NaN.
+
+    """
+
+    def __init__(self, window: int = 10) -> None:
+        self.window = window
+        self._values: Deque[float] = deque()
+        # Lower half with negated values and upper half.
+        self._low: TList[float] = []
+        self._high: TList[float] = []
+        # Number of valid values in each heap.
+        self._low_size = self._high_size = 0
+        # Values left the window but still in a heap.
+        self._removed: TDict[float, int] = {}
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        result = np.empty(len(values))
+        for i, value in enumerate(values.tolist()):
+            self._add(value)
+            self._values.append(value)
+            if len(self._values) > self.window:
+                self._remove(self._values.popleft())
+            if self._low_size > self._high_size:
+                result[i] = -self._low[0]
+            else:
+                result[i] = (self._high[0] - self._low[0]) / 2
+        return result
+
+    # --- Private API
+
+    def _add(self, value: float) -> None:
+        if not self._low or value <= -self._low[0]:
+            heapq.heappush(self._low, -value)
+            self._low_size += 1
+        else:
+            heapq.heappush(self._high, value)
+            self._high_size += 1
+        self._balance()
+
+    def _remove(self, value: float) -> None:
+        self._removed[value] = self._removed.get(value, 0) + 1
+        if value <= -self._low[0]:
+            self._low_size -= 1
+            if value == -self._low[0]:
+                self._prune(self._low, -1)
+        else:
+            self._high_size -= 1
+            if value == self._high[0]:
+                self._prune(self._high, 1)
+        self._balance()
+
+    def _balance(self) -> None:
+        """Keep the lower half as large or one larger than the upper one."""
+        if self._low_size > self._high_size + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        elif self._low_size < self._high_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._low_size += 1
+            self._high_size -= 1
+            self._prune(self._high, 1)
+
+    def _prune(self, heap: TList[float], sign: int) -> None:
+        """Pop the removed values from the top of a heap."""
+        while heap and self._removed.get(sign * heap[0]):
+            value = sign * heapq.heappop(heap)
+            self._removed[value] -= 1
+            if not self._removed[value]:
+                del self._removed[value]
+
+
+class StreamCumulativeMin(StreamStatistic):
+    """Stream counterpart of cumulative_min."""
+
+    def __init__(self) -> None:
+        self._value = np.inf
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        result = np.minimum.accumulate(np.append(self._value, values))[1:]
+        if len(result):
+            self._value = result[-1]
+        return result
+
+
+class StreamCumulativeMax(StreamStatistic):
+    """Stream counterpart of cumulative_max."""
+
+    def __init__(self) -> None:
+        self._value = -np.inf
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        result = np.maximum.accumulate(np.append(self._value, values))[1:]
+        if len(result):
+            self._value = result[-1]
+        return result
+
+
+class StreamFollower(Atom):
+    """Compute stream statistics of data store entries as values are appended.
+
+    The results for the values appended to a followed entry (see
+    DataStore.append_data) are appended to its output entry, in the same
+    update as the results for the other entries appended to at the same time.
+    Only the values still stored after the append are processed, so that the
+    samples of a chunk longer than the maximal length of the entry are missed.
+
+    Followed entries which are removed, or whose values are replaced rather
+    than appended to, stop being followed since the state of their statistic
+    no longer matches their values.
+
+    """
+
+    #: Data store whose entries are followed.
+    datastore = Typed(DataStore)
+
+    #: Output entry and statistic of each followed entry.
+    streams = Dict(str, tuple)
+
+    def __init__(self, datastore: DataStore, **kwargs) -> None:
+        super().__init__(datastore=datastore, **kwargs)
+        datastore.observe("update", self._handle_store_update)
+
+    def follow(self, path: str, output: str, statistic: StreamStatistic) -> None:
+        """Follow an entry, computing the statistic of its values in output.
+
+        The values the entry already holds are processed immediately.
+
+        """
+        self.streams[path] = (output, statistic)
+        try:
+            node = self.datastore.get_data([path])[path]
+        except KeyError:
+            return
+        if not isinstance(node, DataArray):
+            del self.streams[path]
+            raise TypeError(f"Only DataArray can be followed, {path} is not.")
+        if node.values is not None and len(node.values):
+            self.datastore.append_data({output: statistic.update(node.values)})
+
+    def unfollow(self, path: str) -> None:
+        """Stop following an entry, its output entry being left in the store."""
+        self.streams.pop(path, None)
+
+    def close(self) -> None:
+        """Stop following all entries."""
+        self.datastore.unobserve("update", self._handle_store_update)
+        self.streams.clear()
+
+    def _handle_store_update(self, change: Mapping[str, Any]) -> None:
+        """Update the statistics of the followed entries appended to."""
+        update = change["value"]
+        appended: TDict[str, Tuple[int, int, int]] = update["appended"]
+        for path in list(self.streams):
+            if (path in update["updated"] and path not in appended) or any(
+                path == r or path.startswith(r + "/") for r in update["removed"]
+            ):
+                del self.streams[path]
+
+        followed = [p for p in appended if p in self.streams]
+        if not followed:
+            return
+        data = self.datastore.get_data(followed)
+        results = {}
+        for path in followed:
+            output, statistic = self.streams[path]
+            start, stop, _ = appended[path]
+            results[output] = statistic.update(data[path].values[start:stop])
+        # Outputs being followed in turn are handled by the nested update.
+        self.datastore.append_data(results)
+
+
+def _window_sums(a: np.ndarray, window: int):
+    """Sums and number of values of the trailing windows along the last axis."""
+    n = a.shape[-1]
+    cumulative = np.zeros(a.shape[:-1] + (n + 1,))
+    np.cumsum(a, axis=-1, out=cumulative[..., 1:])
+    starts = np.maximum(np.arange(1, n + 1) - window, 0)
+    sums = cumulative[..., 1:] - cumulative[..., starts]
+    counts = np.arange(1, n + 1) - starts
+    return sums, counts
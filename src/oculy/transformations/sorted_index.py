@@ -0,0 +1,138 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Sorted index of columns allowing to answer range masks by binary search.
+
+"""
+import weakref
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class SortedIndex:
+    """Permutation sorting a 1D column and the sorted values.
+
+    The index does not keep a reference to the column, which must be passed
+    to the methods, so that it can be cached based on the column lifetime.
+    NaN values are sorted last and are never selected.
+
+    """
+
+    __slots__ = ("order", "sorted_values", "n_valid")
+
+    def __init__(self, column: np.ndarray) -> None:
+        #: Permutation sorting the column, None if the column is already sorted.
+        self.order: Optional[np.ndarray] = None
+        #: Values of the column in increasing order, None if already sorted.
+        self.sorted_values: Optional[np.ndarray] = None
+        if len(column) > 1 and not (column[:-1] <= column[1:]).all():
+            self.order = np.argsort(column, kind="stable")
+            self.sorted_values = column = column[self.order]
+        #: Number of values which are not NaN.
+        self.n_valid = len(column)
+        if column.dtype.kind == "f" and len(column):
+            self.n_valid = int(np.searchsorted(column, np.nan, side="left"))
+
+    def select(
+        self,
+        column: np.ndarray,
+        low: float,
+        high: float,
+        include_low: bool,
+        include_high: bool,
+    ) -> Tuple[int, int]:
+        """Range of the sorted values lying in an interval."""
+        values = column if self.sorted_values is None else self.sorted_values
+        values = values[: self.n_valid]
+        start = np.searchsorted(values, low, side="left" if include_low else "right")
+        stop = np.searchsorted(values, high, side="right" if include_high else "left")
+        return int(start), int(max(start, stop))
+
+    def mask(
+        self,
+        column: np.ndarray,
+        low: float,
+        high: float,
+        include_low: bool,
+        include_high: bool,
+    ) -> np.ndarray:
+        """Boolean mask of the column values lying in an interval."""
+        start, stop = self.select(column, low, high, include_low, include_high)
+        result = np.zeros(len(column), dtype=bool)
+        if self.order is None:
+            result[start:stop] = True
+        else:
+            result[self.order[start:stop]] = True
+        return result
+
+    def rows(
+        self,
+        column: np.ndarray,
+        low: float,
+        high: float,
+        include_low: bool,
+        include_high: bool,
+    ) -> np.ndarray:
+        """Positions in the column of the values lying in an interval."""
+        start, stop = self.select(column, low, high, include_low, include_high)
+        if self.order is None:
+            return np.arange(start, stop)
+        return self.order[start:stop]
+
+
+class SortedIndexCache:
+    """Cache of the sorted index of the most recently masked columns.
+
+    Building an index costs a sort, so an index is only built the second time
+    a column is requested: one-off masks keep using a plain scan while
+    repeated masking of the same column (as when dragging a slider) uses
+    binary search. Columns are identified by identity and must not be
+    modified in place once indexed.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximal number of indexes to keep.
+
+    """
+
+    def __init__(self, max_size: int = 8) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, Tuple[weakref.ref, Optional[SortedIndex]]]"
+        self._entries = OrderedDict()
+
+    def get(self, column: np.ndarray) -> Optional[SortedIndex]:
+        """Access the index of a column, if it is worth building."""
+        if column.ndim != 1 or column.dtype.kind not in "iuf":
+            return None
+        key = id(column)
+        entry = self._entries.get(key)
+        if entry is None or entry[0]() is not column:
+            ref = weakref.ref(column, lambda _, key=key: self._entries.pop(key, None))
+            self._store(key, (ref, None))
+            return None
+        ref, index = entry
+        if index is None:
+            index = SortedIndex(column)
+            self._store(key, (ref, index))
+        else:
+            self._entries.move_to_end(key)
+        return index
+
+    def clear(self) -> None:
+        """Discard all indexes."""
+        self._entries.clear()
+
+    # --- Private API
+
+    def _store(self, key: int, entry: Tuple[weakref.ref, Optional[SortedIndex]]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,186 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Spectral analysis nodes.
+
+Traces are taken along the last axis, leading axes being treated as a stack of
+traces processed at once. Windows and frequency axes are cached per length.
+
+"""
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+#: Number of elements processed at once when splitting traces in segments, to
+#: limit the size of temporaries.
+_BLOCK_SIZE = 1 << 22
+
+#: Functions building symmetric windows of a given length.
+_WINDOWS = {
+    "boxcar": np.ones,
+    "hann": np.hanning,
+    "hamming": np.hamming,
+    "blackman": np.blackman,
+}
+
+
+@lru_cache(maxsize=32)
+def get_window(name: str, length: int) -> np.ndarray:
+    """Periodic window (as suited for spectral analysis) of a given length.
+
+    The returned array is shared and read-only.
+
+    """
+    if name not in _WINDOWS:
+        raise ValueError(f"Unknown window {name}, known windows are {list(_WINDOWS)}")
+    window = _WINDOWS[name](length + 1)[:-1].astype(float)
+    window.setflags(write=False)
+    return window
+
+
+@lru_cache(maxsize=32)
+def _frequencies(length: int, sample_rate: float) -> np.ndarray:
+    """Frequencies of the real FFT of a trace."""
+    frequencies = np.fft.rfftfreq(length, 1 / sample_rate)
+    frequencies.setflags(write=False)
+    return frequencies
+
+
+def rfft(
+    a: np.ndarray, sample_rate: float = 1.0, window: str = "boxcar"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Real FFT of traces after applying a window.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Frequencies and the complex spectrum of each trace.
+
+    """
+    a = np.asarray(a)
+    length = a.shape[-1]
+    if window != "boxcar":
+        a = a * get_window(window, length)
+    return _frequencies(length, sample_rate), np.fft.rfft(a, axis=-1)
+
+
+def welch(
+    a: np.ndarray,
+    sample_rate: float = 1.0,
+    segment_length: int = 256,
+    overlap: Optional[int] = None,
+    window: str = "hann",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Power spectral density of traces estimated using Welch's method.
+
+    Traces are split in overlapping segments whose mean is removed before
+    applying the window and the periodograms of the segments are averaged.
+
+    Parameters
+    ----------
+    a : np.ndarray
+        Traces, along the last axis.
+    sample_rate : float
+        Sampling frequency of the traces.
+    segment_length : int
+        Number of points per segment, limited to the length of the traces.
+    overlap : Optional[int]
+        Number of points shared by consecutive segments, half a segment by
+        default.
+    window : str
+        Name of the window applied to each segment.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Frequencies and the one-sided power spectral density of each trace.
+
+    """
+    a = np.asarray(a)
+    length = min(segment_length, a.shape[-1])
+    total = None
+    count = 0
+    for segments in _iter_segments(a, length, overlap):
+        periodograms = _periodograms(segments, window, sample_rate)
+        partial = periodograms.sum(axis=-2)
+        total = partial if total is None else total + partial
+        count += segments.shape[-2]
+    return _frequencies(length, sample_rate), total / count
+
+
+def spectrogram(
+    a: np.ndarray,
+    sample_rate: float = 1.0,
+    segment_length: int = 256,
+    overlap: Optional[int] = None,
+    window: str = "hann",
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Power spectral density of successive segments of traces.
+
+    Parameters are the ones of welch.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        Frequencies, times of the center of the segments and the spectrogram
+        of each trace (frequencies along the second to last axis and times
+        along the last).
+
+    """
+    a = np.asarray(a)
+    length = min(segment_length, a.shape[-1])
+    step = length - _overlap(length, overlap)
+    blocks = [
+        _periodograms(segments, window, sample_rate)
+        for segments in _iter_segments(a, length, overlap)
+    ]
+    power = np.concatenate(blocks, axis=-2)
+    times = (np.arange(power.shape[-2]) * step + length / 2) / sample_rate
+    return _frequencies(length, sample_rate), times, np.swapaxes(power, -1, -2)
+
+
+def _overlap(length: int, overlap: Optional[int]) -> int:
+    """Validated number of points shared by consecutive segments."""
+    if overlap is None:
+        return length // 2
+    if not 0 <= overlap < length:
+        raise ValueError(
+            f"The overlap ({overlap}) must be positive and smaller than the "
+            f"segment length ({length})."
+        )
+    return overlap
+
+
+def _iter_segments(a: np.ndarray, length: int, overlap: Optional[int]):
+    """Views of the successive segments of traces, by blocks of segments.
+
+    Each view has the segments along the second to last axis.
+
+    """
+    step = length - _overlap(length, overlap)
+    segments = np.lib.stride_tricks.sliding_window_view(a, length, axis=-1)
+    segments = segments[..., ::step, :]
+    per_block = max(1, _BLOCK_SIZE // max(length * int(np.prod(a.shape[:-1])), 1))
+    for start in range(0, segments.shape[-2], per_block):
+        yield segments[..., start : start + per_block, :]
+
+
+def _periodograms(segments: np.ndarray, window: str, sample_rate: float) -> np.ndarray:
+    """One-sided power spectral density of segments, with the mean removed."""
+    length = segments.shape[-1]
+    w = get_window(window, length)
+    windowed = (segments - segments.mean(axis=-1, keepdims=True)) * w
+    spectrum = np.fft.rfft(windowed, axis=-1)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    power *= 1 / (sample_rate * np.dot(w, w))
+    # Account for the negative frequencies, except at 0 and Nyquist.
+    if length % 2:
+        power[..., 1:] *= 2
+    else:
+        power[..., 1:-1] *= 2
+    return power
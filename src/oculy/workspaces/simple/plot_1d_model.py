@@ -8,24 +8,27 @@
 """Model driving the 1D plot panel.
 
 """
-from atom.api import Bool, ForwardTyped, Int, List, Str, Typed, Value
+from typing import Dict
+
+import numpy as np
+from atom.api import Bool, Int, List, Str, Typed
 from gild.utils.atom_util import HasPrefAtom
 
 from oculy.data.datastore import DataStore
 from oculy.plotting.plots import Figure, Plot1DData, Plot1DLine
 
 from .mask_parameters import MaskParameter
+from .plot_model import PipelinePlotModel
 
 
-def _workspace():
-    from .workspace import SimpleViewerWorkspace
+# FIXME add proper metadata to datastore (need to formalize the format)
+class Plot1DModel(PipelinePlotModel):
+    """Model for a 1D plot handling data querying, processing and display.
 
-    return SimpleViewerWorkspace
+    The inputs of the pipeline are named "x" and "y_0", "y_1", ... after the
+    selected axes.
 
-
-# FIXME add proper metadata to datastore (need to formalize the format)
-class Plot1DModel(HasPrefAtom):
-    """Model for a 1D plot handling data querying, processing and display."""
+    """
 
     #: Selected entry of the data to use as x axis for each plot.
     selected_x_axis = Str()
@@ -33,12 +36,12 @@ class Plot1DModel(HasPrefAtom):
     #: Entries to use on y axis of each plot.
     selected_y_axes = List(str)
 
-    #: Filtering specifications per graph.
-    filters = List(MaskParameter)
+    #: Maximal number of points to plot per curve, larger data being
+    #: decimated after being processed. 0 disables decimation.
+    max_points = Int(4000)
 
-    #:
-    # Allow one pipeline per graph (use a notebook on the UI side)
-    pipeline = Value()  # FIXME need a dedicated container
+    #: Id of the decimation node used to reduce the number of points.
+    decimation = Str("minmax(x, y)")
 
     #: Is auto refresh currently enabled. This attribute reflects the user
     # selection but not necessarily the presence of event handler that can
@@ -60,27 +63,24 @@ class Plot1DModel(HasPrefAtom):
             return
         data = self._workspace._loader.load_data(
             [self.selected_x_axis] + self.selected_y_axes,
-            {m.content_id: (m.mask_id, (m.value,)) for m in self.filters},
+            self._mask_specifications(),
+            compact=True,
         )
 
-        # FIXME handle pipeline
+        values = {"x": data[self.selected_x_axis].values}
+        for i, y_name in enumerate(self.selected_y_axes):
+            values[f"y_{i}"] = data[y_name].values
+        values = self._decimate(self._process(values))
+
         axes = self._figure.axes_set["default"]
         # Update the X axis data
-        update = {
-            f"sviewer/plot_1d_{self._index}/x": (
-                data[self.selected_x_axis].values,
-                None,
-            )
-        }
+        update = {f"sviewer/plot_1d_{self._index}/x": (values["x"], None)}
         # Update the Y axes data
         update.update(
             {
                 # FIXME set metadata to indicate data origin
-                f"sviewer/plot_1d_{self._index}/y_{i}": (
-                    data[y_name].values,
-                    None,
-                )
-                for i, y_name in enumerate(self.selected_y_axes)
+                f"sviewer/plot_1d_{self._index}/y_{i}": (values[f"y_{i}"], None)
+                for i in range(len(self.selected_y_axes))
             }
         )
         # Delete data for axes that do not exist anymore
@@ -117,9 +117,6 @@ class Plot1DModel(HasPrefAtom):
 
     # --- Private API
 
-    #: Reference to the workspace holding the loader
-    _workspace = ForwardTyped(_workspace)
-
     #: Reference to the application global datastore
     _datastore = Typed(DataStore)
 
@@ -133,6 +130,27 @@ class Plot1DModel(HasPrefAtom):
     #: Is auto refresh currently enabled at this instant.
     _auto_refresh = Bool()
 
+    def _decimate(self, values: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Reduce the number of points of large curves.
+
+        As the curves share the x axis, the union of the points kept for each
+        curve is plotted.
+
+        """
+        x = values["x"]
+        if not self.max_points or x.ndim != 1 or len(x) <= self.max_points:
+            return values
+        tp = self._workspace.workbench.get_plugin("oculy.transformers")
+        decimate = tp.get_node(self.decimation).func
+        names = ["x"] + [f"y_{i}" for i in range(len(self.selected_y_axes))]
+        budget = max(self.max_points // max(len(names) - 1, 1), 3)
+        index = np.unique(
+            np.concatenate([decimate(x, values[k], budget) for k in names[1:]])
+        )
+        decimated = dict(values)
+        decimated.update({k: values[k][index] for k in names})
+        return decimated
+
     # --- Event handling
 
     def _post_setattr_auto_refresh(self, old, new) -> None:
@@ -163,20 +181,14 @@ class Plot1DModel(HasPrefAtom):
             # FIXME handle pipeline
 
     def _handle_selected_x_axis_change(self, change):
-        """Refresh the plot to use the new x axis."""
-        if not change["value"]:
-            return
-        # Get and filter the data as requested
-        data = self._workspace._loader.load_data(
-            [change["value"]],
-            {m.mask_id: (m.content_id, m.value) for m in self.filters},
-        )
-        # Extract the inner numpy array
-        new_x = data[change["value"]].values
+        """Refresh the plot to use the new x axis.
 
-        # FIXME handle pipeline
+        The y data are processed again as the pipeline may combine them with
+        the x axis and the decimation depends on both.
 
-        self._datastore.store_data({f"sviewer/plot_1d_{self._index}/x": (new_x, None)})
+        """
+        if change["value"]:
+            self.refresh_plot()
 
     def _handle_selected_y_axes_change(self, change):
         """Replot data when the selected y axes change."""
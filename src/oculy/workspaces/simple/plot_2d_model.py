@@ -8,28 +8,26 @@
 """Model driving the 2D plot panel.
 
 """
-from atom.api import Bool, ForwardTyped, List, Str, Typed, Value
-<<<<<<< HEAD
-from glaze.utils.atom_util import HasPrefAtom
-=======
-from gild.utils.atom_util import HasPrefAtom
->>>>>>> 3424926e48aff6ac586ecc9f118c1b9e11fd9484
+from typing import Dict
+
+import numpy as np
+from atom.api import Bool, Str, Tuple, Typed
 
 from oculy.data.datastore import DataStore
 from oculy.plotting.plots import Figure, Plot2DData, Plot2DRectangularMesh
 
 from .mask_parameters import MaskParameter
+from .plot_model import PipelinePlotModel
 
 
-def _workspace():
-    from .workspace import SimpleViewerWorkspace
+# FIXME add proper metadata to datastore (need to formalize the format)
+class Plot2DPanelModel(PipelinePlotModel):
+    """Model for a 2D plot handling data querying, processing and display.
 
-    return SimpleViewerWorkspace
+    The inputs of the pipeline are named "x", "y" and "c" after the selected
+    axes.
 
-
-# FIXME add proper metadata to datastore (need to formalize the format)
-class Plot2DPanelModel(HasPrefAtom):
-    """Model for a 1D plot handling data querying, processing and display."""
+    """
 
     #: Selected entry of the data to use as x axis.
     selected_x_axis = Str()
@@ -40,12 +38,12 @@ class Plot2DPanelModel(HasPrefAtom):
     #: Selected entry of the data to use as c axis.
     selected_c_axis = Str()
 
-    #: Filtering specifications per graph.
-    filters = List(MaskParameter)
+    #: Should scattered data (c being 1D) be binned onto a regular grid of
+    #: grid_shape cells, the mean of the points of each cell being displayed.
+    regrid = Bool()
 
-    #:
-    # Allow one pipeline per graph (use a notebook on the UI side)
-    pipeline = Value()  # FIXME need a dedicated container
+    #: Number of cells along x and y used when regridding.
+    grid_shape = Tuple(int, default=(200, 200))
 
     #: Is auto refresh currently enabled. This attribute reflects the user
     # selection but not necessarily the presence of event handler that can
@@ -71,20 +69,29 @@ class Plot2DPanelModel(HasPrefAtom):
             return
         data = self._workspace._loader.load_data(
             [self.selected_x_axis, self.selected_y_axis, self.selected_c_axis],
-            {m.content_id: (m.mask_id, (m.value,)) for m in self.filters},
+            self._mask_specifications(),
+            compact=True,
         )
 
-        # FIXME handle pipeline
+        values = self._regrid(
+            self._process(
+                {
+                    "x": data[self.selected_x_axis].values,
+                    "y": data[self.selected_y_axis].values,
+                    "c": data[self.selected_c_axis].values,
+                }
+            )
+        )
         axes = self._figure.axes_set["default"]
 
         # Update the X axis data
-        update = {"sviewer/plot_2d/x": (data[self.selected_x_axis].values, None)}
+        update = {"sviewer/plot_2d/x": (values["x"], None)}
 
         # Update the Y axes data
-        update["sviewer/plot_2d/y"] = (data[self.selected_y_axis].values, None)
+        update["sviewer/plot_2d/y"] = (values["y"], None)
 
         # Update the C axes data
-        update["sviewer/plot_2d/c"] = (data[self.selected_c_axis].values, None)
+        update["sviewer/plot_2d/c"] = (values["c"], None)
 
         # Push a single update
         self._datastore.store_data(update)
@@ -111,9 +118,6 @@ class Plot2DPanelModel(HasPrefAtom):
 
     # --- Private API
 
-    #: Reference to the workspace holding the loader
-    _workspace = ForwardTyped(_workspace)
-
     #: Reference to the application global datastore
     _datastore = Typed(DataStore)
 
@@ -123,6 +127,20 @@ class Plot2DPanelModel(HasPrefAtom):
     #: Is auto refresh currently enabled at this instant.
     _auto_refresh = Bool()
 
+    def _regrid(self, values: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Bin scattered data onto a regular grid if requested."""
+        x, y, c = values["x"], values["y"], values["c"]
+        if not self.regrid or c.ndim != 1 or not (len(x) == len(y) == len(c)):
+            return values
+        tp = self._workspace.workbench.get_plugin("oculy.transformers")
+        bin_to_grid = tp.get_node("grid(x, y, c)").func
+        x_bins, y_bins = self.grid_shape
+        regridded = dict(values)
+        regridded["x"], regridded["y"], regridded["c"] = bin_to_grid(
+            x, y, c, x_bins, y_bins
+        )
+        return regridded
+
     # --- Event handling
 
     def _post_setattr_auto_refresh(self, old, new) -> None:
@@ -0,0 +1,64 @@
+# --------------------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors, see git history for more details.
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# --------------------------------------------------------------------------------------
+"""Base model for the plot panels filtering and processing their data.
+
+"""
+from typing import Dict
+
+import numpy as np
+from atom.api import ForwardTyped, List, Typed
+from gild.utils.atom_util import HasPrefAtom
+
+from oculy.transformations import MaskSpecification
+from oculy.transformations.pipeline import Pipeline, PipelineExecutor
+
+from .mask_parameters import MaskParameter
+
+
+def _workspace():
+    from .workspace import SimpleViewerWorkspace
+
+    return SimpleViewerWorkspace
+
+
+class PipelinePlotModel(HasPrefAtom):
+    """Plot model whose data are filtered and go through a pipeline before
+    being displayed.
+
+    """
+
+    #: Filtering specifications per graph.
+    filters = List(MaskParameter)
+
+    #: Pipeline processing the data before plotting. Its inputs are named after
+    #: the plotted data and its outputs with the same names replace them.
+    # Allow one pipeline per graph (use a notebook on the UI side)
+    pipeline = Typed(Pipeline, ())
+
+    # --- Private API
+
+    #: Reference to the workspace holding the loader
+    _workspace = ForwardTyped(_workspace)
+
+    #: Executor running the pipeline and caching intermediate results.
+    _executor = Typed(PipelineExecutor)
+
+    def _mask_specifications(self) -> Dict[str, MaskSpecification]:
+        """Mask specifications built from the filters."""
+        return {m.content_id: (m.mask_id, (m.value,)) for m in self.filters}
+
+    def _process(self, values: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Run the pipeline on the loaded data, if it has any step."""
+        if not self.pipeline.steps:
+            return values
+        if self._executor is None or self._executor.pipeline is not self.pipeline:
+            tp = self._workspace.workbench.get_plugin("oculy.transformers")
+            self._executor = tp.create_executor(self.pipeline)
+        processed = dict(values)
+        processed.update(self._executor.run(values))
+        return processed
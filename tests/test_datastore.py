@@ -0,0 +1,441 @@
+# -----------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Test the data store.
+
+"""
+import subprocess
+import sys
+
+import enaml
+import numpy as np
+import pytest
+
+from oculy.data import AppendableDataArray, DataArray, Dataset
+
+with enaml.imports():
+    from enaml.workbench.core.core_manifest import CoreManifest
+    from gild.plugins.errors.manifest import ErrorsManifest
+
+    from oculy.data.manifest import DataStorageManifest
+
+
+@pytest.fixture
+def datastore(workbench):
+    """Data store attached to a started data storage plugin."""
+    workbench.register(CoreManifest())
+    workbench.register(ErrorsManifest())
+    workbench.register(DataStorageManifest())
+    yield workbench.get_plugin("oculy.data").datastore
+    workbench.unregister("oculy.data")
+
+
+@pytest.fixture
+def updates(datastore):
+    """List of the update events emitted by the store."""
+    events = []
+    datastore.observe("update", lambda change: events.append(change["value"]))
+    yield events
+
+
+def test_store_identical_values_is_not_an_update(datastore, updates):
+    """Storing a byte identical array should not emit an update."""
+    datastore.store_data({"a/b": (np.arange(10), None)})
+    array = datastore.get_data(["a/b"])["a/b"]
+    assert updates[-1]["added"] == ["a", "a/b"]
+    assert array.version == 1
+
+    datastore.store_data({"a/b": (np.arange(10), None)})
+    assert updates[-1]["updated"] == []
+    assert datastore.get_data(["a/b"])["a/b"] is array
+
+    # Metadata attached to the new node are kept.
+    datastore.store_data({"a/b": (DataArray(np.arange(10), {"unit": "V"}), None)})
+    assert updates[-1]["updated"] == []
+    assert updates[-1]["metadata_updated"] == ["a/b"]
+    assert datastore.get_data(["a/b"])["a/b"] is array
+    assert array.metadata == {"unit": "V"}
+    assert datastore.find(unit="V") == {"a/b"}
+    datastore.store_data({"a/b": (DataArray(np.arange(10), {"unit": "V"}), None)})
+    assert updates[-1]["metadata_updated"] == []
+
+    datastore.store_data({"a/b": (np.arange(1, 11), None)})
+    assert updates[-1]["updated"] == ["a/b"]
+    assert datastore.get_data(["a/b"])["a/b"].version == 2
+
+
+def test_content_hash_depends_on_dtype_and_shape(datastore):
+    """Arrays sharing the same buffer but not the same layout differ."""
+    datastore.store_data(
+        {
+            "a": (np.zeros(8, dtype=np.int64), None),
+            "b": (np.zeros(8, dtype=np.int64).reshape((2, 4)), None),
+            "c": (np.zeros(8, dtype=np.float64), None),
+        }
+    )
+    data = datastore.get_data(["a", "b", "c"])
+    hashes = {data[k].content_hash() for k in "abc"}
+    assert len(hashes) == 3
+
+
+def test_walk(datastore):
+    """Walk the store breadth first and prune part of it."""
+    datastore.store_data(
+        {
+            p: (np.zeros(1), None)
+            for p in ("a", "b/c", "b/d/e", "f/g", "f/h/i", "f/h/j/k")
+        }
+    )
+    visited = []
+    for root, datasets, arrays in datastore.walk():
+        visited.append(sorted(n for n, _ in datasets + arrays))
+        datasets[:] = [(n, d) for n, d in datasets if n != "h"]
+
+    assert visited == [["a", "b", "f"], ["c", "d"], ["g", "h"], ["e"]]
+
+
+def test_nodes_are_compact():
+    """Nodes do not carry a per instance dict and create metadata lazily."""
+    array = DataArray(values=np.zeros(2))
+    dataset = Dataset()
+    for node in (array, dataset):
+        assert not hasattr(node, "__dict__")
+        assert node._metadata is None
+        node.metadata["unit"] = "V"
+        assert node.metadata == {"unit": "V"}
+
+    assert not array.values.flags.writeable
+    with pytest.raises(TypeError):
+        array.values = [1, 2]
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        [1.0, 2.0, 3.0],
+        (1.0, 2.0, 3.0),
+        memoryview(np.array([1.0, 2.0, 3.0])),
+        bytearray(np.array([1.0, 2.0, 3.0]).tobytes()),
+    ],
+)
+def test_builtin_converters(datastore, value):
+    """Convert standard Python objects."""
+    datastore.store_data({"a": (value, None)})
+    values = datastore.get_data(["a"])["a"].values
+    assert isinstance(values, np.ndarray)
+    if isinstance(value, bytearray):
+        values = values.view(np.float64)
+    np.testing.assert_array_equal(values, [1.0, 2.0, 3.0])
+
+
+def test_pandas_and_xarray_converters(datastore):
+    """Converting pandas and xarray objects does not copy the data."""
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({"x": np.arange(5.0), "y": np.arange(5.0) ** 2})
+    xarray = pytest.importorskip("xarray")
+    xr = xarray.Dataset({"x": ("index", np.arange(5.0))})
+    datastore.store_data(
+        {"frame": (df, None), "series": (df["x"], None), "xr": (xr, None)}
+    )
+    data = datastore.get_data(["frame/y", "series", "xr/x"])
+    assert np.shares_memory(data["frame/y"].values, df["y"].to_numpy())
+    assert np.shares_memory(data["series"].values, df["x"].to_numpy())
+    assert np.shares_memory(data["xr/x"].values, xr["x"].values)
+    # The source object is left writeable
+    assert xr["x"].values.flags.writeable
+
+
+def test_converter_dispatch_follows_mro(datastore):
+    """Subclasses of a registered type use the converter of their parent."""
+
+    class MyList(list):
+        pass
+
+    datastore.store_data({"a": (MyList([1, 2]), None)})
+    plugin = datastore._plugin
+    assert plugin._dispatch_cache[MyList].id == "sequence"
+
+    with pytest.raises(TypeError):
+        datastore.store_data({"b": (object(), None)})
+
+
+def test_store_record_array(datastore):
+    """Fields of a record array are stored as views on a single buffer."""
+    dtype = np.dtype(
+        [("t", "f8"), ("v", "i4", (2,)), ("pos", [("x", "f4"), ("y", "f4")])]
+    )
+    records = np.zeros(10, dtype=dtype)
+    records["t"] = np.arange(10)
+    datastore.store_data({"acq": (records, None)})
+
+    data = datastore.get_data(["acq/t", "acq/v", "acq/pos/x"])
+    for array in data.values():
+        assert np.shares_memory(array.values, records)
+    assert data["acq/v"].values.shape == (10, 2)
+    np.testing.assert_array_equal(data["acq/t"].values, np.arange(10))
+
+
+def test_append_data(datastore, updates):
+    """Append to new and existing entries."""
+    datastore.store_data({"live/x": (np.arange(3.0), None)})
+    datastore.append_data({"live/x": np.arange(3.0, 5.0), "live/y": [1.0, 2.0]})
+    assert updates[-1]["added"] == ["live/y"]
+    assert updates[-1]["updated"] == ["live/x"]
+    assert updates[-1]["appended"] == {"live/x": (3, 5, 0), "live/y": (0, 2, 0)}
+
+    x = datastore.get_data(["live/x"])["live/x"]
+    old = x.values
+    for i in range(100):
+        datastore.append_data({"live/x": [5.0 + i]})
+    np.testing.assert_array_equal(x.values, np.arange(105.0))
+    np.testing.assert_array_equal(old, np.arange(5.0))
+    assert not x.values.flags.writeable
+    assert x.version == 102
+
+
+def test_append_bounded():
+    """Only the last samples are kept and earlier views are left untouched."""
+    array = AppendableDataArray(max_length=4)
+    assert array.append(np.arange(3)) == (0, 3, 0)
+    first = array.values
+    assert array.append(np.arange(3, 6)) == (1, 4, 2)
+    np.testing.assert_array_equal(array.values, [2, 3, 4, 5])
+    for i in range(6, 20):
+        array.append([i])
+    np.testing.assert_array_equal(array.values, [16, 17, 18, 19])
+    np.testing.assert_array_equal(first, [0, 1, 2])
+    assert array.append(np.arange(10)) == (0, 4, 4)
+    np.testing.assert_array_equal(array.values, [6, 7, 8, 9])
+
+
+def test_append_promotes_dtype():
+    """Appending values of a wider dtype promotes the buffer dtype."""
+    array = AppendableDataArray(np.arange(3))
+    first = array.values
+    array.append([3.5])
+    assert array.values.dtype == np.float64
+    np.testing.assert_array_equal(array.values, [0, 1, 2, 3.5])
+    np.testing.assert_array_equal(first, [0, 1, 2])
+    array.append(np.array([4], dtype=np.int8))
+    assert array.values.dtype == np.float64
+    np.testing.assert_array_equal(array.values, [0, 1, 2, 3.5, 4])
+
+
+def test_snapshot_round_trip(datastore, updates, tmp_path):
+    """Save the store content and restore it lazily."""
+    records = np.zeros(4, dtype=[("a", "f8"), ("b", "i2")])
+    records["b"] = [1, 2, 3, 4]
+    datastore.store_data(
+        {
+            "s/x": (np.arange(10.0), {"unit": "V", "gain": np.float64(2)}),
+            "s/empty": (np.zeros((0, 3)), None),
+            "rec": (records, None),
+            "img": (np.arange(12).reshape((3, 4)).T, None),
+        }
+    )
+    datastore.store_data({"s": (None, {"source": "file.csv"})})
+    datastore.save_snapshot(tmp_path / "snap.oculy")
+
+    datastore.store_data({"other": (np.zeros(1), None)})
+    datastore.restore_snapshot(tmp_path / "snap.oculy")
+    assert "other" in updates[-1]["removed"]
+    assert "s/x" in updates[-1]["added"]
+
+    data = datastore.get_data(["s", "s/x", "s/empty", "rec/b", "img"])
+    assert data["s"].metadata == {"source": "file.csv"}
+    assert data["s/x"].metadata == {"unit": "V", "gain": 2.0}
+    assert not data["s/x"].is_loaded
+    np.testing.assert_array_equal(data["s/x"].values, np.arange(10.0))
+    assert data["s/x"].is_loaded
+    assert not data["s/x"].values.flags.writeable
+    assert data["s/empty"].values.shape == (0, 3)
+    np.testing.assert_array_equal(data["rec/b"].values, [1, 2, 3, 4])
+    np.testing.assert_array_equal(data["img"].values, np.arange(12).reshape((3, 4)).T)
+
+
+def test_snapshot_overwrite_restored_file(datastore, tmp_path):
+    """Save the store over the snapshot its lazy arrays were restored from."""
+    path = tmp_path / "snap.oculy"
+    datastore.store_data({"x": (np.arange(1000.0), None)})
+    datastore.save_snapshot(path)
+    datastore.restore_snapshot(path)
+    datastore.store_data({"y": (np.ones(3), None)})
+    datastore.save_snapshot(path)
+    assert [p.name for p in tmp_path.iterdir()] == ["snap.oculy"]
+
+    datastore.restore_snapshot(path)
+    data = datastore.get_data(["x", "y"])
+    np.testing.assert_array_equal(data["x"].values, np.arange(1000.0))
+    np.testing.assert_array_equal(data["y"].values, np.ones(3))
+
+
+def test_shared_memory_export(datastore):
+    """Export entries, read them from another process and push updates back."""
+    from oculy.data.shared import SharedMemoryExporter, SharedStoreClient
+
+    datastore.store_data({"a/x": (np.arange(5.0), None)})
+    exporter = SharedMemoryExporter(datastore)
+    try:
+        exporter.export(["a/x"])
+        script = (
+            "import numpy as np\n"
+            "from oculy.data.shared import SharedStoreClient\n"
+            f"client = SharedStoreClient({exporter.registry_name!r})\n"
+            "x = client.read('a/x')\n"
+            "client.store_data({'a/x': (x * 2, None)})\n"
+            "client.close()\n"
+        )
+        subprocess.run([sys.executable, "-c", script], check=True)
+        exporter.poll()
+        values = datastore.get_data(["a/x"])["a/x"].values
+        np.testing.assert_array_equal(values, np.arange(5.0) * 2)
+
+        # Updates of the store are visible without re-attaching, changes in
+        # shape lead to a new block.
+        client = SharedStoreClient(exporter.registry_name)
+        view = client.attach("a/x")
+        datastore.store_data({"a/x": (np.arange(5.0) + 1, None)})
+        np.testing.assert_array_equal(view, np.arange(5.0) + 1)
+        datastore.store_data({"a/x": (np.arange(3.0), None)})
+        client.refresh()
+        np.testing.assert_array_equal(client.read("a/x"), np.arange(3.0))
+        del view
+        client.close()
+    finally:
+        exporter.close()
+
+
+def test_shared_memory_view_outlives_block(datastore):
+    """Views returned by attach stay valid after the block is replaced."""
+    from oculy.data.shared import SharedMemoryExporter, SharedStoreClient
+
+    datastore.store_data({"a/x": (np.arange(5.0), None)})
+    exporter = SharedMemoryExporter(datastore)
+    client = SharedStoreClient(exporter.registry_name)
+    try:
+        exporter.export(["a/x"])
+        client.refresh()
+        view = client.attach("a/x")[1:]
+        datastore.store_data({"a/x": (np.arange(3.0), None)})
+        client.refresh()
+        np.testing.assert_array_equal(client.read("a/x"), np.arange(3.0))
+        # The old block was released by the exporter and detached by the client
+        assert view.sum() == 10.0
+        client.close()
+        assert view.sum() == 10.0
+    finally:
+        client.close()
+        exporter.close()
+
+
+def test_shared_memory_export_follows_store(datastore, tmp_path, monkeypatch):
+    """Exports follow removals of parents, restorations and type changes."""
+    from oculy.data import shared
+    from oculy.data.shared import SharedMemoryExporter, SharedStoreClient
+
+    datastore.store_data({"a/x": (np.arange(5), None), "b": (np.arange(3), None)})
+    datastore.save_snapshot(tmp_path / "snap.oculy")
+    exporter = SharedMemoryExporter(datastore)
+    client = SharedStoreClient(exporter.registry_name)
+    try:
+        exporter.export(["a/x", "b"])
+
+        # Restoring keeps the entries present in the snapshot exported.
+        datastore.store_data({"a/x": (np.arange(5) * 10, None)})
+        datastore.restore_snapshot(tmp_path / "snap.oculy")
+        client.refresh()
+        assert sorted(client.paths()) == ["a/x", "b"]
+        np.testing.assert_array_equal(client.read("a/x"), np.arange(5))
+
+        # Removing a parent stops the export of its children.
+        datastore.store_data({"a": (None, None)})
+        datastore.store_data({"a/x": (np.arange(5) * 10, None)})
+        client.refresh()
+        assert client.paths() == ["b"]
+
+        # An entry replaced by a dataset is no longer exported.
+        datastore.store_data({"b": (None, None), "b/c": (np.zeros(2), None)})
+        client.refresh()
+        assert client.paths() == []
+
+        # Reading a block whose writer died mid-write eventually fails.
+        exporter.export(["a/x"])
+        client.refresh()
+        counter, _ = client._get_view("a/x")
+        counter[0] += 1
+        monkeypatch.setattr(shared, "READ_TIMEOUT", 0.01)
+        with pytest.raises(TimeoutError):
+            client.read("a/x")
+    finally:
+        client.close()
+        exporter.close()
+
+
+def test_find(datastore):
+    """Find entries based on their metadata as the store is modified."""
+    pd = pytest.importorskip("pandas")
+    datastore.store_data(
+        {
+            "a/x": (np.zeros(1), {"unit": "V", "source": "f1", "gain": 0}),
+            "a/y": (np.zeros(1), {"unit": "A", "source": "f1", "axes": [0, 1]}),
+            "b/x": (np.zeros(1), {"unit": "V", "source": "f2", "opts": {"a": 1}}),
+        }
+    )
+    datastore.store_data({"b": (None, {"source": "f2"})})
+    assert datastore.find(unit="V") == {"a/x", "b/x"}
+    assert datastore.find(unit="V", source="f1") == {"a/x"}
+    assert datastore.find(gain=0) == {"a/x"}
+    assert datastore.find(axes=[0, 1]) == {"a/y"}
+    assert datastore.find(opts={"a": 1}) == set()
+    assert datastore.find(unit="Ohm") == set()
+
+    datastore.store_data({"a/x": (None, {"unit": None}), "b/x": (None, {"unit": "A"})})
+    assert datastore.find(unit="V") == set()
+    assert datastore.find(unit="A") == {"a/y", "b/x"}
+
+    series = pd.Series(np.zeros(2))
+    series.attrs["unit"] = "A"
+    datastore.store_data({"a/y": (series, None), "b": (None, None)})
+    assert "b" not in datastore._data
+    assert datastore.find(unit="A") == {"a/y"}
+    assert datastore.find(source="f1") == {"a/x"}
+
+
+def test_memory_accounting_and_eviction(datastore, tmp_path):
+    """Track the memory per subtree and evict entries that can be reloaded."""
+    records = np.zeros(10, dtype=[("a", "f8"), ("b", "f8")])
+    datastore.store_data({"s/x": (np.zeros(100), None), "s/y": (np.zeros(50), None)})
+    datastore.store_data({"r": (records, None)})
+    assert datastore.memory_usage("s") == 1200
+    assert datastore.memory_usage("s/y") == 400
+    # Fields share the buffer of the record array which is counted once
+    assert datastore.memory_usage("r") == 160
+    assert datastore.memory_usage() == 1360
+
+    datastore.store_data({"s/x": (None, None)})
+    assert datastore.memory_usage("s") == 400
+    assert datastore.memory_usage() == 560
+
+    datastore.save_snapshot(tmp_path / "snap.oculy")
+    datastore.restore_snapshot(tmp_path / "snap.oculy")
+    assert datastore.memory_usage() == 0
+    data = datastore.get_data(["s/y", "r/a", "r/b"])
+    data["s/y"].values
+    data["r/a"].values
+    assert datastore.memory_usage() == 480
+
+    datastore.memory_budget = 500
+    data["r/b"].values
+    # The least recently used entry was evicted
+    assert not data["s/y"].is_loaded
+    assert datastore.memory_usage() == 160
+    np.testing.assert_array_equal(data["s/y"].values, np.zeros(50))
+    assert not data["r/a"].is_loaded and data["r/b"].is_loaded
+    assert datastore.memory_usage() == 480
+
+    assert sorted(datastore.evict()) == ["r/b", "s/y"]
+    assert datastore.memory_usage() == 0
@@ -0,0 +1,84 @@
+# -----------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Test the IO plugin and loaders.
+
+"""
+import enaml
+import numpy as np
+import pytest
+
+from oculy.transformations import MaskLeaf
+
+with enaml.imports():
+    from enaml.workbench.core.core_manifest import CoreManifest
+    from gild.plugins.errors.manifest import ErrorsManifest
+
+    from oculy.io.manifest import IOManifest
+    from oculy.transformations.manifest import DataTransformerManifest
+
+
+@pytest.fixture
+def io_plugin(workbench):
+    """IO plugin registered on a workbench with the transformation plugin."""
+    workbench.register(CoreManifest())
+    workbench.register(ErrorsManifest())
+    workbench.register(DataTransformerManifest())
+    workbench.register(IOManifest())
+    yield workbench.get_plugin("oculy.io")
+    for plugin_id in (
+        "oculy.io",
+        "oculy.transformers",
+        "gild.errors",
+        "enaml.workbench.core",
+    ):
+        workbench.unregister(plugin_id)
+
+
+def test_csv_loader_masking(io_plugin, tmp_path):
+    """Mask data either keeping the shape or dropping masked out rows."""
+    path = tmp_path / "data.csv"
+    with open(path, "w") as f:
+        f.write("# Comment\nx,n\n")
+        f.writelines(f"{i * 0.5},{i}\n" for i in range(10))
+    loader = io_plugin.create_loader("csv", str(path))
+    loader.delimiter = ","
+
+    data = loader.load_data(["n"], {"x": (">=", (3,))})
+    assert data["n"].shape == (10,)
+    assert np.isnan(data["n"].values[:6]).all()
+
+    data = loader.load_data(["n"], {"x": (">=", (3,))}, compact=True)
+    np.testing.assert_array_equal(data["n"].values, [6, 7, 8, 9])
+    assert data["n"].dtype == np.int64
+
+    data = loader.load_data(
+        ["x", "n"], MaskLeaf("n", "<", (2,)) | MaskLeaf("n", ">", (8,)), compact=True
+    )
+    np.testing.assert_array_equal(data["n"].values, [0, 1, 9])
+    np.testing.assert_array_equal(data["x"].values, [0, 0.5, 4.5])
+
+
+def test_csv_loader_chunks(io_plugin, tmp_path):
+    """Read a file by chunks of rows, masking each of them."""
+    path = tmp_path / "data.csv"
+    with open(path, "w") as f:
+        f.write("x,n\n")
+        f.writelines(f"{i * 0.5},{i}\n" for i in range(10))
+    loader = io_plugin.create_loader("csv", str(path))
+    loader.delimiter = ","
+
+    chunks = list(loader.iter_chunks(["n"], {"x": (">=", (1,))}, chunk_size=4))
+    assert [len(c["n"]) for c in chunks] == [2, 4, 2]
+    np.testing.assert_array_equal(
+        np.concatenate([c["n"].values for c in chunks]), np.arange(2, 10)
+    )
+
+    # Once the data are cached they are sliced
+    loader.load_data(["n"], {})
+    chunks = list(loader.iter_chunks(["n"], {}, chunk_size=4))
+    assert [len(c["n"]) for c in chunks] == [4, 4, 2]
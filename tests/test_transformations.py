@@ -0,0 +1,602 @@
+# -----------------------------------------------------------------------------
+# Copyright 2022 by Oculy Authors
+#
+# Distributed under the terms of the BSD license.
+#
+# The full license is in the file LICENCE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Test the data transformation plugin.
+
+"""
+import operator
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from types import SimpleNamespace
+
+import enaml
+import numpy as np
+import pytest
+import xarray
+
+from oculy.data import DataArray, DataStore
+from oculy.transformations import And, MaskLeaf, Or, mask_columns, rolling
+from oculy.transformations.export import _expression_imports
+from oculy.transformations.node import Node, NodeKind, T, classify_node
+from oculy.transformations.pipeline import _CONSUMED, Pipeline, PipelineExecutor
+from oculy.transformations.sorted_index import SortedIndex
+
+with enaml.imports():
+    from enaml.workbench.core.core_manifest import CoreManifest
+    from gild.plugins.errors.manifest import ErrorsManifest
+
+    from oculy.transformations.manifest import DataTransformerManifest
+
+
+@pytest.fixture
+def transformer(workbench):
+    """Transformation plugin registered on a workbench."""
+    workbench.register(CoreManifest())
+    workbench.register(ErrorsManifest())
+    workbench.register(DataTransformerManifest())
+    yield workbench.get_plugin("oculy.transformers")
+    workbench.unregister("oculy.transformers")
+    workbench.unregister("gild.errors")
+    workbench.unregister("enaml.workbench.core")
+
+
+def test_create_mask(transformer):
+    """Combine several masks evaluated chunk by chunk."""
+    transformer.mask_chunk_size = 7
+    x = np.arange(100.0)
+    y = np.sin(x)
+    specs = {"x": (">=", (10,)), "y": ("<", (0.5,)), "z": ("~", (3.0, 0.5))}
+    mask = transformer.create_mask({"x": x, "y": y, "z": x % 7}, specs)
+    np.testing.assert_array_equal(mask, (x >= 10) & (y < 0.5) & (abs(x % 7 - 3) < 0.5))
+
+    mask = transformer.create_mask(
+        {"x": xarray.DataArray(x.reshape((10, 10)), dims=("a", "b"))},
+        {"x": ("<", (42,))},
+    )
+    assert isinstance(mask, xarray.DataArray)
+    assert mask.dims == ("a", "b")
+    np.testing.assert_array_equal(mask.values.ravel(), x < 42)
+
+    assert transformer.create_mask({"x": x}, {}) is None
+    with pytest.raises(ValueError):
+        transformer.create_mask({"x": x, "y": y[:10]}, specs)
+
+
+def test_mask_expression(transformer):
+    """Evaluate AND/OR/NOT trees, several masks applying to the same array."""
+    transformer.mask_chunk_size = 16
+    x = np.arange(100.0)
+    y = x % 3
+    expression = (
+        (MaskLeaf("x", ">=", (20,)) & MaskLeaf("x", "<", (50,)))
+        | ~MaskLeaf("y", "==", (0,))
+    ) & MaskLeaf("x", "<", (90,))
+    assert expression.columns() == ["x", "y"]
+    assert mask_columns(expression) == ["x", "y"]
+    assert mask_columns({"y": ("==", (0,))}) == ["y"]
+    mask = transformer.create_mask({"x": x, "y": y}, expression)
+    np.testing.assert_array_equal(mask, (((x >= 20) & (x < 50)) | ~(y == 0)) & (x < 90))
+
+    # Short-circuited branches still produce the right result
+    mask = transformer.create_mask(
+        {"x": x}, And(MaskLeaf("x", ">", (200,)), MaskLeaf("x", ">", (0,)))
+    )
+    assert not mask.any()
+    mask = transformer.create_mask(
+        {"x": x}, Or(MaskLeaf("x", ">=", (0,)), MaskLeaf("x", ">", (200,)))
+    )
+    assert mask.all()
+
+
+def test_sorted_index():
+    """Select intervals by binary search, ignoring NaN."""
+    column = np.array([3.0, np.nan, 1.0, 2.0, 5.0, 2.0])
+    index = SortedIndex(column)
+    np.testing.assert_array_equal(
+        index.mask(column, 2, np.inf, True, True), column >= 2
+    )
+    np.testing.assert_array_equal(
+        index.mask(column, -np.inf, 2, True, False), column < 2
+    )
+    np.testing.assert_array_equal(index.mask(column, 2, 2, True, True), column == 2)
+    assert not index.mask(column, 4, 3, True, True).any()
+
+    column = np.arange(10)
+    index = SortedIndex(column)
+    assert index.order is None
+    assert index.select(column, 2, 5, False, True) == (3, 6)
+
+
+def test_create_mask_uses_sorted_index(transformer):
+    """Repeated range masks on a column are answered using its sorted index."""
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=1000)
+    x[::7] = np.nan
+    y = np.arange(1000)
+    for i, value in enumerate((-1, 0, 0.5)):
+        expression = (
+            MaskLeaf("x", ">", (value,))
+            & ~MaskLeaf("x", "~", (1.0, 0.1))
+            & MaskLeaf("y", "<=", (800,))
+        )
+        mask = transformer.create_mask({"x": x, "y": y}, expression)
+        np.testing.assert_array_equal(
+            mask, (x > value) & ~(np.abs(x - 1.0) < 0.1) & (y <= 800)
+        )
+        if i:
+            assert transformer._sorted_indexes.get(x).order is not None
+
+
+def test_create_mask_unhashable_arguments(transformer):
+    """Masks whose arguments are arrays or lists can be computed, uncached."""
+    x = np.linspace(0, 2, 101)
+    for _ in range(3):
+        expression = MaskLeaf("x", ">", ([0.5],)) & ~MaskLeaf(
+            "x", "~", (np.array(1.0), 0.105)
+        )
+        mask = transformer.create_mask({"x": x}, expression)
+        np.testing.assert_array_equal(mask, (x > 0.5) & ~(np.abs(x - 1.0) < 0.105))
+    mask = transformer.create_mask({"x": x}, {"x": (">", (np.array([0.5]),))})
+    np.testing.assert_array_equal(mask, x > 0.5)
+
+
+def test_create_mask_simequal_boundaries(transformer):
+    """The sorted index gives the same result as a scan at the bounds of ~."""
+    value, tolerance = 4.409953107360257, 0.6131035871577232
+    # Bounds of the interval and the values a few ulps around them.
+    x = np.array([value - tolerance, value + tolerance])
+    for _ in range(2):
+        x = np.concatenate([x, np.nextafter(x, -np.inf), np.nextafter(x, np.inf)])
+    expected = np.abs(x - value) < tolerance
+    transformer.mask_cache_size = 0
+    for _ in range(3):
+        mask = transformer.create_mask({"x": x}, {"x": ("~", (value, tolerance))})
+        np.testing.assert_array_equal(mask, expected)
+    assert transformer._sorted_indexes.get(x) is not None
+
+
+def test_create_mask_cache(transformer):
+    """Masks are reused while the specification and arrays are unchanged."""
+    x = np.arange(10.0)
+    mask = transformer.create_mask({"x": x}, {"x": (">", (5,))})
+    assert transformer.create_mask({"x": x}, {"x": (">", (5,))}) is mask
+    assert not mask.flags.writeable
+    assert transformer.create_mask({"x": x}, {"x": (">", (6,))}) is not mask
+    assert transformer.create_mask({"x": x.copy()}, {"x": (">", (5,))}) is not mask
+
+    # Entries are dropped with the arrays they were computed from.
+    n = len(transformer._mask_cache)
+    del x
+    assert len(transformer._mask_cache) < n
+
+    transformer.mask_cache_size = 0
+    y = np.arange(10.0)
+    mask = transformer.create_mask({"y": y}, {"y": (">", (5,))})
+    assert transformer.create_mask({"y": y}, {"y": (">", (5,))}) is not mask
+
+
+def test_pipeline_order():
+    """Order steps topologically and detect invalid graphs."""
+    pipeline = Pipeline(inputs=["x"])
+    pipeline.add_step("c", "a+b", ["a", "b"])
+    pipeline.add_step("b", "|a|", ["a"])
+    pipeline.add_step("a", "|a|", ["x"])
+    assert [s.id for s in pipeline.topological_order()] == ["a", "b", "c"]
+    assert pipeline.output_steps() == {"c": "c"}
+    with pytest.raises(ValueError):
+        pipeline.add_step("a", "|a|", ["x"])
+
+    pipeline.get_step("a").inputs = ["c"]
+    with pytest.raises(ValueError):
+        pipeline.topological_order()
+    pipeline.get_step("a").inputs = ["y"]
+    with pytest.raises(ValueError):
+        pipeline.topological_order()
+
+
+def test_pipeline_executor(transformer):
+    """Only recompute the steps affected by a change."""
+    pipeline = Pipeline(inputs=["x", "bg"], outputs={"out": "abs"})
+    pipeline.add_step("sub", "a-b", ["x", "bg"])
+    pipeline.add_step("idx", "a[i]", ["sub"], index=slice(0, 5))
+    pipeline.add_step("abs", "|a|", ["idx"])
+    pipeline.add_step("unused", "a*b", ["x", "x"])
+    executor = transformer.create_executor(pipeline)
+
+    x = np.arange(10.0)
+    bg = np.full(10, 3.0)
+    out = executor.run({"x": x, "bg": bg})["out"]
+    np.testing.assert_array_equal(out, [3, 2, 1, 0, 1])
+    assert "unused" not in executor._results
+    assert executor.run({"x": x, "bg": bg})["out"] is out
+
+    sub = executor._results["sub"][2]
+    pipeline.set_parameters("idx", index=slice(5, 10))
+    np.testing.assert_array_equal(
+        executor.run({"x": x, "bg": bg})["out"], [2, 3, 4, 5, 6]
+    )
+    assert executor._results["sub"][2] is sub
+
+    bg = np.zeros(10)
+    np.testing.assert_array_equal(executor.run({"x": x, "bg": bg})["out"], x[5:])
+
+
+def test_pipeline_executor_in_place(transformer):
+    """Nodes operating in place never modify inputs or shared results."""
+    pipeline = Pipeline(inputs=["x", "bg"])
+    pipeline.add_step("abs", "|a|", ["x"])
+    pipeline.add_step("sub", "a-=b", ["abs", "bg"])
+    pipeline.add_step("direct", "a-=b", ["x", "bg"])
+    executor = transformer.create_executor(pipeline)
+
+    x = -np.arange(5.0)
+    bg = np.ones(5)
+    results = executor.run({"x": x, "bg": bg})
+    np.testing.assert_array_equal(x, -np.arange(5.0))
+    np.testing.assert_array_equal(results["sub"], np.arange(5.0) - 1)
+    np.testing.assert_array_equal(results["direct"], -np.arange(5.0) - 1)
+    # The result of abs was handed to sub without copy
+    assert results["sub"] is executor._results["sub"][2]
+    assert executor._results["abs"][2] is _CONSUMED
+
+    # Modifying the parameters of the in place step recomputes its input
+    pipeline.set_parameters("sub")
+    np.testing.assert_array_equal(
+        executor.run({"x": x, "bg": bg})["sub"], np.arange(5.0) - 1
+    )
+
+
+def test_pipeline_fusion(transformer):
+    """Evaluate chains of elementwise steps block by block."""
+    transformer.pipeline_block_size = 64
+    pipeline = Pipeline(inputs=["x", "bg", "scale"], outputs={"out": "mask"})
+    pipeline.add_step("sub", "a-b", ["x", "bg"])
+    pipeline.add_step("scaled", "a*b", ["sub", "scale"])
+    pipeline.add_step("abs", "|a|", ["scaled"])
+    pipeline.add_step("mask", ">", ["abs"], value=1.0)
+    executor = transformer.create_executor(pipeline)
+
+    x = np.linspace(-5, 5, 3000).reshape((100, 30))
+    bg = np.linspace(0, 1, 30)
+    order = pipeline.topological_order()
+    groups = executor._fuse(order, executor._count_consumers(order, ["mask"]))
+    assert [[s.id for s in g] for g in groups] == [["sub", "scaled", "abs", "mask"]]
+    out = executor.run({"x": x, "bg": bg, "scale": 2.0})["out"]
+    np.testing.assert_array_equal(out, np.abs((x - bg) * 2.0) > 1.0)
+    # Intermediate results were never materialized
+    assert all(executor._results[k][2] is _CONSUMED for k in ("sub", "scaled", "abs"))
+
+    # Once the parameters of the last step changed, the chain it uses is
+    # cached and reused when they change again.
+    inputs = {"x": x, "bg": bg, "scale": 2.0}
+    pipeline.set_parameters("mask", value=2.0)
+    out = executor.run(inputs)["out"]
+    np.testing.assert_array_equal(out, np.abs((x - bg) * 2.0) > 2.0)
+    scaled_abs = executor._results["abs"][2]
+    assert scaled_abs is not _CONSUMED
+    assert executor._results["scaled"][2] is _CONSUMED
+    pipeline.set_parameters("mask", value=3.0)
+    executor.timings.clear()
+    out = executor.run(inputs)["out"]
+    np.testing.assert_array_equal(out, np.abs((x - bg) * 2.0) > 3.0)
+    assert executor._results["abs"][2] is scaled_abs
+    assert list(executor.timings) == ["mask"]
+    pipeline.set_parameters("mask", value=1.0)
+    out = executor.run(inputs)["out"]
+
+    # Intermediate results are computed if they become outputs
+    pipeline.outputs = {"out": "mask", "abs": "abs"}
+    results = executor.run({"x": x, "bg": bg, "scale": 2.0})
+    assert results["out"] is out
+    np.testing.assert_array_equal(results["abs"], np.abs((x - bg) * 2.0))
+
+
+def test_pipeline_parallel_branches():
+    """Run independent branches on a thread pool and pure Python steps in a
+    process pool.
+
+    """
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_other_branch(a):
+        # Deadlocks (and times out) unless both branches run concurrently
+        barrier.wait()
+        return a * 2
+
+    nodes = {
+        "wait": SimpleNamespace(func=wait_other_branch, pure_python=False),
+        "add": SimpleNamespace(func=operator.add, pure_python=True),
+    }
+    for n in nodes.values():
+        n.inlineable = n.elementwise = n.operate_in_place = False
+        n.kind = NodeKind()
+
+    pipeline = Pipeline(inputs=["x", "y"], outputs={"out": "sum"})
+    pipeline.add_step("left", "wait", ["x"])
+    pipeline.add_step("right", "wait", ["y"])
+    pipeline.add_step("sum", "add", ["left", "right"])
+
+    with ThreadPoolExecutor(2) as threads, ProcessPoolExecutor(1) as processes:
+        executor = PipelineExecutor(
+            pipeline, nodes.__getitem__, thread_pool=threads, process_pool=processes
+        )
+        x, y = np.arange(5.0), np.ones(5)
+        np.testing.assert_array_equal(executor.run({"x": x, "y": y})["out"], 2 * x + 2)
+    assert set(executor.timings) == {"left", "right", "sum"}
+    assert all(t >= 0 for t in executor.timings.values())
+
+
+def test_pipeline_run_chunked(transformer):
+    """Combine reductions of elementwise steps computed block by block."""
+    pipeline = Pipeline(inputs=["x", "bg"])
+    pipeline.add_step("sub", "a-b", ["x", "bg"])
+    pipeline.add_step("abs", "|a|", ["sub"])
+    pipeline.add_step("sum", "sum(a)", ["abs"])
+    pipeline.add_step("count", "sum(a)", ["x"])
+    pipeline.add_step("mean", "mean(a)", ["abs"])
+    pipeline.add_step("min", "min(a)", ["sub"])
+    pipeline.add_step("max", "max(a)", ["sub"])
+    pipeline.add_step("hist", "histogram(a)", ["abs"], bins=4, range=(0, 2))
+    pipeline.add_step("ratio", "a/b", ["sum", "count"])
+    executor = transformer.create_executor(pipeline)
+
+    x = np.linspace(-1, 3, 1001)
+    blocks = ({"x": x[i : i + 100]} for i in range(0, len(x), 100))
+    results = executor.run_chunked(blocks, {"bg": 1.0})
+    whole = transformer.create_executor(pipeline).run({"x": x, "bg": 1.0})
+    assert set(results) == {"mean", "min", "max", "hist", "ratio"}
+    for k in ("mean", "min", "max", "ratio"):
+        assert results[k] == pytest.approx(whole[k])
+    np.testing.assert_array_equal(results["hist"][0], whole["hist"][0])
+    np.testing.assert_array_equal(results["hist"][1], whole["hist"][1])
+    assert "sub" in executor.timings
+
+    # NaN propagate whatever the block they appear in, as for the whole data
+    x = np.array([1.0, 2.0, np.nan, 0.5])
+    for order in ((0, 2), (2, 0)):
+        blocks = [{"x": x[i : i + 2]} for i in order]
+        results = executor.run_chunked(blocks, {"bg": 0.0})
+        assert np.isnan(results["min"]) and np.isnan(results["max"])
+
+    # Non reduced outputs and non elementwise steps cannot run by blocks
+    pipeline.outputs = {"abs": "abs"}
+    with pytest.raises(ValueError):
+        executor.run_chunked([{"x": x}], {"bg": 1.0})
+    pipeline.outputs = {}
+    pipeline.add_step("idx", "a[i]", ["x"], index=0)
+    with pytest.raises(ValueError):
+        executor.run_chunked([{"x": x}], {"bg": 1.0})
+
+
+def test_classify_nodes(transformer):
+    """Classify nodes based on the signature of their functions."""
+    kinds = {k: n.kind for k, n in transformer.nodes.contributions.items()}
+    assert kinds["a+b"].elementwise and not kinds["a+b"].reduction
+    assert kinds["a[i]"].index and not kinds["a[i]"].elementwise
+    assert kinds["mean(a)"].reduction and kinds["histogram(a)"].reduction
+    assert transformer.get_node(">").kind.elementwise
+
+    def scale(a: T, factor: float) -> T:
+        return a * factor
+
+    def offset(a: T, workbench, value: float = 0) -> T:
+        assert workbench is transformer.workbench
+        return a + value
+
+    assert classify_node(Node(func=scale)).elementwise
+    kind = classify_node(Node(func=offset))
+    assert kind.needs_workbench and kind.elementwise
+    assert not classify_node(Node(func=np.sort)).elementwise
+
+    pipeline = Pipeline(inputs=["x"])
+    pipeline.add_step("offset", "offset", ["x"], value=1)
+    executor = transformer.create_executor(pipeline)
+    node = Node(id="offset", func=offset)
+    executor.get_node = {"offset": node}.__getitem__
+    np.testing.assert_array_equal(executor.run({"x": np.zeros(3)})["offset"], 1)
+
+
+def test_decimation_nodes(transformer):
+    """Reduce the number of points of a curve keeping its visual aspect."""
+    x = np.linspace(0, 10, 10001)
+    y = np.sin(x) + np.where(np.arange(len(x)) == 5003, 5.0, 0.0)
+    y[10] = np.nan
+    for node_id in ("stride(x, y)", "minmax(x, y)", "lttb(x, y)"):
+        node = transformer.get_node(node_id)
+        assert not node.kind.elementwise
+        index = node.func(x, y, 100)
+        assert len(index) <= 100
+        assert index[0] == 0 and index[-1] == len(x) - 1
+        assert (np.diff(index) > 0).all()
+        np.testing.assert_array_equal(node.func(x[:50], y[:50], 100), np.arange(50))
+
+    # The extrema are never lost by minmax and spikes are kept by lttb
+    index = transformer.get_node("minmax(x, y)").func(x, y, 100)
+    assert np.nanmax(y[index]) == np.nanmax(y)
+    assert np.nanmin(y[index]) == np.nanmin(y)
+    assert 5003 in transformer.get_node("lttb(x, y)").func(x, y, 100)
+
+    # Indexes can be used to select the points in a pipeline
+    pipeline = Pipeline(inputs=["x", "y"], outputs={"x": "x_d", "y": "y_d"})
+    pipeline.add_step("index", "minmax(x, y)", ["x", "y"], max_points=10)
+    pipeline.add_step("x_d", "a[i]", ["x", "index"])
+    pipeline.add_step("y_d", "a[i]", ["y", "index"])
+    results = transformer.create_executor(pipeline).run({"x": x, "y": y})
+    assert len(results["x"]) == len(results["y"]) <= 10
+
+
+def test_regrid_node(transformer):
+    """Bin scattered points onto a grid, at once or as they arrive."""
+    node = transformer.get_node("grid(x, y, c)")
+    assert node.kind.reduction and not node.kind.elementwise
+    x = np.array([0.1, 0.1, 0.9, 0.6, np.nan, 2.0])
+    y = np.array([0.1, 0.2, 0.9, 0.1, 0.5, 0.5])
+    c = np.arange(6.0)
+    xc, yc, grid = node.func(x, y, c, 2, 2, (0, 1), (0, 1))
+    np.testing.assert_array_equal(xc, [0.25, 0.75])
+    np.testing.assert_array_equal(grid, [[0.5, np.nan], [3, 2]])
+    _, _, counts = node.func(x, y, c, 2, 2, (0, 1), (0, 1), "count")
+    np.testing.assert_array_equal(counts, [[2, 0], [1, 1]])
+
+    binner = node.accumulator(2, 2, (0, 1), (0, 1), "last")
+    binner.update(x[:3], y[:3], c[:3])
+    binner.update(x[3:], y[3:], c[3:])
+    np.testing.assert_array_equal(binner.result()[2], [[1, np.nan], [3, 2]])
+    with pytest.raises(ValueError):
+        node.accumulator(2, 2)
+
+    # The extent of the data is used by default
+    xc, yc, grid = node.func(x, y, c, 2, 1)
+    np.testing.assert_allclose(xc, [0.575, 1.525])
+    np.testing.assert_array_equal(grid, [[1.5], [5]])
+
+    # Values just below the upper bound fall in the last cell.
+    high = np.nextafter(0.1, -2.0)
+    x = np.array([high, -2.0, 0.1])
+    _, _, counts = node.func(x, x, c[:3], 2, 2, (-2.0, 0.1), (-2.0, 0.1), "count")
+    np.testing.assert_array_equal(counts, [[1, 0], [0, 2]])
+    binner = node.accumulator(2, 2, (-2.0, 0.1), (-2.0, 0.1), "count")
+    binner.update(x, x, c[:3])
+    np.testing.assert_array_equal(binner.result()[2], [[1, 0], [0, 2]])
+
+
+def test_spectral_nodes(transformer):
+    """Compute spectra of stacks of traces."""
+    rng = np.random.default_rng(0)
+    t = np.arange(20000) / 1000
+    traces = np.stack([np.sin(2 * np.pi * 50 * t), rng.normal(size=t.size)])
+
+    freqs, spectrum = transformer.get_node("rfft(a)").func(traces, 1000, "hann")
+    assert spectrum.shape == (2, len(freqs))
+    assert freqs[np.argmax(np.abs(spectrum[0]))] == pytest.approx(50)
+
+    freqs, psd = transformer.get_node("welch(a)").func(traces, 1000, 512)
+    assert psd.shape == (2, 257)
+    assert freqs[np.argmax(psd[0])] == pytest.approx(50, abs=freqs[1])
+    # The PSD integrates to the variance of the noise
+    assert psd[1].sum() * freqs[1] == pytest.approx(traces[1].var(), rel=0.05)
+
+    freqs, times, power = transformer.get_node("spectrogram(a)").func(
+        traces, 1000, 512, 256
+    )
+    assert power.shape == (2, 257, len(times))
+    np.testing.assert_allclose(times[:2], [0.256, 0.512])
+    np.testing.assert_allclose(power.mean(axis=-1), psd)
+    with pytest.raises(ValueError):
+        transformer.get_node("welch(a)").func(traces, 1000, 512, 512)
+
+
+@pytest.mark.parametrize("window", [1, 5, 200])
+def test_rolling_nodes(transformer, window):
+    """Compute rolling statistics on arrays and append-only streams."""
+    a = np.random.default_rng(0).integers(0, 50, 600).astype(float)
+    windows = [a[max(0, i - window + 1) : i + 1] for i in range(len(a))]
+    expected = {
+        "moving_mean(a)": [w.mean() for w in windows],
+        "moving_std(a)": [w.std() for w in windows],
+        "moving_median(a)": [np.median(w) for w in windows],
+    }
+    streams = {
+        "moving_mean(a)": rolling.StreamMovingMean,
+        "moving_std(a)": rolling.StreamMovingStd,
+        "moving_median(a)": rolling.StreamMovingMedian,
+    }
+    for node_id, values in expected.items():
+        node = transformer.get_node(node_id)
+        assert not node.kind.elementwise
+        np.testing.assert_allclose(node.func(a, window), values, atol=1e-9)
+        # Stacks of traces are processed along the last axis
+        stacked = node.func(np.stack([a, a[::-1]]), window)
+        np.testing.assert_allclose(stacked[0], values, atol=1e-9)
+        stream = streams[node_id](window)
+        parts = [stream.update(a[i : i + m]) for i, m in ((0, 1), (1, 0), (1, 599))]
+        np.testing.assert_allclose(np.concatenate(parts), values, atol=1e-9)
+
+    np.testing.assert_array_equal(
+        transformer.get_node("cummin(a)").func(a), np.minimum.accumulate(a)
+    )
+    stream = rolling.StreamCumulativeMax()
+    parts = [stream.update(a[:10]), stream.update(a[10:])]
+    np.testing.assert_array_equal(np.concatenate(parts), np.maximum.accumulate(a))
+
+
+def test_stream_follower():
+    """Append the statistics of entries as values are appended to them."""
+    store = DataStore()
+    store.append_data({"a/x": np.arange(3.0)})
+    follower = rolling.StreamFollower(store)
+    follower.follow("a/x", "a/mean", rolling.StreamMovingMean(2))
+    follower.follow("a/mean", "a/max", rolling.StreamCumulativeMax())
+    follower.follow("b", "b/min", rolling.StreamCumulativeMin())
+    updates = []
+    store.observe("update", lambda change: updates.append(change["value"]))
+    x = np.array([0.0, 1.0, 2.0, -5.0, 7.0, 1.0])
+    store.append_data({"a/x": x[3:5]})
+    store.append_data({"a/x": x[5:]})
+    values = store.get_data(["a/mean", "a/max"])
+    mean = np.concatenate(([x[0]], (x[1:] + x[:-1]) / 2))
+    np.testing.assert_array_equal(values["a/mean"].values, mean)
+    np.testing.assert_array_equal(values["a/max"].values, np.maximum.accumulate(mean))
+    # Each output is appended to by its own (nested) update
+    assert len(updates) == 6 and all(len(u["appended"]) == 1 for u in updates)
+
+    # Entries whose values are replaced are no longer followed
+    store.store_data({"a/x": (DataArray(np.zeros(2)), None)})
+    assert set(follower.streams) == {"a/mean", "b"}
+    follower.close()
+    store.append_data({"a/mean": [1.0]})
+    assert len(store.get_data(["a/max"])["a/max"].values) == 6
+
+
+def test_export_pipeline(transformer, tmp_path, monkeypatch):
+    """Export a pipeline as a module giving the same results."""
+    pipeline = Pipeline(inputs=["x", "bg"], outputs={"out": "in place", "m": "mask"})
+    pipeline.add_step("sub", "a-b", ["x", "bg"])
+    pipeline.add_step("abs", "|a|", ["sub"])
+    pipeline.add_step("in place", "a-=b", ["abs", "bg"])
+    pipeline.add_step("mask", ">", ["x"], value=2.5)
+    pipeline.add_step("mean", "moving_mean(a)", ["x"], window=3)
+    pipeline.add_step("idx", "a[i]", ["mean"], index=slice(1, None))
+    pipeline.outputs = {"out": "in place", "m": "mask", "idx": "idx"}
+
+    source = transformer.export_pipeline(pipeline)
+    assert "x - bg" in source and "from oculy.transformations.rolling" in source
+    # No literal nor expression requires numpy
+    assert "import numpy" not in source
+    (tmp_path / "exported.py").write_text(source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    exported = __import__("exported")
+
+    x, bg = np.arange(5.0), np.full(5, 3.0)
+    results = exported.process({"x": x, "bg": bg})
+    expected = transformer.create_executor(pipeline).run({"x": x, "bg": bg})
+    assert set(results) == set(expected) == set(exported.OUTPUTS)
+    for k in expected:
+        np.testing.assert_array_equal(results[k], expected[k])
+    np.testing.assert_array_equal(x, np.arange(5.0))
+
+    batch = exported.process_batch([{"x": x, "bg": bg}, {"x": -x, "bg": bg}], 2)
+    np.testing.assert_array_equal(batch[1]["out"], np.abs(-x - bg) - bg)
+
+    # The imports are collected from the parameters and expressions
+    pipeline.set_parameters("mask", value=np.float64(2.5))
+    assert "import numpy as np" in transformer.export_pipeline(pipeline)
+    node = SimpleNamespace(
+        id="n", expression="np.sqrt({a}) + abs({b})", func=lambda a, b: a
+    )
+    assert _expression_imports(node) == {"np": "import numpy as np"}
+    node.expression = "undefined({a})"
+    with pytest.raises(ValueError):
+        _expression_imports(node)
+
+    # Steps that cannot be written as code are reported
+    pipeline.add_step("twice", "a+b", ["x", "x"])
+    pipeline.outputs = {}
+    transformer.export_pipeline(pipeline, inline=False)
+    pipeline.set_parameters("mean", window=object())
+    with pytest.raises(ValueError):
+        transformer.export_pipeline(pipeline)